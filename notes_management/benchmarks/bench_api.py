@@ -0,0 +1,496 @@
+"""
+Load test of every route in notes_app.urls and user_app.urls. Seeds a
+reproducible dataset into a throwaway database, then drives each route with
+concurrent clients and reports requests/s, p50/p95/p99 latency and (in process)
+SQL queries per request. Results are written as JSON; pass a previous result
+file to --compare to see the change per scenario.
+
+    python -m benchmarks.bench_api --requests 200 --concurrency 8 --output run.json
+    python -m benchmarks.bench_api --mode live --compare run.json
+
+--mode inprocess calls the WSGI handler through django.test.Client from a pool
+of threads; --mode live starts a threaded HTTP server on localhost and sends
+real requests to it. Query counts are only reported in process and not for the
+async routes.
+"""
+import argparse
+import json
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from urllib.parse import quote
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import timedelta
+
+from benchmarks.common import benchmark_database, setup_django, summarize, write_results
+
+
+PASSWORD = 'bench-password'
+
+
+class Dataset:
+    """
+    What seed() created, and pools of targets for the requests that change or
+    delete something, so every request of a run finds its target in place.
+    """
+
+    def __init__(self):
+        self.users = []
+        self.tokens = {}
+        self.superuser = None
+        self.roles = []
+        self.owned_notes = []
+        self.shared_notes = []
+        self.deletable_notes = []
+        self.deletable_users = []
+        self.deletable_roles = []
+        self.refresh_tokens = {}
+
+
+def _note_versions(rng, base, depth):
+    versions = [base]
+    for version in range(depth):
+        versions.append(f'{versions[-1]} edit {version} {rng.randrange(10 ** 6)}')
+    return versions
+
+
+def seed(options):
+    from django.contrib.auth.hashers import make_password
+    from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+    from notes_app.audit import prepare_audits
+    from notes_app.models import ChangeSequence, Notes, NotesAudit, NotesUser
+    from user_app.models import Role, User
+
+    rng = random.Random(options.seed)
+    dataset = Dataset()
+    pool_size = options.requests
+
+    dataset.roles = Role.objects.bulk_create([Role(name=f'bench-role-{i}', description=f'Benchmark role {i}')
+                                              for i in range(options.roles)])
+    dataset.deletable_roles = Role.objects.bulk_create([Role(name=f'bench-delete-{i}') for i in range(pool_size)])
+
+    # Hashing is slow on purpose; every user gets the same hash
+    password = make_password(PASSWORD)
+    users = [User(username='bench-admin', email='bench-admin@mail.com', password=password, is_superuser=True)]
+    users += [User(username=f'bench-user-{i}', email=f'bench-user-{i}@mail.com', password=password,
+                   role=rng.choice(dataset.roles) if dataset.roles else None) for i in range(options.users - 1)]
+    dataset.users = User.objects.bulk_create(users)
+    dataset.superuser = dataset.users[0]
+    dataset.deletable_users = User.objects.bulk_create([
+        User(username=f'bench-leaver-{i}', email=f'bench-leaver-{i}@mail.com', password=password, is_staff=True)
+        for i in range(pool_size)])
+
+    notes, histories = [], []
+    for i in range(options.notes):
+        owner = rng.choice(dataset.users)
+        versions = _note_versions(rng, f'benchmark note {i} about project {rng.randrange(50)}', options.audit_depth)
+        notes.append(Notes(note_content=versions[-1], note_type=rng.choice(('text', 'list')), created_by=owner,
+                           modified_by=owner, audit_count=len(versions) - 1))
+        histories.append(versions)
+    notes = Notes.objects.bulk_create(ChangeSequence.stamp(notes), batch_size=1000)
+    deletable_notes = Notes.objects.bulk_create(ChangeSequence.stamp(
+        Notes(note_content=f'note to delete {i}', created_by=dataset.superuser, modified_by=dataset.superuser)
+        for i in range(pool_size)))
+
+    shares = []
+    for note in notes:
+        shares.append(NotesUser(notes=note, user=note.created_by, can_read=True, can_edit=True, can_delete=True,
+                                note_modified_at=note.modified_at))
+        dataset.owned_notes.append((note.id, note.created_by_id))
+        others = [user for user in rng.sample(dataset.users, min(options.fanout + 1, len(dataset.users)))
+                  if user.id != note.created_by_id][:options.fanout]
+        for user in others:
+            shares.append(NotesUser(notes=note, user=user, can_read=True, can_edit=rng.random() < 0.3,
+                                    note_modified_at=note.modified_at))
+            dataset.shared_notes.append((note.id, user.id))
+    shares += [NotesUser(notes=note, user=dataset.superuser, can_read=True, can_edit=True, can_delete=True,
+                         note_modified_at=note.modified_at) for note in deletable_notes]
+    NotesUser.objects.bulk_create(ChangeSequence.stamp(shares), batch_size=1000)
+    dataset.deletable_notes = [note.id for note in deletable_notes]
+
+    audits = [NotesAudit(notes=note, modified_by=note.created_by, old_note_content=old, new_note_content=new,
+                         old_note_type=note.note_type, new_note_type=note.note_type,
+                         created_at=note.created_at + timedelta(seconds=position))
+              for note, versions in zip(notes, histories)
+              for position, (old, new) in enumerate(zip(versions, versions[1:]), 1)]
+    NotesAudit.objects.bulk_create(prepare_audits(audits), batch_size=1000)
+
+    for user in dataset.users + dataset.deletable_users:
+        dataset.tokens[user.id] = f'Bearer {AccessToken.for_user(user)}'
+    dataset.refresh_tokens = {user.id: str(RefreshToken.for_user(user)) for user in dataset.users}
+    return dataset
+
+
+class Scenario:
+    """
+    One route and method. build(dataset, index) returns the keyword arguments of
+    one request: path, method, token and optionally data/content_type.
+    """
+
+    def __init__(self, route, method, build, expect=(200, )):
+        self.route = route
+        self.method = method
+        self.build = build
+        self.expect = expect
+
+    @property
+    def name(self):
+        return f'{self.route}:{self.method}'
+
+
+def _url(route, **kwargs):
+    from django.urls import reverse
+
+    return reverse(route, kwargs=kwargs or None)
+
+
+def _shared(dataset, index):
+    return dataset.shared_notes[index % len(dataset.shared_notes)] if dataset.shared_notes else dataset.owned_notes[index % len(dataset.owned_notes)]
+
+
+def _owned(dataset, index):
+    return dataset.owned_notes[index % len(dataset.owned_notes)]
+
+
+def _user(dataset, index):
+    return dataset.users[index % len(dataset.users)]
+
+
+def _read_note(route):
+    def build(dataset, index):
+        note_id, user_id = _shared(dataset, index)
+        return {'path': _url(route, note_id=note_id), 'token': dataset.tokens[user_id]}
+    return build
+
+
+def _as_user(route):
+    def build(dataset, index):
+        return {'path': _url(route), 'token': dataset.tokens[_user(dataset, index).id]}
+    return build
+
+
+def _note_diff(dataset, index):
+    request = _read_note('get_note_diff')(dataset, index)
+    return {**request, 'path': request['path'] + '?from=0'}
+
+
+def _note_as_of(dataset, index):
+    from django.utils import timezone
+
+    request = _read_note('get_note_as_of')(dataset, index)
+    return {**request, 'path': request['path'] + '?at=' + quote(timezone.now().isoformat())}
+
+
+def _update_note(dataset, index):
+    note_id, user_id = _owned(dataset, index)
+    return {'path': _url('get_notes', note_id=note_id), 'token': dataset.tokens[user_id],
+            'data': {'note_content': f'updated by the load test {index}'}}
+
+
+def _delete_note(dataset, index):
+    return {'path': _url('get_notes', note_id=dataset.deletable_notes[index]), 'token': dataset.tokens[dataset.superuser.id]}
+
+
+def _create_note(dataset, index):
+    return {'path': _url('create_notes'), 'token': dataset.tokens[_user(dataset, index).id],
+            'data': {'note_content': f'created by the load test {index}', 'note_type': 'text'}}
+
+
+def _share_note(dataset, index):
+    note_id, user_id = _owned(dataset, index)
+    # Sharing with the owner would overwrite its own permissions
+    other = next(user for offset in range(1, 3) if (user := _user(dataset, index + offset)).id != user_id)
+    return {'path': _url('share_notes'), 'token': dataset.tokens[user_id], 'content_type': 'application/json',
+            'data': json.dumps([{'notes': note_id, 'user': other.id, 'can_read': True, 'can_edit': index % 2 == 0}])}
+
+
+def _share_note_with_role(dataset, index):
+    note_id, user_id = _owned(dataset, index)
+    role = dataset.roles[index % len(dataset.roles)]
+    return {'path': _url('share_notes_with_role'), 'token': dataset.tokens[user_id], 'content_type': 'application/json',
+            'data': json.dumps([{'notes': note_id, 'role': role.id, 'can_read': True, 'can_edit': index % 2 == 0}])}
+
+
+def _import_notes(dataset, index):
+    body = ''.join(json.dumps({'note_content': f'imported {index}-{row}', 'note_type': 'text'}) + '\n' for row in range(5))
+    return {'path': _url('import_notes'), 'token': dataset.tokens[_user(dataset, index).id],
+            'content_type': 'application/x-ndjson', 'data': body}
+
+
+def _search_notes(dataset, index):
+    return {'path': _url('search_notes') + f'?q=project+{index % 50}', 'token': dataset.tokens[_user(dataset, index).id]}
+
+
+def _note_changes(dataset, index):
+    # A first sync: one full page of changes from the start of the feed
+    return {'path': _url('get_note_changes') + '?since=0&limit=100', 'token': dataset.tokens[_user(dataset, index).id]}
+
+
+def _role(dataset, index):
+    return {'path': _url('get_put_delete_role', pk=dataset.roles[index % len(dataset.roles)].id),
+            'token': dataset.tokens[dataset.superuser.id]}
+
+
+def _update_role(dataset, index):
+    return {**_role(dataset, index), 'data': {'description': f'updated by the load test {index}'}}
+
+
+def _delete_role(dataset, index):
+    return {'path': _url('get_put_delete_role', pk=dataset.deletable_roles[index].id), 'token': dataset.tokens[dataset.superuser.id]}
+
+
+def _create_role(dataset, index):
+    return {'path': _url('get_create_roles'), 'token': dataset.tokens[dataset.superuser.id], 'data': {'name': f'load-role-{index}'}}
+
+
+def _single_user(dataset, index):
+    user = _user(dataset, index)
+    return {'path': _url('get_put_delete_user', pk=user.id), 'token': dataset.tokens[user.id]}
+
+
+def _update_user(dataset, index):
+    user = _user(dataset, index)
+    return {**_single_user(dataset, index), 'data': {'email': f'bench-user-{user.id}-{index}@mail.com'}}
+
+
+def _delete_user(dataset, index):
+    user = dataset.deletable_users[index]
+    return {'path': _url('get_put_delete_user', pk=user.id), 'token': dataset.tokens[user.id]}
+
+
+def _signup(dataset, index):
+    return {'path': _url('create_user'), 'data': {'username': f'load-signup-{index}', 'email': f'load-signup-{index}@mail.com',
+                                                  'password': PASSWORD, 'role': dataset.roles[0].id if dataset.roles else ''}}
+
+
+def _login(dataset, index):
+    return {'path': _url('token_obtain_pair'), 'data': {'username': _user(dataset, index).username, 'password': PASSWORD}}
+
+
+def _refresh(dataset, index):
+    return {'path': _url('token_refresh'), 'data': {'refresh': dataset.refresh_tokens[_user(dataset, index).id]}}
+
+
+# Reads first; the deletes run last and work on their own pools of targets
+SCENARIOS = [
+    Scenario('get_all_notes', 'GET', _as_user('get_all_notes'), expect=(200, 404)),
+    Scenario('async_get_all_notes', 'GET', _as_user('async_get_all_notes'), expect=(200, 404)),
+    Scenario('get_notes_feed', 'GET', _as_user('get_notes_feed'), expect=(200, 404)),
+    Scenario('get_notes', 'GET', _read_note('get_notes')),
+    Scenario('async_get_notes', 'GET', _read_note('async_get_notes')),
+    Scenario('get_detailed_notes', 'GET', _read_note('get_detailed_notes')),
+    Scenario('async_get_detailed_notes', 'GET', _read_note('async_get_detailed_notes')),
+    Scenario('get_history', 'GET', _read_note('get_history')),
+    Scenario('get_note_diff', 'GET', _note_diff),
+    Scenario('get_note_as_of', 'GET', _note_as_of),
+    Scenario('async_get_history', 'GET', _read_note('async_get_history')),
+    Scenario('search_notes', 'GET', _search_notes, expect=(200, 404)),
+    Scenario('export_notes', 'GET', _as_user('export_notes')),
+    Scenario('get_note_changes', 'GET', _note_changes),
+    Scenario('get_create_roles', 'GET', _as_user('get_create_roles')),
+    Scenario('get_put_delete_role', 'GET', _role),
+    Scenario('get_user', 'GET', _as_user('get_user')),
+    Scenario('get_put_delete_user', 'GET', _single_user),
+    Scenario('token_obtain_pair', 'POST', _login),
+    Scenario('token_refresh', 'POST', _refresh),
+    Scenario('create_notes', 'POST', _create_note, expect=(201, )),
+    Scenario('import_notes', 'POST', _import_notes, expect=(201, )),
+    Scenario('share_notes', 'POST', _share_note),
+    Scenario('share_notes_with_role', 'POST', _share_note_with_role),
+    Scenario('get_notes', 'PUT', _update_note),
+    Scenario('get_create_roles', 'POST', _create_role, expect=(201, )),
+    Scenario('get_put_delete_role', 'PUT', _update_role),
+    Scenario('create_user', 'POST', _signup, expect=(201, )),
+    Scenario('get_put_delete_user', 'PUT', _update_user),
+    Scenario('get_notes', 'DELETE', _delete_note),
+    Scenario('get_put_delete_role', 'DELETE', _delete_role),
+    Scenario('get_put_delete_user', 'DELETE', _delete_user),
+]
+
+
+def route_methods():
+    """
+    (url name, method) of every route of both apps, from the views' handlers
+    """
+    from notes_app.urls import urlpatterns as notes_urls
+    from user_app.urls import urlpatterns as user_urls
+
+    routes = set()
+    for pattern in [*notes_urls, *user_urls]:
+        view_class = pattern.callback.view_class
+        for method in view_class.http_method_names:
+            if method not in ('head', 'options', 'trace') and hasattr(view_class, method):
+                routes.add((pattern.name, method.upper()))
+    return routes
+
+
+def check_coverage():
+    missing = route_methods() - {(scenario.route, scenario.method) for scenario in SCENARIOS}
+    if missing:
+        raise SystemExit('No load-test scenario for: ' + ', '.join(f'{route} {method}' for route, method in sorted(missing)))
+
+
+class InProcessTransport:
+    """
+    django.test.Client per thread, counting the queries of every request
+    """
+
+    def __init__(self):
+        self.local = threading.local()
+
+    def __call__(self, method, path, token=None, data=None, content_type=None):
+        from django.db import connection
+        from django.test import Client
+
+        if not hasattr(self.local, 'client'):
+            self.local.client = Client()
+        kwargs = {'HTTP_AUTHORIZATION': token} if token else {}
+        if data is not None:
+            kwargs['data'] = data
+            if content_type:
+                kwargs['content_type'] = content_type
+            elif method != 'POST':
+                kwargs['data'] = json.dumps(data)
+                kwargs['content_type'] = 'application/json'
+
+        queries = []
+        with connection.execute_wrapper(lambda execute, *args: queries.append(1) or execute(*args)):
+            response = getattr(self.local.client, method.lower())(path, **kwargs)
+            if response.streaming:
+                b''.join(response.streaming_content)
+        return response.status_code, len(queries)
+
+
+class HTTPTransport:
+    """
+    Plain HTTP requests against a running server. Query counts are not visible.
+    """
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+
+    def __call__(self, method, path, token=None, data=None, content_type=None):
+        headers = {'Authorization': token} if token else {}
+        body = None
+        if data is not None:
+            body = data if isinstance(data, str) else json.dumps(data)
+            headers['Content-Type'] = content_type or 'application/json'
+            body = body.encode()
+        request = urllib.request.Request(self.base_url + path, data=body, headers=headers, method=method)
+        try:
+            with urllib.request.urlopen(request) as response:
+                response.read()
+                return response.status, None
+        except urllib.error.HTTPError as error:
+            error.read()
+            return error.code, None
+
+
+@contextmanager
+def live_server():
+    from django.test.testcases import LiveServerThread, _StaticFilesHandler
+
+    server = LiveServerThread('localhost', _StaticFilesHandler)
+    server.daemon = True
+    server.start()
+    server.is_ready.wait()
+    if server.error:
+        raise server.error
+    try:
+        yield f'http://localhost:{server.port}'
+    finally:
+        server.terminate()
+
+
+def run_scenario(scenario, dataset, transport, options):
+    requests = [{'method': scenario.method, **scenario.build(dataset, index)} for index in range(options.requests)]
+
+    def send(request):
+        start = time.perf_counter()
+        status_code, queries = transport(**request)
+        return time.perf_counter() - start, status_code, queries
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(options.concurrency) as pool:
+        outcomes = list(pool.map(send, requests))
+    elapsed = time.perf_counter() - started
+
+    statuses = Counter(status_code for _, status_code, _ in outcomes)
+    # Async views run their queries on other threads, which the count does not see
+    query_counts = [] if scenario.route.startswith('async_') else [queries for _, _, queries in outcomes if queries is not None]
+    return {
+        'scenario': scenario.name,
+        'requests': len(outcomes),
+        'errors': sum(count for status_code, count in statuses.items() if status_code not in scenario.expect),
+        'status_codes': {str(status_code): count for status_code, count in sorted(statuses.items())},
+        'requests_per_second': len(outcomes) / elapsed,
+        'latency': summarize([latency for latency, _, _ in outcomes]),
+        'queries_per_request': sum(query_counts) / len(query_counts) if query_counts else None,
+    }
+
+
+def print_results(results, previous=None):
+    previous = {result['scenario']: result for result in (previous or {}).get('results', [])}
+    for result in results:
+        queries = result['queries_per_request']
+        line = (f"{result['scenario']:>34}: {result['requests_per_second']:8.1f} req/s  "
+                f"p50 {result['latency']['p50_ms']:8.2f}  p95 {result['latency']['p95_ms']:8.2f}  "
+                f"p99 {result['latency']['p99_ms']:8.2f} ms  "
+                f"{'' if queries is None else f'{queries:5.1f} q/req'}"
+                f"{'' if not result['errors'] else '  errors ' + str(result['status_codes'])}")
+        before = previous.get(result['scenario'])
+        if before:
+            line += (f"  [p50 {result['latency']['p50_ms'] / before['latency']['p50_ms'] - 1:+.0%}, "
+                     f"req/s {result['requests_per_second'] / before['requests_per_second'] - 1:+.0%}]")
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mode', choices=('inprocess', 'live'), default='inprocess')
+    parser.add_argument('--requests', type=int, default=100, help="Requests per scenario.")
+    parser.add_argument('--concurrency', type=int, default=8, help="Client threads.")
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--roles', type=int, default=5)
+    parser.add_argument('--notes', type=int, default=1000)
+    parser.add_argument('--fanout', type=int, default=3, help="Users every note is shared with besides its owner.")
+    parser.add_argument('--audit-depth', type=int, default=5, help="Versions in the history of every note.")
+    parser.add_argument('--only', help="Only run scenarios whose 'route:METHOD' name matches this regular expression.")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help="Write the results as JSON to this file.")
+    parser.add_argument('--compare', help="Results JSON of an earlier run to compare against.")
+    options = parser.parse_args()
+
+    setup_django()
+    check_coverage()
+    scenarios = [scenario for scenario in SCENARIOS if not options.only or re.search(options.only, scenario.name)]
+    previous = None
+    if options.compare:
+        with open(options.compare) as compare_file:
+            previous = json.load(compare_file)
+
+    with tempfile.TemporaryDirectory() as directory:
+        with benchmark_database(database_file=os.path.join(directory, 'bench_api.sqlite3')):
+            seed_started = time.perf_counter()
+            dataset = seed(options)
+            seed_seconds = time.perf_counter() - seed_started
+            if options.mode == 'live':
+                with live_server() as base_url:
+                    results = [run_scenario(scenario, dataset, HTTPTransport(base_url), options) for scenario in scenarios]
+            else:
+                results = [run_scenario(scenario, dataset, InProcessTransport(), options) for scenario in scenarios]
+
+    print(f"seeded in {seed_seconds:.1f}s; {options.requests} requests per scenario, concurrency {options.concurrency}, {options.mode}")
+    print_results(results, previous)
+    write_results(options.output, {'options': vars(options), 'seed_seconds': seed_seconds, 'results': results})
+
+
+if __name__ == '__main__':
+    main()
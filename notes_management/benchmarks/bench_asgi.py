@@ -0,0 +1,170 @@
+"""
+Concurrency cost of the read endpoints under the three ways they can be served:
+the WSGI handler on a thread pool, the ASGI handler running the sync APIViews,
+and the ASGI handler running the async-native views. Reports throughput,
+latency, the peak number of live threads and (in a shorter separate pass, as
+tracing slows everything down) the peak traced memory.
+
+    python -m benchmarks.bench_asgi --requests 2000 --concurrency 50
+"""
+import argparse
+import asyncio
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.common import benchmark_database, setup_django, summarize, write_results
+
+
+SYNC_ROUTES = ('get_all_notes', 'get_notes', 'get_detailed_notes', 'get_history')
+ASYNC_ROUTES = ('async_get_all_notes', 'async_get_notes', 'async_get_detailed_notes', 'async_get_history')
+
+
+def seed(options):
+    from rest_framework_simplejwt.tokens import AccessToken
+    from notes_app.models import Notes, NotesUser
+    from user_app.models import User
+
+    user = User.objects.create(username='bench', email='bench@mail.com', is_superuser=True)
+    notes = Notes.objects.bulk_create([Notes(note_content=f'benchmark note {i}', created_by=user, modified_by=user)
+                                       for i in range(options.notes)])
+    NotesUser.objects.bulk_create([NotesUser(notes=note, user=user, can_edit=True, can_delete=True) for note in notes])
+    hot_notes = notes[:options.hot_notes]
+    for note in hot_notes:
+        for version in range(options.versions):
+            note.note_content = f'{note.note_content} v{version}'
+            note.save()
+    return f'Bearer {AccessToken.for_user(user)}', [note.id for note in hot_notes]
+
+
+def build_urls(routes, note_ids, count):
+    from django.urls import reverse
+
+    urls = []
+    for index in range(count):
+        route = routes[index % len(routes)]
+        kwargs = {} if route.endswith('all_notes') else {'note_id': note_ids[index % len(note_ids)]}
+        urls.append(reverse(route, kwargs=kwargs))
+    return urls
+
+
+class ThreadSampler:
+    """
+    Highest number of live threads seen while the block runs
+    """
+
+    def __init__(self, interval=0.002):
+        self.interval = interval
+        self.peak = threading.active_count()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+
+    def _sample(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, threading.active_count())
+            time.sleep(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        # The sampler itself is not part of the measurement
+        self.peak -= 1
+
+
+def run_wsgi(urls, token, concurrency):
+    from django.test import Client
+
+    local = threading.local()
+
+    def request(url):
+        if not hasattr(local, 'client'):
+            local.client = Client(headers={'Authorization': token})
+        start = time.perf_counter()
+        response = local.client.get(url)
+        elapsed = time.perf_counter() - start
+        assert response.status_code == 200, (url, response.status_code)
+        return elapsed
+
+    with ThreadPoolExecutor(concurrency) as pool:
+        return list(pool.map(request, urls))
+
+
+def run_asgi(urls, token, concurrency):
+    from django.test import AsyncClient
+
+    client = AsyncClient()
+
+    async def request(semaphore, url):
+        async with semaphore:
+            start = time.perf_counter()
+            response = await client.get(url, headers={'Authorization': token})
+            elapsed = time.perf_counter() - start
+        assert response.status_code == 200, (url, response.status_code)
+        return elapsed
+
+    async def run_all():
+        semaphore = asyncio.Semaphore(concurrency)
+        return await asyncio.gather(*(request(semaphore, url) for url in urls))
+
+    return asyncio.run(run_all())
+
+
+def measure(mode, runner, routes, note_ids, token, options):
+    urls = build_urls(routes, note_ids, options.requests)
+    # Warm the permission and response caches, which every mode shares
+    runner(urls[:len(routes) * len(note_ids)], token, options.concurrency)
+
+    with ThreadSampler() as threads:
+        started = time.perf_counter()
+        latencies = runner(urls, token, options.concurrency)
+        elapsed = time.perf_counter() - started
+
+    tracemalloc.start()
+    runner(urls[:options.memory_requests], token, options.concurrency)
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'mode': mode,
+        'requests': len(urls),
+        'requests_per_second': len(urls) / elapsed,
+        'latency': summarize(latencies),
+        'peak_threads': threads.peak,
+        'peak_traced_memory_kb': peak_memory / 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=1000, help="Requests measured per mode.")
+    parser.add_argument('--concurrency', type=int, default=32, help="Requests in flight at once.")
+    parser.add_argument('--notes', type=int, default=200, help="Notes shared with the benchmark user.")
+    parser.add_argument('--hot-notes', type=int, default=10, help="Notes the single-note requests are spread over.")
+    parser.add_argument('--versions', type=int, default=5, help="Edits applied to every hot note.")
+    parser.add_argument('--memory-requests', type=int, default=200, help="Requests in the traced-memory pass.")
+    parser.add_argument('--output', help="Write the results as JSON to this file.")
+    options = parser.parse_args()
+
+    setup_django()
+    with benchmark_database():
+        token, note_ids = seed(options)
+        results = [
+            measure('wsgi', run_wsgi, SYNC_ROUTES, note_ids, token, options),
+            measure('asgi-sync-views', run_asgi, SYNC_ROUTES, note_ids, token, options),
+            measure('asgi-async-views', run_asgi, ASYNC_ROUTES, note_ids, token, options),
+        ]
+
+    for result in results:
+        print(f"{result['mode']:>16}: {result['requests_per_second']:8.1f} req/s, "
+              f"p50 {result['latency']['p50_ms']:.2f} ms, p99 {result['latency']['p99_ms']:.2f} ms, "
+              f"peak threads {result['peak_threads']}, peak traced memory {result['peak_traced_memory_kb']:.0f} KiB")
+    write_results(options.output, {'options': vars(options), 'results': results})
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""
+Storage and reconstruction cost of NotesAudit in 'full' versus 'delta' mode.
+
+    python -m benchmarks.bench_audit_storage --lines 500 --edits 300
+"""
+import argparse
+import random
+
+from benchmarks.common import benchmark_database, setup_django, summarize, timed, write_results
+
+
+def edit_content(lines, rng):
+    index = rng.randrange(len(lines))
+    action = rng.random()
+    if action < 0.7:
+        lines[index] = f'{lines[index]} edited {rng.randrange(10 ** 6)}'
+    elif action < 0.85:
+        lines.insert(index, f'inserted line {rng.randrange(10 ** 6)}')
+    elif len(lines) > 1:
+        del lines[index]
+    return '\n'.join(lines)
+
+
+def run_mode(mode, options):
+    from django.test import override_settings
+    from notes_app.audit import materialize_audits
+    from notes_app.models import Notes, NotesAudit
+    from user_app.models import User
+
+    rng = random.Random(options.seed)
+    lines = [f'line {i} of the benchmark note with some ordinary words in it' for i in range(options.lines)]
+    with override_settings(NOTES_AUDIT_STORAGE=mode, NOTES_AUDIT_KEYFRAME_INTERVAL=options.interval):
+        user = User.objects.create(username=f'bench-{mode}', email=f'bench-{mode}@mail.com', is_superuser=True)
+        note = Notes.objects.create(note_content='\n'.join(lines), created_by=user, modified_by=user)
+        write_times = []
+        for _ in range(options.edits):
+            note.note_content = edit_content(lines, rng)
+            _, elapsed = timed(note.save)
+            write_times.append(elapsed)
+
+        rows = NotesAudit.objects.filter(notes=note)
+        stored = sum(len(row.old_note_content) + len(row.new_note_content) + len(row.content_delta or '') for row in rows)
+
+        history_times = []
+        for _ in range(options.repeat):
+            _, elapsed = timed(lambda: materialize_audits(list(rows.order_by('id'))))
+            history_times.append(elapsed)
+
+        audit_ids = list(rows.values_list('id', flat=True))
+        single_times = []
+        for _ in range(options.repeat):
+            audit_id = rng.choice(audit_ids)
+            _, elapsed = timed(lambda: materialize_audits([NotesAudit.objects.get(pk=audit_id)]))
+            single_times.append(elapsed)
+
+    return {
+        'mode': mode,
+        'rows': len(audit_ids),
+        'stored_characters': stored,
+        'write': summarize(write_times),
+        'full_history_read': summarize(history_times),
+        'single_version_read': summarize(single_times),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--lines', type=int, default=200, help="Lines in the benchmark note.")
+    parser.add_argument('--edits', type=int, default=200, help="Edits applied to the note.")
+    parser.add_argument('--interval', type=int, default=20, help="Keyframe interval for delta mode.")
+    parser.add_argument('--repeat', type=int, default=20, help="Reads measured per scenario.")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help="Write the results as JSON to this file.")
+    options = parser.parse_args()
+
+    setup_django()
+    with benchmark_database():
+        results = [run_mode(mode, options) for mode in ('full', 'delta')]
+
+    full, delta = results
+    for result in results:
+        print(f"{result['mode']:>5}: {result['rows']} rows, {result['stored_characters']} chars stored, "
+              f"write p50 {result['write']['p50_ms']:.2f} ms, "
+              f"history read p50 {result['full_history_read']['p50_ms']:.2f} ms, "
+              f"single version p50 {result['single_version_read']['p50_ms']:.2f} ms")
+    print(f"delta storage is {delta['stored_characters'] / full['stored_characters']:.1%} of full storage")
+    write_results(options.output, {'options': vars(options), 'results': results})
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""
+DRF serializers versus the values-based fast paths on large result sets. Exits
+with status 1 when any fast path produces different JSON than its serializer.
+
+    python -m benchmarks.bench_fast_serializers --rows 10000 100000
+"""
+import argparse
+import json
+import random
+import sys
+
+from benchmarks.common import benchmark_database, setup_django, timed, write_results
+
+
+def seed(rows, options):
+    from notes_app.models import Notes, NotesUser
+    from user_app.models import Role, User
+
+    rng = random.Random(options.seed)
+    roles = Role.objects.bulk_create([Role(name=f'bench-role-{i}') for i in range(options.roles)])
+    users = User.objects.bulk_create([User(username=f'bench-user-{i}', email=f'bench-user-{i}@mail.com',
+                                           role=rng.choice(roles + [None])) for i in range(options.users)])
+    notes = Notes.objects.bulk_create([Notes(note_content=f'benchmark note {i} ' * 5, created_by=rng.choice(users),
+                                             modified_by=rng.choice(users)) for i in range(rows)], batch_size=5000)
+    NotesUser.objects.bulk_create([NotesUser(notes=note, user=user, can_edit=rng.random() < 0.5)
+                                   for note in notes for user in rng.sample(users, rng.randint(1, 3))], batch_size=5000)
+
+
+def clear_tables():
+    from notes_app.models import Notes, NotesUser
+    from user_app.models import Role, User
+
+    NotesUser.objects.all().delete()
+    Notes.objects.all().delete()
+    User.objects.all().delete()
+    Role.objects.all().delete()
+
+
+def compare(name, drf_func, fast_func):
+    drf_data, drf_seconds = timed(drf_func)
+    fast_data, fast_seconds = timed(fast_func)
+    return {
+        'case': name,
+        'drf_seconds': drf_seconds,
+        'fast_seconds': fast_seconds,
+        'speedup': drf_seconds / fast_seconds if fast_seconds else 0.0,
+        'identical': json.dumps(drf_data) == json.dumps(fast_data),
+    }
+
+
+def run(rows, options):
+    from notes_app import fast_serializers, serializers
+    from notes_app.models import Notes, NotesUser
+    from user_app import fast_serializers as user_fast_serializers
+    from user_app import serializers as user_serializers
+    from user_app.models import Role, User
+
+    seed(rows, options)
+    notes = Notes.objects.order_by('id')
+    shares = NotesUser.objects.order_by('id')
+    users = User.objects.order_by('id')
+    results = [
+        compare('notes', lambda: serializers.NoteSerializer(serializers.NoteSerializer.setup_eager_loading(notes), many=True).data,
+                lambda: fast_serializers.serialize_notes(notes.values(*fast_serializers.NOTE_FIELDS))),
+        compare('note shares', lambda: serializers.NoteShareSerializer1(
+                    serializers.NoteShareSerializer1.setup_eager_loading(shares), many=True).data,
+                lambda: fast_serializers.serialize_note_shares(shares)),
+        compare('users lite', lambda: user_serializers.UserSerializerLite(
+                    user_serializers.UserSerializerLite.setup_eager_loading(users), many=True).data,
+                lambda: user_fast_serializers.serialize_users_lite(list(users.values_list('id', flat=True)))),
+        compare('roles', lambda: user_serializers.RoleSerializer(Role.objects.order_by('id'), many=True).data,
+                lambda: user_fast_serializers.serialize_roles(Role.objects.order_by('id'))),
+    ]
+    clear_tables()
+    return {'rows': rows, 'results': results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000], help="Note counts to benchmark.")
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--roles', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help="Write the results as JSON to this file.")
+    options = parser.parse_args()
+
+    setup_django()
+    with benchmark_database():
+        runs = [run(rows, options) for rows in options.rows]
+
+    identical = True
+    for result_set in runs:
+        for result in result_set['results']:
+            identical = identical and result['identical']
+            print(f"{result_set['rows']:>7} notes, {result['case']:>11}: DRF {result['drf_seconds']:.3f}s, "
+                  f"fast {result['fast_seconds']:.3f}s, {result['speedup']:.1f}x"
+                  f"{'' if result['identical'] else '  OUTPUT DIFFERS'}")
+    write_results(options.output, {'options': vars(options), 'runs': runs})
+    if not identical:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
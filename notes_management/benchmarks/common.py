@@ -0,0 +1,89 @@
+"""
+Shared helpers for the benchmark scripts. Run them from the directory holding
+manage.py, e.g. `python -m benchmarks.bench_audit_storage --help`.
+"""
+import json
+import os
+import statistics
+import time
+from contextlib import contextmanager
+
+
+def setup_django():
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'notes_management.settings')
+    import django
+    from django.conf import settings
+
+    django.setup()
+    # Query logging would grow without bound over a benchmark run
+    settings.DEBUG = False
+
+
+def _begin_immediate(execute, sql, params, many, context):
+    # A deferred transaction that read before writing gets "database is locked"
+    # at once, without waiting, when another connection is writing
+    return execute('BEGIN IMMEDIATE' if sql == 'BEGIN' else sql, params, many, context)
+
+
+def _add_begin_immediate(sender, connection, **kwargs):
+    if connection.vendor == 'sqlite':
+        connection.execute_wrappers.append(_begin_immediate)
+
+
+@contextmanager
+def benchmark_database(verbosity=0, database_file=None):
+    """
+    Run against a freshly migrated test database so benchmarks never touch db.sqlite3.
+    With database_file the test database is that SQLite file instead of an
+    in-memory one, so concurrent threads and servers get their own connections
+    and wait for write locks instead of failing on them.
+    """
+    from django.conf import settings
+    from django.db.backends.signals import connection_created
+    from django.test.utils import setup_databases, teardown_databases
+
+    if database_file:
+        database = settings.DATABASES['default']
+        database.setdefault('TEST', {})['NAME'] = database_file
+        database.setdefault('OPTIONS', {}).setdefault('timeout', 30)
+        connection_created.connect(_add_begin_immediate)
+
+    old_config = setup_databases(verbosity=verbosity, interactive=False)
+    try:
+        yield
+    finally:
+        teardown_databases(old_config, verbosity=verbosity)
+        connection_created.disconnect(_add_begin_immediate)
+
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def percentile(samples, fraction):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(samples):
+    """
+    Latency summary in milliseconds for a list of durations in seconds
+    """
+    return {
+        'count': len(samples),
+        'mean_ms': statistics.fmean(samples) * 1000 if samples else 0.0,
+        'p50_ms': percentile(samples, 0.50) * 1000,
+        'p95_ms': percentile(samples, 0.95) * 1000,
+        'p99_ms': percentile(samples, 0.99) * 1000,
+    }
+
+
+def write_results(path, results):
+    if path:
+        with open(path, 'w') as output:
+            json.dump(results, output, indent=2, default=str)
@@ -0,0 +1,108 @@
+from notes_management.cache import MISSING, get_cache
+from .models import NotesRole, NotesUser
+
+
+PERMISSION_FIELDS = ('can_read', 'can_edit', 'can_delete')
+
+
+def _acl_cache():
+    return get_cache('acl')
+
+
+def _note_dependency(note_id):
+    return f'note:{note_id}'
+
+
+def _share_dependency(note_id, user_id):
+    return f'share:{note_id}:{user_id}'
+
+
+def _role_dependency(role_id):
+    return f'role:{role_id}'
+
+
+def _cache_entry(note_id, user_id, role_id):
+    dependencies = [_note_dependency(note_id), _share_dependency(note_id, user_id)]
+    if role_id:
+        dependencies.append(_role_dependency(role_id))
+    return f'{note_id}:{user_id}:{role_id or ""}', dependencies
+
+
+def _permissions_queryset(note_id, user_id, role_id):
+    """
+    The user's own share and their role's share of the note, as one compound
+    SELECT; each side is a lookup on its unique (notes, principal) index
+    """
+    queryset = NotesUser.objects.active().filter(notes_id=note_id, user_id=user_id).values_list(*PERMISSION_FIELDS)
+    if role_id:
+        role_share = NotesRole.granted_to(role_id).filter(notes_id=note_id).values_list(*PERMISSION_FIELDS)
+        queryset = queryset.union(role_share, all=True)
+    return queryset
+
+
+def _combine(rows):
+    # Either share granting a permission is enough
+    if not rows:
+        return None
+    return tuple(any(values) for values in zip(*rows))
+
+
+def _read_permissions(note_id, user_id, role_id):
+    return _combine(list(_permissions_queryset(note_id, user_id, role_id)))
+
+
+def get_note_permissions(note_id, user_id, role_id=None):
+    """
+    Return the (can_read, can_edit, can_delete) triple the user holds on the note
+    through their own share and the share of their role, or None when the note
+    is shared with neither. Served from the ACL cache.
+    """
+    key, dependencies = _cache_entry(note_id, user_id, role_id)
+    return _acl_cache().get_or_set(key, lambda: _read_permissions(note_id, user_id, role_id), dependencies=dependencies)
+
+
+async def aget_note_permissions(note_id, user_id, role_id=None):
+    """
+    get_note_permissions for async views; a cache miss is read with the async ORM
+    """
+    cache = _acl_cache()
+    key, dependencies = _cache_entry(note_id, user_id, role_id)
+    permissions = await cache.aget(key, dependencies)
+    if permissions is MISSING:
+        versions = await cache.aget_versions(*dependencies)
+        permissions = _combine([row async for row in _permissions_queryset(note_id, user_id, role_id)])
+        await cache.aset(key, permissions, dependencies, versions=versions)
+    return permissions
+
+
+def invalidate_share(note_id, user_id):
+    invalidate_shares([(note_id, user_id)])
+
+
+def invalidate_shares(shares):
+    """
+    Drop the cached permissions of the given (note_id, user_id) pairs
+    """
+    _acl_cache().bump(*(_share_dependency(note_id, user_id) for note_id, user_id in shares))
+
+
+def invalidate_note(note_id):
+    """
+    Drop the cached permissions of every user on the note
+    """
+    invalidate_notes([note_id])
+
+
+def invalidate_notes(note_ids):
+    _acl_cache().bump(*(_note_dependency(note_id) for note_id in note_ids))
+
+
+def invalidate_role(role_id):
+    """
+    Drop the cached permissions of every member of the role
+    """
+    _acl_cache().bump(_role_dependency(role_id))
+
+
+def cache_stats():
+    return _acl_cache().stats()
@@ -0,0 +1,173 @@
+"""
+Async-native versions of the read-heavy notes endpoints, for deployments served
+through asgi.py. DRF's APIView is synchronous, so under ASGI every request to it
+is handed to a worker thread; these views run authentication, permission checks
+and queries on the event loop instead.
+"""
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import AnonymousUser
+from django.http import HttpResponse
+from django.views import View
+from rest_framework import status
+from rest_framework.exceptions import APIException, AuthenticationFailed, MethodNotAllowed, NotAuthenticated, \
+    PermissionDenied
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.response import Response
+
+from user_app.authentication import AsyncJWTAuthentication
+from .audit import materialize_audits
+from .models import Notes, NotesAudit
+from . import acl, fast_serializers, feed, response_cache, serializers
+from .pagination import NotesFeedPagination, NotesHistoryPagination
+from .views import IsAuthorized
+
+
+class AsyncIsAuthorized(IsAuthorized):
+    """
+    IsAuthorized with the ACL lookup done through the async ORM.
+    """
+
+    async def ahas_permission(self, request, view):
+        permissions = await acl.aget_note_permissions(view.kwargs.get('note_id'), request.user.id,
+                                                     getattr(request.user, 'role_id', None))
+        return self.check_note_permissions(request, permissions)
+
+
+class AsyncAPIView(View):
+    """
+    The parts of APIView these endpoints need, as coroutines: authenticators
+    providing aauthenticate(), permissions optionally providing ahas_permission()
+    (plain has_permission() must not touch the database) and JSON responses in
+    the same format DRF renders. Handlers receive a DRF Request and return a DRF
+    Response, like APIView handlers do.
+    """
+    authentication_classes = (AsyncJWTAuthentication, )
+    permission_classes = (IsAuthenticated, )
+    renderer_class = JSONRenderer
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        view = super().as_view(**initkwargs)
+        # Token authenticated, like APIView. Set directly because csrf_exempt() does not keep coroutine functions async
+        view.csrf_exempt = True
+        return view
+
+    async def dispatch(self, request, *args, **kwargs):
+        request = Request(request)
+        try:
+            await self.perform_authentication(request)
+            await self.check_permissions(request)
+            handler = getattr(self, request.method.lower(), None)
+            if request.method.lower() not in self.http_method_names or handler is None:
+                raise MethodNotAllowed(request.method)
+            response = await handler(request, *args, **kwargs)
+        except APIException as exc:
+            response = self.handle_exception(exc)
+        return self.finalize_response(request, response)
+
+    async def perform_authentication(self, request):
+        request.user, request.auth = AnonymousUser(), None
+        for authenticator in (authentication_class() for authentication_class in self.authentication_classes):
+            user_auth_tuple = await authenticator.aauthenticate(request)
+            if user_auth_tuple is not None:
+                request.user, request.auth = user_auth_tuple
+                return
+
+    async def check_permissions(self, request):
+        for permission in (permission_class() for permission_class in self.permission_classes):
+            if hasattr(permission, 'ahas_permission'):
+                allowed = await permission.ahas_permission(request, self)
+            else:
+                allowed = permission.has_permission(request, self)
+            if not allowed:
+                if not request.user.is_authenticated:
+                    raise NotAuthenticated()
+                raise PermissionDenied(getattr(permission, 'message', None))
+
+    def handle_exception(self, exc):
+        headers = {}
+        if isinstance(exc, (NotAuthenticated, AuthenticationFailed)):
+            headers['WWW-Authenticate'] = self.authentication_classes[0]().authenticate_header(None)
+        data = exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail}
+        return Response(data, status=exc.status_code, headers=headers)
+
+    def finalize_response(self, request, response):
+        # Rendered here, so the handler does not need a thread to render a template response
+        renderer = self.renderer_class()
+        content = renderer.render(response.data, renderer.media_type, {'view': self, 'request': request, 'response': response})
+        headers = {key: value for key, value in response.items() if key.lower() != 'content-type'}
+        return HttpResponse(content, status=response.status_code, content_type=renderer.media_type, headers=headers)
+
+
+class AsyncNotesView(AsyncAPIView):
+    pagination_class = NotesFeedPagination
+
+    async def get(self, request):
+        """
+        Get All Notes Shared with the User. Newest first, paginated with an opaque cursor
+        """
+        paginator = self.pagination_class()
+        notes_page = await feed.aget_feed_page(request.user, paginator, request)
+        if not notes_page and paginator.cursor is None:
+            return Response({'status': status.HTTP_404_NOT_FOUND, 'detail': 'Note Not Found. Please Create a Note', 'data':[]},
+                            status=status.HTTP_404_NOT_FOUND)
+        # The shares and users of the page are read with the sync ORM
+        return paginator.get_paginated_response(await sync_to_async(fast_serializers.serialize_notes)(notes_page))
+
+
+class AsyncSingleNoteView(AsyncAPIView):
+    permission_classes = (IsAuthenticated, AsyncIsAuthorized)
+
+    async def get(self, request, note_id):
+        """
+        Get Note By Primary Key. Available Only if Note is Shared with User
+        """
+        # Serializers cannot lazy-load on the event loop, so the users relation is fetched up front
+        notes_queryset = await Notes.objects.active().prefetch_related('users').filter(pk=note_id).afirst()
+        if notes_queryset is None:
+            return Response({'status': status.HTTP_404_NOT_FOUND, 'detail': 'Requested Note Not Found.', 'data':[]}, status=status.HTTP_404_NOT_FOUND)
+
+        notes_serializer = serializers.NoteCreateSerializer(notes_queryset)
+        return Response({'status': status.HTTP_200_OK, 'detail': 'Note successfully retrieved.', 'data':notes_serializer.data})
+
+
+class AsyncSingleNoteDetailView(AsyncAPIView):
+    permission_classes = (IsAuthenticated, AsyncIsAuthorized)
+
+    async def get(self, request, note_id):
+        """
+        Get Note By Primary Key. Available Only if Note is Shared with User. Includes details of shared users and owner information
+        """
+        notes_data = await response_cache.aget_note_detail(note_id)
+        if notes_data is None:
+            return Response({'status': status.HTTP_404_NOT_FOUND, 'detail': 'Requested Not Found.', 'data':[]}, status=status.HTTP_404_NOT_FOUND)
+        return Response({'status': status.HTTP_200_OK, 'detail': 'Note successfully retrieved.', 'data':notes_data})
+
+
+class AsyncNotesHistoryView(AsyncAPIView):
+    permission_classes = (IsAuthenticated, AsyncIsAuthorized)
+    pagination_class = NotesHistoryPagination
+
+    async def get(self, request, note_id):
+        """
+        Get the Version History of a Note, newest change first, paginated with an opaque cursor. Available Only if Note is Shared with User
+        """
+        note = await serializers.NotesAuditSerializer1.setup_eager_loading(Notes.objects.active()).filter(pk=note_id).afirst()
+        if note is None:
+            return Response({'status': status.HTTP_404_NOT_FOUND, 'detail': 'Requested Note Not Found.', 'data':[]}, status=status.HTTP_404_NOT_FOUND)
+        paginator = self.pagination_class()
+        if not note.audit_count and paginator.cursor_query_param not in request.query_params:
+            serializer = serializers.NotesAuditSerializer1(note)
+            return Response({'status': status.HTTP_200_OK, 'detail': 'Requested Note Does Not Have Any Modifications Found.', 'data':serializer.data}, status=status.HTTP_200_OK)
+
+        notes_history_queryset = serializers.NotesAuditSerializer.setup_eager_loading(NotesAudit.objects.active().filter(notes_id=note_id))
+        history_page = await paginator.apaginate_queryset(notes_history_queryset, request, view=self)
+        # Delta rows of a page may need older rows of their chain, which the serializer would read synchronously
+        await sync_to_async(materialize_audits)(history_page, context=paginator.lookahead_rows)
+        return_data = {
+            'total_changes': note.audit_count,
+            'changes_history': serializers.NotesAuditSerializer(history_page, many=True).data
+        }
+        return paginator.get_paginated_response(return_data)
@@ -0,0 +1,163 @@
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import F, OuterRef, Subquery
+
+from .delta import apply_delta, make_delta
+from .models import Notes, NotesAudit
+
+
+def get_storage_mode():
+    return getattr(settings, 'NOTES_AUDIT_STORAGE', 'full')
+
+
+def get_keyframe_interval():
+    return max(1, getattr(settings, 'NOTES_AUDIT_KEYFRAME_INTERVAL', 20))
+
+
+def get_chain_tails(note_ids):
+    """
+    (chain_position, new content) of the latest audit row of every note, in one
+    query: the rows from each note's latest keyframe on, enough to rebuild the
+    latest one without further reads
+    """
+    latest_keyframe = (NotesAudit.objects.filter(notes_id=OuterRef('notes_id'), is_keyframe=True)
+                       .order_by('-id').values('id')[:1])
+    chain = list(NotesAudit.objects.filter(notes_id__in=note_ids, id__gte=Subquery(latest_keyframe)).order_by('id'))
+    latest = {audit.notes_id: audit for audit in chain}
+    materialize_audits(list(latest.values()), context=chain)
+    return {note_id: (audit.chain_position, audit.new_note_content) for note_id, audit in latest.items()}
+
+
+def prepare_audits(audits, tails=None):
+    """
+    Turn unsaved audit rows carrying the full old/new content into their storage
+    form. Rows must be in the order the changes happened. `tails` maps note ids
+    to the (chain_position, new content) of their latest stored row; it is read
+    from the database when not given (pass {} for notes without any rows).
+    """
+    if get_storage_mode() != 'delta':
+        return audits
+
+    interval = get_keyframe_interval()
+    if tails is None:
+        tails = get_chain_tails({audit.notes_id for audit in audits})
+    for audit in audits:
+        position, content = tails.get(audit.notes_id, (None, None))
+        new_content = audit.new_note_content
+        # A delta is applied to the previous row's new content; a change saved from a stale
+        # copy of the note does not continue from it and starts a new chain instead
+        if position is None or position + 1 >= interval or content != audit.old_note_content:
+            audit.is_keyframe = True
+            audit.chain_position = 0
+            audit.content_delta = None
+        else:
+            audit.is_keyframe = False
+            audit.chain_position = position + 1
+            audit.content_delta = make_delta(audit.old_note_content, new_content)
+            audit.old_note_content = audit.new_note_content = ''
+        tails[audit.notes_id] = (audit.chain_position, new_content)
+    return audits
+
+
+def lock_notes(note_ids):
+    """
+    Hold the rows of the notes until the transaction ends, so concurrent writers
+    of their audit rows read and extend the chain one at a time. Backends
+    without SELECT ... FOR UPDATE (SQLite) already serialize writers.
+    """
+    if connection.features.has_select_for_update:
+        list(Notes.objects.select_for_update().filter(id__in=note_ids).values_list('id', flat=True))
+
+
+def record_audits(audits):
+    """
+    Store the audit rows of one or more note changes and count them in
+    Notes.audit_count. Callers run it inside a transaction, so rows and counts
+    are committed together.
+    """
+    if get_storage_mode() == 'delta':
+        lock_notes({audit.notes_id for audit in audits})
+    prepare_audits(audits)
+    if len(audits) == 1:
+        audits[0].save()
+    else:
+        NotesAudit.objects.bulk_create(audits)
+    increment_audit_counts(Counter(audit.notes_id for audit in audits))
+    return audits
+
+
+def increment_audit_counts(counts):
+    """
+    Add `counts` (note id -> number of new audit rows) to Notes.audit_count,
+    one UPDATE per distinct increment
+    """
+    notes_by_count = defaultdict(list)
+    for note_id, count in counts.items():
+        notes_by_count[count].append(note_id)
+    for count, note_ids in notes_by_count.items():
+        Notes.objects.filter(id__in=note_ids).update(audit_count=F('audit_count') + count)
+
+
+def _chain_is_complete(chain, first_id):
+    """
+    True when `chain` (ascending) starts at a keyframe at or before first_id and
+    has no missing rows from there on.
+    """
+    start = None
+    for index, audit in enumerate(chain):
+        if audit.id > first_id:
+            break
+        if audit.is_keyframe:
+            start = index
+    if start is None:
+        return False
+    for previous, audit in zip(chain[start:], chain[start + 1:]):
+        if not audit.is_keyframe and audit.chain_position != previous.chain_position + 1:
+            return False
+    return True
+
+
+def materialize_audits(audits, context=()):
+    """
+    Fill in old/new content of delta rows so callers always see full content.
+    Rows of the same notes that were already fetched can be passed as `context`;
+    the chain is only read from the database when they do not cover it.
+    """
+    pending = [audit for audit in audits if not audit.is_keyframe and not getattr(audit, '_materialized', False)]
+    if not pending:
+        return audits
+
+    targets = defaultdict(list)
+    for audit in pending:
+        targets[audit.notes_id].append(audit)
+    known_rows = defaultdict(dict)
+    for audit in (*context, *audits):
+        known_rows[audit.notes_id][audit.id] = audit
+
+    for note_id, note_targets in targets.items():
+        first_id = min(audit.id for audit in note_targets)
+        last_id = max(audit.id for audit in note_targets)
+        chain = sorted((audit for audit in known_rows[note_id].values() if audit.id <= last_id), key=lambda audit: audit.id)
+        if not _chain_is_complete(chain, first_id):
+            keyframe = NotesAudit.objects.filter(notes_id=note_id, id__lte=first_id, is_keyframe=True).order_by('-id')
+            chain = list(NotesAudit.objects.filter(notes_id=note_id, id__lte=last_id,
+                                                   id__gte=Subquery(keyframe.values('id')[:1])).order_by('id'))
+
+        current_content = None
+        contents = {}
+        for audit in chain:
+            if audit.is_keyframe:
+                old_content, current_content = audit.old_note_content, audit.new_note_content
+            elif current_content is None:
+                continue
+            else:
+                old_content, current_content = current_content, apply_delta(current_content, audit.content_delta)
+            contents[audit.id] = (old_content, current_content)
+
+        for audit in note_targets:
+            if audit.id in contents:
+                audit.old_note_content, audit.new_note_content = contents[audit.id]
+                audit._materialized = True
+    return audits
@@ -0,0 +1,184 @@
+"""
+Where the audit rows of note changes get written, per NOTES_AUDIT_WRITER.
+'sync' writes them in the request, as record_audits always did. 'batched'
+queues them once the surrounding transaction commits and a background thread
+writes whatever has queued up with one bulk INSERT per batch. A single thread
+taking rows in queue order keeps the rows of every note in the order of its
+changes; the queue is drained when the process exits.
+"""
+import atexit
+import logging
+import queue
+import threading
+import time
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import close_old_connections, connection, transaction
+from django.dispatch import receiver
+
+from .audit import record_audits
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_AUDIT_WRITER = {
+    'MODE': 'sync',
+    'BATCH_SIZE': 500,
+    'MAX_PENDING': 10000,
+    'RETRIES': 3,
+    'ENQUEUE_TIMEOUT': 5,
+}
+
+
+def get_audit_writer_settings():
+    return {**DEFAULT_AUDIT_WRITER, **getattr(settings, 'NOTES_AUDIT_WRITER', {})}
+
+
+class BatchedAuditWriter:
+    """
+    Background writer of queued audit rows. enqueue waits up to enqueue_timeout
+    seconds when MAX_PENDING changes are waiting, and writes synchronously when
+    that runs out or the writer is closed or its thread has died.
+    """
+
+    def __init__(self, batch_size=500, max_pending=10000, retries=3, enqueue_timeout=5):
+        self.batch_size = batch_size
+        self.retries = retries
+        self.enqueue_timeout = enqueue_timeout
+        self._queue = queue.Queue(max_pending)
+        self._lock = threading.Lock()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='audit-writer', daemon=True)
+        self._thread.start()
+
+    def enqueue(self, audits):
+        with self._lock:
+            closed = self._closed
+        if not closed and self._thread.is_alive():
+            try:
+                # Not under the lock, a full queue must not hold up close()
+                self._queue.put(audits, timeout=self.enqueue_timeout)
+            except queue.Full:
+                logger.warning("Audit queue full for %ss, writing %d rows in the request", self.enqueue_timeout, len(audits))
+            else:
+                if self._closed and not self._thread.is_alive():
+                    # Queued after close() drained the queue
+                    self._drain()
+                return
+        with transaction.atomic():
+            record_audits(audits)
+
+    def flush(self):
+        """
+        Wait until everything queued so far is written
+        """
+        self._queue.join()
+
+    def close(self):
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+        self._drain()
+
+    def _drain(self):
+        # Rows enqueued while the writer was closing
+        while True:
+            try:
+                audits = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                self._write(audits or [])
+            finally:
+                self._queue.task_done()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            rows = len(batch[0] or ())
+            while batch[-1] is not None and rows < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+                rows += len(batch[-1] or ())
+
+            try:
+                self._write([audit for audits in batch if audits for audit in audits])
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+            if batch[-1] is None:
+                connection.close()
+                return
+
+    def _write(self, audits):
+        if not audits:
+            return
+        # record_audits replaces content with deltas, a retry has to start from the original
+        contents = [(audit.old_note_content, audit.new_note_content) for audit in audits]
+        for attempt in range(self.retries + 1):
+            try:
+                close_old_connections()
+                with transaction.atomic():
+                    record_audits(audits)
+                return
+            except Exception:
+                logger.exception("Writing %d audit rows failed (attempt %d)", len(audits), attempt + 1)
+                for audit, (old_content, new_content) in zip(audits, contents):
+                    audit.pk = None
+                    audit.old_note_content, audit.new_note_content = old_content, new_content
+                time.sleep(min(2 ** attempt * 0.1, 2))
+        for audit in audits:
+            logger.error("Audit row not written: note %s by user %s at %s: %r -> %r (%s -> %s)", audit.notes_id,
+                         audit.modified_by_id, audit.created_at, audit.old_note_content, audit.new_note_content,
+                         audit.old_note_type, audit.new_note_type)
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_writer():
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            options = get_audit_writer_settings()
+            _writer = BatchedAuditWriter(options['BATCH_SIZE'], options['MAX_PENDING'], options['RETRIES'],
+                                         options['ENQUEUE_TIMEOUT'])
+            atexit.register(_writer.close)
+        return _writer
+
+
+def close_writer():
+    """
+    Write everything still queued and stop the background writer
+    """
+    global _writer
+    with _writer_lock:
+        writer, _writer = _writer, None
+    if writer is not None:
+        writer.close()
+        atexit.unregister(writer.close)
+
+
+def write_audits(audits):
+    """
+    Store the audit rows of one note change
+    """
+    if get_audit_writer_settings()['MODE'] != 'batched':
+        return record_audits(audits)
+    # Rows of a change that is rolled back are never queued
+    transaction.on_commit(lambda: get_writer().enqueue(audits))
+    return audits
+
+
+@receiver(setting_changed)
+def reset_writer(setting, **kwargs):
+    if setting == 'NOTES_AUDIT_WRITER':
+        close_writer()
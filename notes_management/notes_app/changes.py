@@ -0,0 +1,82 @@
+"""
+Changes feed for offline clients. Every write to a note or a share stamps it
+with the next value of ChangeSequence, so "what changed since cursor X" is a few
+range scans over the (change_seq), (user, change_seq) and (role, change_seq)
+indexes, whatever the number of notes the user has. Only the latest state of a changed note is
+reported: a client applies the events in order and resumes from the cursor.
+Shares with the user's role are followed like the user's own shares; moving a
+user to another role is not an event, such a client has to sync from 0.
+"""
+from django.db import transaction
+
+from user_app.fast_serializers import Memo
+from .fast_serializers import NOTE_FIELDS, serialize_notes
+from .models import ChangeSequence, Notes, NotesRole, NotesUser
+
+
+CREATED, UPDATED, DELETED, UNSHARED = 'created', 'updated', 'deleted', 'unshared'
+
+
+def get_changes(user, since=0, limit=500):
+    """
+    Notes of the user changed after the `since` cursor, oldest change first, at
+    most `limit` of them. Returns (changes, cursor, has_more); pass the cursor
+    back as `since` for the next sync.
+
+    A note is 'created' when a change to the user's share made it readable
+    (a new note, a new share or restored access), 'updated' when only the note
+    changed, 'deleted' when it was soft-deleted and 'unshared' when the user
+    can no longer read it. Created and updated notes carry the note as the
+    notes endpoint returns it, the others only its id.
+    """
+    with transaction.atomic():
+        # Values up to the counter are committed: a writer holds the counter until it commits
+        cursor = ChangeSequence.current()
+        window = {'change_seq__gt': since, 'change_seq__lte': cursor}
+        share_events = [NotesUser.objects.filter(user=user, **window)]
+        note_events = [Notes.objects.filter(notes_user__user=user, **window)]
+        if user.role_id:
+            share_events.append(NotesRole.objects.filter(role_id=user.role_id, **window))
+            note_events.append(Notes.objects.filter(notes_role__role_id=user.role_id, **window))
+
+        # Each query returns the first limit + 1 events of its kind, so the merged first `limit` are exact
+        events = []
+        for queryset in share_events:
+            events += [(seq, note_id, True) for seq, note_id in
+                       queryset.order_by('change_seq').values_list('change_seq', 'notes_id')[:limit + 1]]
+        for queryset in note_events:
+            events += [(seq, note_id, False) for seq, note_id in
+                       queryset.order_by('change_seq').values_list('change_seq', 'id')[:limit + 1]]
+        events.sort()
+        has_more = len(events) > limit
+        events = events[:limit]
+        if has_more:
+            cursor = events[-1][0]
+
+        latest, share_changed = {}, set()
+        for seq, note_id, is_share in events:
+            latest[note_id] = seq
+            if is_share:
+                share_changed.add(note_id)
+
+        notes = {row['id']: row for row in Notes.objects.filter(id__in=latest).values(*NOTE_FIELDS)}
+        readable = set(NotesUser.objects.active().filter(user=user, notes_id__in=latest, can_read=True)
+                       .values_list('notes_id', flat=True))
+        if user.role_id:
+            readable.update(NotesRole.granted_to(user.role_id).filter(notes_id__in=latest, can_read=True)
+                            .values_list('notes_id', flat=True))
+        visible = [notes[note_id] for note_id in latest
+                   if note_id in readable and notes[note_id]['is_active'] and not notes[note_id]['is_deleted']]
+        payloads = {note['id']: note for note in serialize_notes(visible, Memo())}
+
+    changes = []
+    for note_id, seq in sorted(latest.items(), key=lambda item: item[1]):
+        note = notes.get(note_id)
+        if note is None or not note['is_active'] or note['is_deleted']:
+            action = DELETED
+        elif note_id not in readable:
+            action = UNSHARED
+        else:
+            action = CREATED if note_id in share_changed else UPDATED
+        changes.append({'seq': seq, 'note_id': note_id, 'action': action, 'note': payloads.get(note_id)})
+    return changes, cursor, has_more
@@ -0,0 +1,96 @@
+import json
+import re
+from difflib import SequenceMatcher
+
+
+# Words and the whitespace between them, used inside changed blocks of lines so
+# that an edit to one long line (or a single-line note) still gives a small delta.
+TOKEN_PATTERN = re.compile(r'\S+|\s+')
+
+# Above this many token comparisons a changed block is stored as plain text,
+# which keeps make_delta fast when a large note is rewritten wholesale.
+MAX_TOKEN_DIFF_COST = 4000000
+# Same bound for the line comparisons of the lines between the unchanged head
+# and tail of the note; above it they are replaced as a whole.
+MAX_LINE_DIFF_COST = MAX_TOKEN_DIFF_COST
+
+
+def _token_operations(old_text, new_text):
+    old_tokens, new_tokens = TOKEN_PATTERN.findall(old_text), TOKEN_PATTERN.findall(new_text)
+    if len(old_tokens) * len(new_tokens) > MAX_TOKEN_DIFF_COST:
+        return [-len(old_tokens), new_text]
+
+    operations = []
+    matcher = SequenceMatcher(None, old_tokens, new_tokens, autojunk=False)
+    for tag, old_start, old_end, new_start, new_end in matcher.get_opcodes():
+        if tag == 'equal':
+            operations.append(old_end - old_start)
+            continue
+        if old_end > old_start:
+            operations.append(old_start - old_end)
+        if new_end > new_start:
+            operations.append(''.join(new_tokens[new_start:new_end]))
+    return operations
+
+
+def make_delta(old, new):
+    """
+    Encode the edit turning `old` into `new` as a compact JSON list. A positive
+    int copies that many lines, a negative int skips that many lines, a string is
+    inserted as is and [n, operations] rewrites the next n lines with the same
+    kind of operations applied to their words.
+    """
+    old_lines, new_lines = old.splitlines(keepends=True), new.splitlines(keepends=True)
+    # Unchanged lines at both ends are copied without running the matcher over them
+    head = 0
+    while head < min(len(old_lines), len(new_lines)) and old_lines[head] == new_lines[head]:
+        head += 1
+    tail = 0
+    while tail < min(len(old_lines), len(new_lines)) - head and old_lines[-tail - 1] == new_lines[-tail - 1]:
+        tail += 1
+    old_middle, new_middle = old_lines[head:len(old_lines) - tail], new_lines[head:len(new_lines) - tail]
+
+    operations = [head] if head else []
+    if len(old_middle) * len(new_middle) > MAX_LINE_DIFF_COST:
+        operations += [-len(old_middle), ''.join(new_middle)]
+    else:
+        matcher = SequenceMatcher(None, old_middle, new_middle, autojunk=False)
+        for tag, old_start, old_end, new_start, new_end in matcher.get_opcodes():
+            if tag == 'equal':
+                operations.append(old_end - old_start)
+            elif tag == 'replace':
+                operations.append([old_end - old_start, _token_operations(''.join(old_middle[old_start:old_end]),
+                                                                          ''.join(new_middle[new_start:new_end]))])
+            elif tag == 'delete':
+                operations.append(old_start - old_end)
+            else:
+                operations.append(''.join(new_middle[new_start:new_end]))
+    if tail:
+        operations.append(tail)
+    return json.dumps(operations, separators=(',', ':'), ensure_ascii=False)
+
+
+def _apply(old_items, operations):
+    position = 0
+    parts = []
+    for operation in operations:
+        if isinstance(operation, str):
+            parts.append(operation)
+        elif isinstance(operation, list):
+            count, token_operations = operation
+            old_block = ''.join(old_items[position:position + count])
+            parts.append(_apply(TOKEN_PATTERN.findall(old_block), token_operations))
+            position += count
+        elif operation > 0:
+            parts.extend(old_items[position:position + operation])
+            position += operation
+        else:
+            position -= operation
+    return ''.join(parts)
+
+
+def apply_delta(old, delta):
+    """
+    Rebuild the new text from `old` and a delta produced by make_delta
+    """
+    return _apply(old.splitlines(keepends=True), json.loads(delta))
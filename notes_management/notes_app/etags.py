@@ -0,0 +1,107 @@
+"""
+Validators for conditional requests on notes. Each one reads a handful of
+timestamps and counts, which is much cheaper than serializing the response, so
+unchanged resources can be answered with 304 Not Modified (and stale writes
+rejected with 412 Precondition Failed through If-Match).
+"""
+import hashlib
+
+from django.db.models import Count, Max, Subquery
+
+from user_app.models import Role, User
+from .models import Notes, NotesRole, NotesUser
+
+
+def _make_etag(*parts):
+    return hashlib.sha1('|'.join(str(part) for part in parts).encode()).hexdigest()
+
+
+def _timestamp(value):
+    return value.isoformat() if value else ''
+
+
+def _note_etag(note_id):
+    # The plain representation lists the users of every share of the note
+    rows = Notes.objects.active().filter(pk=note_id).values('modified_at').annotate(
+        share_count=Count('notes_user'), shares_modified=Max('notes_user__modified_at'),
+    )[:1]
+    if not rows:
+        return None
+    versions = rows[0]
+    return _make_etag('note', note_id, _timestamp(versions['modified_at']), versions['share_count'],
+                      _timestamp(versions['shares_modified']))
+
+
+def note_etag_for(note):
+    """
+    ETag of the plain note representation: the note row and its shares
+    """
+    return _note_etag(note.id)
+
+
+def _unless_unconditional_write(etag_func):
+    """
+    PUT and DELETE only need the tag to check If-Match / If-None-Match, so skip
+    the lookup when neither header was sent.
+    """
+    def wrapper(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD') and not (request.META.get('HTTP_IF_MATCH') or
+                                                         request.META.get('HTTP_IF_NONE_MATCH')):
+            return None
+        return etag_func(request, *args, **kwargs)
+    return wrapper
+
+
+@_unless_unconditional_write
+def note_etag(request, note_id):
+    return _note_etag(note_id)
+
+
+def note_detail_etag(request, note_id):
+    """
+    The detailed representation also nests the owner, the last editor and every
+    share with its user and role, so their modification times are part of the tag.
+    """
+    rows = Notes.objects.active().filter(pk=note_id).values(
+        'modified_at', 'created_by__modified_at', 'created_by__role__modified_at',
+        'modified_by__modified_at', 'modified_by__role__modified_at',
+    ).annotate(
+        share_count=Count('notes_user'), shares_modified=Max('notes_user__modified_at'),
+        users_modified=Max('notes_user__user__modified_at'), roles_modified=Max('notes_user__user__role__modified_at'),
+    )[:1]
+    if not rows:
+        return None
+    versions = rows[0]
+    return _make_etag('note-detail', note_id, *(_timestamp(value) if hasattr(value, 'isoformat') else value
+                                                 for value in versions.values()))
+
+
+def _latest(queryset, field):
+    return Subquery(queryset.order_by('-' + field).values(field)[:1])
+
+
+def notes_list_etag(request):
+    """
+    Collection validator for the notes shared with the user. It reads the top
+    entry of a few per-principal indexes, so its cost does not grow with the
+    number of shares: the latest change_seq of the user's and of their role's
+    shares (new, changed and revoked shares) and the latest note modification
+    those shares carry (see feed). Changes to the shares of other users and to
+    the users nested in the payload are not part of it. The query string is part
+    of the tag, so every page of the listing gets its own.
+    """
+    user = request.user
+    latest = {
+        'shares_seq': _latest(NotesUser.objects.filter(user_id=user.id), 'change_seq'),
+        'notes_modified': _latest(NotesUser.objects.active().filter(user_id=user.id, can_read=True), 'note_modified_at'),
+    }
+    if user.role_id:
+        latest['role_shares_seq'] = _latest(NotesRole.objects.filter(role_id=user.role_id), 'change_seq')
+        latest['role_notes_modified'] = _latest(NotesRole.objects.active().filter(role_id=user.role_id, can_read=True),
+                                                'note_modified_at')
+        latest['role_modified'] = Subquery(Role.objects.filter(pk=user.role_id).values('modified_at'))
+    versions = User.objects.filter(pk=user.id).values(**latest).first()
+    if not versions or not (versions['notes_modified'] or versions.get('role_notes_modified')):
+        return None
+    return _make_etag('notes', user.id, user.role_id, request.META.get('QUERY_STRING', ''),
+                      *(_timestamp(value) if hasattr(value, 'isoformat') else value for value in versions.values()))
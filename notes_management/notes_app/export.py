@@ -0,0 +1,52 @@
+"""
+NDJSON export of the notes shared with a user. Notes are read in id order with
+chunked iterator() queries and serialized a chunk at a time, so memory stays
+bounded by one chunk however many notes the user has, and an export can be
+resumed after the last id received.
+"""
+from collections import defaultdict
+from itertools import islice
+
+from rest_framework.utils.encoders import JSONEncoder
+
+from user_app.fast_serializers import Memo
+from .audit import materialize_audits
+from .fast_serializers import NOTE_FIELDS, serialize_notes
+from .models import Notes, NotesAudit
+from .serializers import NotesAuditSerializer
+
+
+def _history_by_note(note_ids):
+    audits = list(NotesAuditSerializer.setup_eager_loading(NotesAudit.objects.active())
+                  .filter(notes_id__in=note_ids).order_by('notes_id', 'id'))
+    # Every row of these notes is loaded, so delta chains rebuild without more queries
+    materialize_audits(audits)
+    history = defaultdict(list)
+    for audit in audits:
+        history[audit.notes_id].append(audit)
+    return history
+
+
+def iter_export_lines(user, after_id=None, include_history=False, chunk_size=500):
+    """
+    Yield one JSON line per note shared with the user, oldest id first, starting
+    after `after_id`. With include_history each line also carries the note's
+    version history under 'history'.
+    """
+    queryset = Notes.get_shared_with(user).order_by('id')
+    if after_id is not None:
+        queryset = queryset.filter(id__gt=after_id)
+    notes = queryset.values(*NOTE_FIELDS).iterator(chunk_size=chunk_size)
+
+    encoder = JSONEncoder(ensure_ascii=False)
+    # Users and roles are serialized once for the whole export
+    memo = Memo()
+    while True:
+        chunk = list(islice(notes, chunk_size))
+        if not chunk:
+            return
+        history = _history_by_note([note['id'] for note in chunk]) if include_history else None
+        for data in serialize_notes(chunk, memo):
+            if history is not None:
+                data['history'] = NotesAuditSerializer(history[data['id']], many=True).data
+            yield encoder.encode(data) + '\n'
@@ -0,0 +1,77 @@
+"""
+Read-only fast paths producing the same JSON as NoteSerializer and
+NoteShareSerializer1 for large result sets. A page of notes costs three queries
+(the notes, their shares, the users involved) and no serializer instances.
+"""
+from collections import defaultdict
+
+from notes_management.timing import timed
+from user_app.fast_serializers import Memo, datetime_representation
+from .models import NotesUser
+
+
+NOTE_FIELDS = ('id', 'created_by_id', 'modified_by_id', 'created_at', 'modified_at', 'is_active', 'is_deleted',
+               'note_content', 'note_type')
+SHARE_FIELDS = ('id', 'user_id', 'created_at', 'modified_at', 'is_active', 'is_deleted', 'can_read', 'can_edit',
+                'can_delete', 'notes_id')
+
+
+def share_representation(row, memo):
+    return {
+        'id': row['id'],
+        'user': memo.user(row['user_id']),
+        'created_at': datetime_representation(row['created_at']),
+        'modified_at': datetime_representation(row['modified_at']),
+        'is_active': row['is_active'],
+        'is_deleted': row['is_deleted'],
+        'can_read': row['can_read'],
+        'can_edit': row['can_edit'],
+        'can_delete': row['can_delete'],
+        'notes': row['notes_id'],
+    }
+
+
+@timed('serialize')
+def serialize_note_shares(queryset, memo=None):
+    """
+    NoteShareSerializer1(queryset, many=True).data
+    """
+    memo = memo or Memo()
+    rows = list(queryset.values(*SHARE_FIELDS))
+    memo.load_users(row['user_id'] for row in rows)
+    return [share_representation(row, memo) for row in rows]
+
+
+def _note_row(note):
+    return note if isinstance(note, dict) else {field: getattr(note, field) for field in NOTE_FIELDS}
+
+
+@timed('serialize')
+def serialize_notes(notes, memo=None):
+    """
+    NoteSerializer(notes, many=True).data for Notes instances or .values(*NOTE_FIELDS) rows
+    """
+    memo = memo or Memo()
+    rows = [_note_row(note) for note in notes]
+    shares = defaultdict(list)
+    for share in NotesUser.objects.filter(notes_id__in=[row['id'] for row in rows]).order_by('id').values(*SHARE_FIELDS):
+        shares[share['notes_id']].append(share)
+
+    user_ids = {share['user_id'] for note_shares in shares.values() for share in note_shares}
+    for row in rows:
+        user_ids.update((row['created_by_id'], row['modified_by_id']))
+    memo.load_users(user_ids)
+
+    return [{
+        'id': row['id'],
+        'created_by': memo.user(row['created_by_id']),
+        'modified_by': memo.user(row['modified_by_id']),
+        'notes_user': [share_representation(share, memo) for share in shares[row['id']]],
+        'created_at': datetime_representation(row['created_at']),
+        'modified_at': datetime_representation(row['modified_at']),
+        'is_active': row['is_active'],
+        'is_deleted': row['is_deleted'],
+        'note_content': row['note_content'],
+        'note_type': row['note_type'],
+        'users': sorted({share['user_id'] for share in shares[row['id']]}),
+    } for row in rows]
@@ -0,0 +1,52 @@
+"""
+"Shared with me" feed: the notes a user can read, most recently modified first.
+It backs the notes listing and the feed endpoint. Every share carries a copy of
+its note's modified_at, kept in step by the signals, so a page is a range scan
+of the (user, -note_modified_at, -notes) index over the user's shares, plus one
+over the (role, ...) index for the user's role, whatever the number of notes
+shared with the user. In exchange an edit updates one row per share of the
+note, a role share standing for all of the role's members.
+"""
+from .models import NotesRole, NotesUser
+
+
+def _share_querysets(user):
+    querysets = [NotesUser.objects.active().filter(user=user, can_read=True)]
+    if user.role_id:
+        querysets.append(NotesRole.granted_to(user.role_id).filter(can_read=True))
+    # The notes come with their shares, looked up by primary key while walking the index
+    return [queryset.filter(notes__is_active=True, notes__is_deleted=False).select_related('notes')
+            for queryset in querysets]
+
+
+def _set_page(paginator, shares):
+    # Each list is already the requested window of its index; merge them in the same direction
+    backwards = paginator.cursor is not None and paginator.cursor[0]
+    shares.sort(key=lambda share: (share.note_modified_at, share.notes_id), reverse=not backwards)
+    unique_shares, seen = [], set()
+    for share in shares:
+        # A note shared with both the user and their role
+        if share.notes_id not in seen:
+            seen.add(share.notes_id)
+            unique_shares.append(share)
+    return [share.notes for share in paginator.set_page(unique_shares[:paginator.page_size + 1])]
+
+
+def get_feed_page(user, paginator, request):
+    """
+    The notes of the feed page `paginator` (a NotesFeedPagination) was asked for
+    """
+    shares = []
+    for queryset in _share_querysets(user):
+        shares += paginator.get_page_queryset(queryset, request)
+    return _set_page(paginator, shares)
+
+
+async def aget_feed_page(user, paginator, request):
+    """
+    get_feed_page for async views
+    """
+    shares = []
+    for queryset in _share_querysets(user):
+        shares += [share async for share in paginator.get_page_queryset(queryset, request)]
+    return _set_page(paginator, shares)
@@ -0,0 +1,75 @@
+"""
+Bulk import of notes from NDJSON, shared by NotesImportView and the import_notes
+command. Rows are validated a chunk at a time and every chunk is written with
+two bulk INSERTs (notes, then their owner shares) in its own transaction.
+"""
+import json
+import time
+from itertools import islice
+
+from django.db import transaction
+
+from . import acl
+from .models import ChangeSequence, Notes, NotesUser
+from .serializers import NoteImportSerializer
+
+
+def _numbered_lines(lines):
+    for line_number, line in enumerate(lines, start=1):
+        if line.strip():
+            yield line_number, line
+
+
+def _validate(line):
+    """
+    Return (validated_data, None) for a valid row and (None, errors) otherwise
+    """
+    try:
+        data = json.loads(line)
+    except ValueError as error:
+        return None, {'non_field_errors': [f'Invalid JSON: {error}']}
+    if not isinstance(data, dict):
+        return None, {'non_field_errors': ['Expected a JSON object.']}
+    serializer = NoteImportSerializer(data=data)
+    if not serializer.is_valid():
+        return None, serializer.errors
+    return serializer.validated_data, None
+
+
+def import_notes(lines, owner, chunk_size=1000, max_errors=1000):
+    """
+    Create one note owned by `owner` for every valid line. Returns a summary with
+    the number of imported and failed rows, the errors of the first `max_errors`
+    failed rows (by line number) and the throughput.
+    """
+    started = time.perf_counter()
+    summary = {'imported': 0, 'failed': 0, 'errors': []}
+    rows = _numbered_lines(lines)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            break
+
+        notes = []
+        for line_number, line in chunk:
+            validated_data, errors = _validate(line)
+            if errors is None:
+                notes.append(Notes(created_by=owner, modified_by=owner, **validated_data))
+                continue
+            summary['failed'] += 1
+            if len(summary['errors']) < max_errors:
+                summary['errors'].append({'line': line_number, 'errors': errors})
+
+        with transaction.atomic():
+            Notes.objects.bulk_create(ChangeSequence.stamp(notes))
+            NotesUser.objects.bulk_create(ChangeSequence.stamp(
+                NotesUser(notes=note, user=owner, can_read=True, can_edit=True, can_delete=True,
+                          note_modified_at=note.modified_at) for note in notes))
+        # A lookup of one of these ids before it existed may have cached "not shared"
+        acl.invalidate_shares([(note.id, owner.id) for note in notes])
+        summary['imported'] += len(notes)
+
+    elapsed = time.perf_counter() - started
+    summary['seconds'] = round(elapsed, 3)
+    summary['notes_per_second'] = round(summary['imported'] / elapsed, 1) if elapsed else 0.0
+    return summary
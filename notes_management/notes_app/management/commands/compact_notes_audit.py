@@ -0,0 +1,69 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from notes_app.audit import get_keyframe_interval, materialize_audits
+from notes_app.delta import make_delta
+from notes_app.models import NotesAudit
+
+
+STORAGE_FIELDS = ['old_note_content', 'new_note_content', 'is_keyframe', 'chain_position', 'content_delta']
+
+
+def stored_size(audits):
+    return sum(len(audit.old_note_content) + len(audit.new_note_content) + len(audit.content_delta or '')
+               for audit in audits)
+
+
+class Command(BaseCommand):
+    help = "Rewrite existing NotesAudit rows as keyframes plus deltas, or back to full rows with --expand."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--expand', action='store_true', help="Store every row with its full content again.")
+        parser.add_argument('--interval', type=int, help="Rows per keyframe. Defaults to NOTES_AUDIT_KEYFRAME_INTERVAL.")
+        parser.add_argument('--note', type=int, action='append', dest='notes', help="Only rewrite this note. Repeatable.")
+
+    def handle(self, *args, **options):
+        interval = options['interval'] or get_keyframe_interval()
+        note_ids = options['notes'] or list(NotesAudit.objects.order_by('notes_id').values_list('notes_id', flat=True).distinct())
+
+        total_rows = size_before = size_after = 0
+        for note_id in note_ids:
+            with transaction.atomic():
+                audits = list(NotesAudit.objects.select_for_update().filter(notes_id=note_id).order_by('id'))
+                size_before += stored_size(audits)
+                materialize_audits(audits)
+                if options['expand']:
+                    self.expand(audits)
+                else:
+                    self.compact(audits, interval)
+                NotesAudit.objects.bulk_update(audits, STORAGE_FIELDS, batch_size=500)
+                size_after += stored_size(audits)
+                total_rows += len(audits)
+
+        if options['verbosity']:
+            self.stdout.write(f"Rewrote {total_rows} audit rows of {len(note_ids)} notes: "
+                              f"{size_before} -> {size_after} characters of content stored.")
+
+    def expand(self, audits):
+        for audit in audits:
+            audit.is_keyframe = True
+            audit.chain_position = 0
+            audit.content_delta = None
+
+    def compact(self, audits, interval):
+        previous_content = None
+        position = 0
+        for audit in audits:
+            old_content, new_content = audit.old_note_content, audit.new_note_content
+            # A row only joins the chain when it continues from the previous row's content
+            if old_content == previous_content and position + 1 < interval:
+                position += 1
+                audit.is_keyframe = False
+                audit.content_delta = make_delta(old_content, new_content)
+                audit.old_note_content = audit.new_note_content = ''
+            else:
+                position = 0
+                audit.is_keyframe = True
+                audit.content_delta = None
+            audit.chain_position = position
+            previous_content = new_content
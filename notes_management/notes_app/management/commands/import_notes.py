@@ -0,0 +1,36 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from notes_app.importer import import_notes
+from user_app.models import User
+
+
+class Command(BaseCommand):
+    help = "Import notes from an NDJSON file (one JSON object with note_content and note_type per line)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="NDJSON file to import, or - for standard input.")
+        parser.add_argument('--owner', required=True, help="Username of the user who will own the imported notes.")
+        parser.add_argument('--chunk-size', type=int, default=1000, help="Rows validated and inserted per transaction.")
+
+    def handle(self, *args, **options):
+        try:
+            owner = User.objects.active().get(username=options['owner'])
+        except User.DoesNotExist:
+            raise CommandError(f"User {options['owner']!r} does not exist.")
+
+        if options['path'] == '-':
+            summary = import_notes(sys.stdin, owner, chunk_size=options['chunk_size'])
+        else:
+            try:
+                with open(options['path'], encoding='utf-8') as lines:
+                    summary = import_notes(lines, owner, chunk_size=options['chunk_size'])
+            except OSError as error:
+                raise CommandError(str(error))
+
+        for error in summary['errors']:
+            self.stderr.write(f"line {error['line']}: {dict(error['errors'])}")
+        if options['verbosity']:
+            self.stdout.write(f"Imported {summary['imported']} notes, {summary['failed']} failed, "
+                              f"in {summary['seconds']}s ({summary['notes_per_second']} notes/s).")
@@ -0,0 +1,76 @@
+from datetime import timezone as dt_timezone
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from notes_app.seeding import Distribution, seed_notes, seed_users
+from user_app.models import Role, User
+
+
+def reference_time(value):
+    try:
+        parsed = parse_datetime(value)
+    except ValueError:
+        parsed = None
+    if parsed is None:
+        raise CommandError(f"Invalid reference time {value!r}, expected an ISO 8601 datetime.")
+    return parsed if timezone.is_aware(parsed) else timezone.make_aware(parsed, dt_timezone.utc)
+
+
+def distribution(spec):
+    try:
+        return Distribution(spec)
+    except ValueError as error:
+        raise CommandError(str(error))
+
+
+class Command(BaseCommand):
+    help = ("Bulk-generate users, roles, notes, shares and version history for benchmarks. "
+            "Distributions are N, fixed:N, uniform:LOW-HIGH, poisson:MEAN or lognormal:MEDIAN,SIGMA.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000, help="Users to create.")
+        parser.add_argument('--roles', type=int, default=10, help="Roles to create.")
+        parser.add_argument('--notes', type=int, default=10000, help="Notes to create.")
+        parser.add_argument('--note-words', default='lognormal:60,1.0', help="Words per note.")
+        parser.add_argument('--shares', default='poisson:2', help="Users every note is shared with besides its owner.")
+        parser.add_argument('--edits', default='poisson:3', help="Edits in the version history of every note.")
+        parser.add_argument('--seed', type=int, default=0, help="Runs with the same seed and options create the same data.")
+        parser.add_argument('--reference-time', help="ISO 8601 time the generated history leads up to. "
+                                                     "Defaults to a fixed date, so runs can be repeated.")
+        parser.add_argument('--prefix', default='seed', help="Prefix of the generated usernames and role names.")
+        parser.add_argument('--password', default='Welcome@123', help="Password of every generated user.")
+        parser.add_argument('--chunk-size', type=int, default=1000, help="Notes generated and inserted per transaction.")
+        parser.add_argument('--workers', type=int, default=1, help="Processes generating notes.")
+
+    def handle(self, *args, **options):
+        prefix = options['prefix']
+        if options['users'] < 1:
+            raise CommandError("At least one user is needed to own the notes.")
+        if options['roles'] and len(f"{prefix}-role-{options['roles'] - 1}") > Role._meta.get_field('name').max_length:
+            raise CommandError(f"Prefix {prefix!r} is too long for role names.")
+        if User.objects.filter(username__startswith=f'{prefix}-user-').exists() or \
+                Role.objects.filter(name__startswith=f'{prefix}-role-').exists():
+            raise CommandError(f"Data with prefix {prefix!r} exists already; pass another --prefix.")
+        generation_options = {
+            'note_words': distribution(options['note_words']),
+            'shares': distribution(options['shares']),
+            'edits': distribution(options['edits']),
+        }
+        started_at = reference_time(options['reference_time']) if options['reference_time'] else None
+
+        user_ids = seed_users(options['seed'], options['users'], options['roles'], options['password'], prefix)
+        if options['verbosity']:
+            self.stdout.write(f"Created {len(user_ids)} users and {options['roles']} roles.")
+
+        def progress(summary):
+            if options['verbosity'] > 1:
+                self.stdout.write(f"{summary['notes']}/{options['notes']} notes")
+
+        summary = seed_notes(user_ids, options['notes'], generation_options, seed=options['seed'],
+                             chunk_size=options['chunk_size'], workers=options['workers'], progress=progress,
+                             reference_time=started_at)
+        if options['verbosity']:
+            self.stdout.write(f"Created {summary['notes']} notes, {summary['shares']} shares and {summary['audits']} "
+                              f"audit rows in {summary['seconds']}s ({summary['rows_per_second']} rows/s).")
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.10 on 2026-10-18 14:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes_app', '0005_alter_notesaudit_created_at'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='notes',
+            index=models.Index(fields=['-modified_at', '-id'], name='notes_modified_id_idx'),
+        ),
+    ]
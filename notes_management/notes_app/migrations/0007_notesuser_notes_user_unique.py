@@ -0,0 +1,27 @@
+# Generated by Django 4.2.10 on 2026-10-18 14:54
+
+from django.db import migrations, models
+from django.db.models import Count, Max
+
+
+def remove_duplicate_shares(apps, schema_editor):
+    # Keep the most recent share row for every (notes, user) pair
+    NotesUser = apps.get_model('notes_app', 'NotesUser')
+    duplicates = NotesUser.objects.values('notes_id', 'user_id').annotate(keep_id=Max('id'), total=Count('id')).filter(total__gt=1)
+    for row in duplicates:
+        NotesUser.objects.filter(notes_id=row['notes_id'], user_id=row['user_id']).exclude(id=row['keep_id']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes_app', '0006_notes_modified_id_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_shares, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='notesuser',
+            constraint=models.UniqueConstraint(fields=('notes', 'user'), name='notesuser_notes_user_unique'),
+        ),
+    ]
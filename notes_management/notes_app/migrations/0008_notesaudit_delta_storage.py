@@ -0,0 +1,28 @@
+# Generated by Django 4.2.10 on 2026-10-18 14:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes_app', '0007_notesuser_notes_user_unique'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notesaudit',
+            name='chain_position',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='notesaudit',
+            name='content_delta',
+            field=models.TextField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='notesaudit',
+            name='is_keyframe',
+            field=models.BooleanField(default=True),
+        ),
+    ]
@@ -0,0 +1,76 @@
+# Full-text index over active notes. SQLite only; see notes_app.search.
+# The SQL is a copy of what notes_app.search held when this migration was
+# written, so later changes to that module do not change this migration.
+
+from django.db import migrations
+
+
+CREATE_INDEX_SQL = """
+    CREATE VIRTUAL TABLE notes_app_notes_fts USING fts5(
+        note_content, content='notes_app_notes', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+    )
+"""
+
+TRIGGERS_SQL = [
+    """
+    CREATE TRIGGER IF NOT EXISTS notes_app_notes_fts_insert AFTER INSERT ON notes_app_notes
+    WHEN new.is_active AND NOT new.is_deleted
+    BEGIN
+        INSERT INTO notes_app_notes_fts(rowid, note_content) VALUES (new.id, new.note_content);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS notes_app_notes_fts_delete AFTER DELETE ON notes_app_notes
+    WHEN old.is_active AND NOT old.is_deleted
+    BEGIN
+        INSERT INTO notes_app_notes_fts(notes_app_notes_fts, rowid, note_content) VALUES ('delete', old.id, old.note_content);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS notes_app_notes_fts_update AFTER UPDATE OF note_content, is_active, is_deleted ON notes_app_notes
+    WHEN old.note_content IS NOT new.note_content OR old.is_active IS NOT new.is_active OR old.is_deleted IS NOT new.is_deleted
+    BEGIN
+        INSERT INTO notes_app_notes_fts(notes_app_notes_fts, rowid, note_content)
+            SELECT 'delete', old.id, old.note_content WHERE old.is_active AND NOT old.is_deleted;
+        INSERT INTO notes_app_notes_fts(rowid, note_content)
+            SELECT new.id, new.note_content WHERE new.is_active AND NOT new.is_deleted;
+    END
+    """,
+]
+
+POPULATE_INDEX_SQL = """
+    INSERT INTO notes_app_notes_fts(rowid, note_content)
+        SELECT id, note_content FROM notes_app_notes WHERE is_active AND NOT is_deleted
+"""
+
+DROP_SQL = [
+    "DROP TRIGGER IF EXISTS notes_app_notes_fts_update",
+    "DROP TRIGGER IF EXISTS notes_app_notes_fts_delete",
+    "DROP TRIGGER IF EXISTS notes_app_notes_fts_insert",
+    "DROP TABLE IF EXISTS notes_app_notes_fts",
+]
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for statement in [CREATE_INDEX_SQL, *TRIGGERS_SQL, POPULATE_INDEX_SQL]:
+        schema_editor.execute(statement)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for statement in DROP_SQL:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes_app', '0008_notesaudit_delta_storage'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.10 on 2026-10-18 15:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes_app', '0009_notes_fts'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='notes',
+            name='notes_modified_id_idx',
+        ),
+        migrations.AddIndex(
+            model_name='notes',
+            index=models.Index(condition=models.Q(('is_active', True), ('is_deleted', False)), fields=['-modified_at', '-id'], name='notes_active_modified_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notesaudit',
+            index=models.Index(condition=models.Q(('is_active', True), ('is_deleted', False)), fields=['notes', '-created_at'], name='notesaudit_active_notes_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notesuser',
+            index=models.Index(condition=models.Q(('is_active', True), ('is_deleted', False)), fields=['user', 'notes', 'can_read'], name='notesuser_user_active_idx'),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 4.2.10 on 2026-10-18 15:45
+
+from django.db import migrations, models
+from django.db.models import F, Max
+
+
+def number_existing_rows(apps, schema_editor):
+    # Every existing note and share gets its own change_seq: notes first, then shares
+    ChangeSequence = apps.get_model('notes_app', 'ChangeSequence')
+    Notes = apps.get_model('notes_app', 'Notes')
+    NotesUser = apps.get_model('notes_app', 'NotesUser')
+    last_note_id = Notes.objects.aggregate(last_id=Max('id'))['last_id'] or 0
+    last_share_id = NotesUser.objects.aggregate(last_id=Max('id'))['last_id'] or 0
+    Notes.objects.update(change_seq=F('id'))
+    NotesUser.objects.update(change_seq=F('id') + last_note_id)
+    ChangeSequence.objects.create(pk=1, value=last_note_id + last_share_id)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes_app', '0010_soft_delete_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('value', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='notes',
+            name='change_seq',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='notesuser',
+            name='change_seq',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.RunPython(number_existing_rows, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='notes',
+            index=models.Index(fields=['change_seq'], name='notes_change_seq_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notesuser',
+            index=models.Index(fields=['user', 'change_seq'], name='notesuser_user_change_seq_idx'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 4.2.10 on 2026-10-18 15:49
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_existing_audits(apps, schema_editor):
+    Notes = apps.get_model('notes_app', 'Notes')
+    NotesAudit = apps.get_model('notes_app', 'NotesAudit')
+    audit_counts = (NotesAudit.objects.filter(notes_id=OuterRef('pk'), is_active=True, is_deleted=False)
+                    .order_by().values('notes_id').annotate(count=Count('id')).values('count'))
+    Notes.objects.update(audit_count=Coalesce(Subquery(audit_counts), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes_app', '0011_change_sequence'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='notesaudit',
+            name='notesaudit_active_notes_idx',
+        ),
+        migrations.AddField(
+            model_name='notes',
+            name='audit_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(count_existing_audits, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='notesaudit',
+            index=models.Index(condition=models.Q(('is_active', True), ('is_deleted', False)), fields=['notes', '-created_at', '-id'], name='notesaudit_active_notes_idx'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 4.2.10 on 2026-10-18 15:55
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user_app', '0003_soft_delete_indexes'),
+        ('notes_app', '0012_notes_audit_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotesRole',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('modified_at', models.DateTimeField(auto_now=True)),
+                ('is_active', models.BooleanField(default=True)),
+                ('is_deleted', models.BooleanField(default=False)),
+                ('change_seq', models.BigIntegerField(default=0)),
+                ('can_read', models.BooleanField(default=True)),
+                ('can_edit', models.BooleanField(default=False)),
+                ('can_delete', models.BooleanField(default=False)),
+                ('notes', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='notes_role', to='notes_app.notes')),
+                ('role', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='role_notes', to='user_app.role')),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('is_active', True), ('is_deleted', False)), fields=['role', 'notes', 'can_read'], name='notesrole_role_active_idx'), models.Index(fields=['role', 'change_seq'], name='notesrole_role_change_seq_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='notesrole',
+            constraint=models.UniqueConstraint(fields=('notes', 'role'), name='notesrole_notes_role_unique'),
+        ),
+    ]
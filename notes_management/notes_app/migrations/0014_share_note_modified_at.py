@@ -0,0 +1,41 @@
+# Generated by Django 4.2.10 on 2026-10-18 15:58
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+import django.utils.timezone
+
+
+def copy_note_modified_at(apps, schema_editor):
+    Notes = apps.get_model('notes_app', 'Notes')
+    for model_name in ('NotesUser', 'NotesRole'):
+        model = apps.get_model('notes_app', model_name)
+        model.objects.update(note_modified_at=Subquery(Notes.objects.filter(pk=OuterRef('notes_id')).values('modified_at')[:1]))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes_app', '0013_notes_role'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notesrole',
+            name='note_modified_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='notesuser',
+            name='note_modified_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.RunPython(copy_note_modified_at, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='notesrole',
+            index=models.Index(condition=models.Q(('is_active', True), ('is_deleted', False), ('can_read', True)), fields=['role', '-note_modified_at', '-notes'], name='notesrole_role_feed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notesuser',
+            index=models.Index(condition=models.Q(('is_active', True), ('is_deleted', False), ('can_read', True)), fields=['user', '-note_modified_at', '-notes'], name='notesuser_user_feed_idx'),
+        ),
+    ]
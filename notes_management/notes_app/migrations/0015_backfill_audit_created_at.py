@@ -0,0 +1,19 @@
+from django.db import migrations
+from django.db.models import F
+
+
+def backfill_created_at(apps, schema_editor):
+    # Audit rows used to copy the note's creation time; modified_at (auto_now) is when they were written
+    NotesAudit = apps.get_model('notes_app', 'NotesAudit')
+    NotesAudit.objects.filter(created_at=F('notes__created_at')).update(created_at=F('modified_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes_app', '0014_share_note_modified_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_created_at, migrations.RunPython.noop),
+    ]
@@ -1,5 +1,8 @@
-from django.db import models
-from user_app.models import User
+from django.db import connection, models, transaction
+from django.utils import timezone
+from django.db.models import F, Q
+from notes_management.managers import SoftDeleteManager
+from user_app.models import ACTIVE_CONDITION, Role, User
 # Create your models here.
 
 class AuditModel(models.Model):
@@ -10,31 +13,233 @@ class AuditModel(models.Model):
     modified_at = models.DateTimeField(auto_now=True)
     is_active = models.BooleanField(default=True)
     is_deleted = models.BooleanField(default=False)
+
+    objects = SoftDeleteManager()
     
     class Meta:
         abstract = True
 
 
-class Notes(AuditModel):
+class ChangeSequence(models.Model):
+    """
+    Single row counter behind change_seq. Values are taken inside the
+    transaction writing them and the row stays locked until it commits, so a
+    higher change_seq is never visible before a lower one. The price is one
+    more statement per tracked write, and writers of tracked rows taking turns
+    on the counter row until they commit: writes to notes and shares are
+    serialized, which caps their throughput at one transaction per commit
+    latency. Only the tables of the changes feed (notes and their shares) are
+    stamped, and save() takes the value right before the row is written, so
+    the pre_save work (audit rows and their deltas) runs before the lock.
+    """
+    value = models.BigIntegerField(default=0)
+
+    @classmethod
+    def allocate(cls, count=1):
+        """
+        Reserve `count` consecutive values and return the first one. A single
+        UPDATE ... RETURNING where the backend has it, otherwise an UPDATE and a SELECT.
+        """
+        value = cls._increment(count)
+        if value is None:
+            cls.objects.get_or_create(pk=1)
+            value = cls._increment(count)
+        return value - count + 1
+
+    @classmethod
+    def _increment(cls, count):
+        # MariaDB has INSERT ... RETURNING but not UPDATE ... RETURNING
+        if connection.vendor not in ('postgresql', 'sqlite') or not connection.features.can_return_columns_from_insert:
+            if not cls.objects.filter(pk=1).update(value=F('value') + count):
+                return None
+            return cls.objects.values_list('value', flat=True).get(pk=1)
+
+        quote_name = connection.ops.quote_name
+        table, value = quote_name(cls._meta.db_table), quote_name('value')
+        with connection.cursor() as cursor:
+            cursor.execute(f'UPDATE {table} SET {value} = {value} + %s WHERE {quote_name("id")} = 1 RETURNING {value}', [count])
+            row = cursor.fetchone()
+        return row[0] if row else None
+
+    @classmethod
+    def current(cls):
+        return cls.objects.filter(pk=1).values_list('value', flat=True).first() or 0
+
+    @classmethod
+    def stamp(cls, instances):
+        """
+        Give unsaved or bulk-written rows their change_seq, in order
+        """
+        instances = list(instances)
+        if instances:
+            first = cls.allocate(len(instances))
+            for offset, instance in enumerate(instances):
+                instance.change_seq = first + offset
+        return instances
+
+
+class ChangeSeqField(models.BigIntegerField):
+    """
+    change_seq column. When save() asks for it, takes the next value of
+    ChangeSequence as the row is written, after the pre_save receivers ran.
+    """
+
+    def pre_save(self, model_instance, add):
+        if model_instance.__dict__.pop('_allocate_change_seq', False):
+            ChangeSequence.stamp([model_instance])
+        return super().pre_save(model_instance, add)
+
+    def deconstruct(self):
+        # Same column as a BigIntegerField, nothing to migrate
+        name, path, args, kwargs = super().deconstruct()
+        return name, 'django.db.models.BigIntegerField', args, kwargs
+
+
+class ChangeTrackedModel(AuditModel):
+    """
+    Rows carrying the change_seq of their last write, see ChangeSequence.
+    save() stamps it; bulk writes have to call ChangeSequence.stamp.
+    """
+    change_seq = ChangeSeqField(default=0)
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, update_fields=None, **kwargs):
+        if update_fields is not None:
+            update_fields = {*update_fields, 'change_seq'}
+        with transaction.atomic(savepoint=False):
+            self._allocate_change_seq = True
+            try:
+                super().save(*args, update_fields=update_fields, **kwargs)
+            finally:
+                self.__dict__.pop('_allocate_change_seq', None)
+
+
+class Notes(ChangeTrackedModel):
     note_content = models.TextField()
     note_type = models.CharField(max_length=20, default="text")
     users = models.ManyToManyField(User, through='NotesUser', related_name='notes')
     created_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='note_creator')
     modified_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='note_modifier')
+    # Number of NotesAudit rows, incremented with F() as they are written
+    audit_count = models.PositiveIntegerField(default=0)
 
+    # Fields whose changes are recorded in NotesAudit
+    TRACKED_FIELDS = ('note_content', 'note_type')
+    # Fields only ever changed with F() updates; save() must not write back a stale value
+    COUNTER_FIELDS = ('audit_count', )
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-modified_at', '-id'], condition=ACTIVE_CONDITION, name='notes_active_modified_idx'),
+            models.Index(fields=['change_seq'], name='notes_change_seq_idx'),
+        ]
+
+    def save(self, *args, update_fields=None, **kwargs):
+        if update_fields is None and not self._state.adding:
+            update_fields = [field.name for field in self._meta.concrete_fields
+                             if not field.primary_key and field.name not in self.COUNTER_FIELDS]
+        super().save(*args, update_fields=update_fields, **kwargs)
 
     @classmethod
     def get_active(self):
-        active_objects = Notes.objects.filter(is_active=True, is_deleted=False)
+        active_objects = Notes.objects.active()
         return active_objects
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = {field: value for field, value in zip(field_names, values)
+                                   if field in cls.TRACKED_FIELDS and value is not models.DEFERRED}
+        return instance
+
+    def get_loaded_values(self):
+        """
+        Tracked field values as last read from or written to the database.
+        None when they are unknown, e.g. the instance was built by hand or had them deferred.
+        """
+        loaded_values = getattr(self, '_loaded_values', {})
+        if len(loaded_values) != len(self.TRACKED_FIELDS):
+            return None
+        return loaded_values
+
+    def reset_loaded_values(self):
+        self._loaded_values = {field: getattr(self, field) for field in self.TRACKED_FIELDS}
+
+    @classmethod
+    def get_shared_with(self, user):
+        """
+        Active notes the user can read through an active NotesUser share, or
+        through a NotesRole share of the user's role
+        """
+        if not user.role_id:
+            shared_objects = Notes.get_active().filter(notes_user__user=user, notes_user__can_read=True,
+                                                       notes_user__is_active=True, notes_user__is_deleted=False)
+            return shared_objects
+        shared_with_user = NotesUser.objects.active().filter(user=user, can_read=True).values('notes_id')
+        shared_with_role = NotesRole.granted_to(user.role_id).filter(can_read=True).values('notes_id')
+        return Notes.get_active().filter(Q(id__in=shared_with_user) | Q(id__in=shared_with_role))
+
+
+# Shares that let their principal read the note; the feed indexes are limited to them
+READABLE_SHARE_CONDITION = ACTIVE_CONDITION & models.Q(can_read=True)
+
 
-class NotesUser(AuditModel):
+class NotesUser(ChangeTrackedModel):
     notes = models.ForeignKey(Notes, on_delete=models.CASCADE, related_name='notes_user')
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='user_notes')
     can_read = models.BooleanField(default=True)
     can_edit = models.BooleanField(default=False)
     can_delete = models.BooleanField(default=False)
+    # Copy of notes.modified_at, kept in step by the signals, for the feed
+    note_modified_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['notes', 'user'], name='notesuser_notes_user_unique'),
+        ]
+        indexes = [
+            # Notes shared with a user; the permission lookup uses the unique (notes, user) index
+            models.Index(fields=['user', 'notes', 'can_read'], condition=ACTIVE_CONDITION, name='notesuser_user_active_idx'),
+            # Changes to the shares of a user, for the changes feed
+            models.Index(fields=['user', 'change_seq'], name='notesuser_user_change_seq_idx'),
+            # Notes shared with a user, most recently modified first
+            models.Index(fields=['user', '-note_modified_at', '-notes'], condition=READABLE_SHARE_CONDITION,
+                         name='notesuser_user_feed_idx'),
+        ]
+
+
+class NotesRole(ChangeTrackedModel):
+    """
+    Share of a note with every member of a role. A user's permissions on a note
+    are those of their own share and their role's share combined.
+    """
+    notes = models.ForeignKey(Notes, on_delete=models.CASCADE, related_name='notes_role')
+    role = models.ForeignKey(Role, on_delete=models.CASCADE, related_name='role_notes')
+    can_read = models.BooleanField(default=True)
+    can_edit = models.BooleanField(default=False)
+    can_delete = models.BooleanField(default=False)
+    note_modified_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['notes', 'role'], name='notesrole_notes_role_unique'),
+        ]
+        indexes = [
+            # Notes shared with a role; the permission lookup uses the unique (notes, role) index
+            models.Index(fields=['role', 'notes', 'can_read'], condition=ACTIVE_CONDITION, name='notesrole_role_active_idx'),
+            models.Index(fields=['role', 'change_seq'], name='notesrole_role_change_seq_idx'),
+            models.Index(fields=['role', '-note_modified_at', '-notes'], condition=READABLE_SHARE_CONDITION,
+                         name='notesrole_role_feed_idx'),
+        ]
+
+    @classmethod
+    def granted_to(cls, role_id):
+        """
+        Active shares of the role, while the role itself is active
+        """
+        return cls.objects.active().filter(role_id=role_id, role__is_active=True, role__is_deleted=False)
 
 
 class NotesAudit(AuditModel):
@@ -44,4 +249,16 @@ class NotesAudit(AuditModel):
     new_note_content = models.TextField()
     old_note_type = models.CharField(max_length=20)
     new_note_type = models.CharField(max_length=20)
-    created_at = models.DateTimeField()
\ No newline at end of file
+    created_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            # History pages of a note, newest first; id breaks ties between rows of the same time
+            models.Index(fields=['notes', '-created_at', '-id'], condition=ACTIVE_CONDITION, name='notesaudit_active_notes_idx'),
+        ]
+
+    # Delta storage: keyframes keep the full old/new content, the rows after one
+    # keep only content_delta against the previous row's new content.
+    is_keyframe = models.BooleanField(default=True)
+    chain_position = models.PositiveIntegerField(default=0)
+    content_delta = models.TextField(null=True, blank=True)
\ No newline at end of file
@@ -0,0 +1,143 @@
+from base64 import b64decode, b64encode
+from datetime import datetime
+
+from django.db.models import Q
+from drf_yasg import openapi
+from rest_framework import status
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from .audit import get_keyframe_interval, get_storage_mode
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination on a (timestamp, id) keyset, newest first.
+    Every page is a single indexed range scan, so the cost of a page does not
+    grow with how deep the client has paged.
+    """
+    ordering = ('modified_at', 'id')
+    page_size = 50
+    max_page_size = 200
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+    detail = 'Success'
+    # Rows read past the end of a page when paging forward, kept as lookahead_rows
+    lookahead = 0
+
+    cursor_parameter = openapi.Parameter('cursor', openapi.IN_QUERY, type=openapi.TYPE_STRING,
+                                         description='Opaque cursor taken from the next/previous link.')
+    page_size_parameter = openapi.Parameter('page_size', openapi.IN_QUERY, type=openapi.TYPE_INTEGER,
+                                            description='Number of results per page (max 200).')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.set_page(list(self.get_page_queryset(queryset, request)))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        return self.set_page([instance async for instance in self.get_page_queryset(queryset, request)])
+
+    def get_page_queryset(self, queryset, request):
+        """
+        The ordered and filtered slice holding the requested page plus one row,
+        which tells whether there is a page after it.
+        """
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.cursor = self.decode_cursor(request)
+
+        time_field, id_field = self.ordering
+        forward = self.cursor is None or not self.cursor[0]
+        if forward:
+            queryset = queryset.order_by('-' + time_field, '-' + id_field)
+        else:
+            queryset = queryset.order_by(time_field, id_field)
+
+        if self.cursor is not None:
+            reverse, position, pk = self.cursor
+            if reverse:
+                queryset = queryset.filter(Q(**{time_field + '__gt': position}) |
+                                           Q(**{time_field: position, id_field + '__gt': pk}))
+            else:
+                queryset = queryset.filter(Q(**{time_field + '__lt': position}) |
+                                           Q(**{time_field: position, id_field + '__lt': pk}))
+
+        return queryset[:self.page_size + 1 + (self.lookahead if forward else 0)]
+
+    def set_page(self, results):
+        has_following = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        self.lookahead_rows = []
+
+        if self.cursor is not None and self.cursor[0]:
+            self.page.reverse()
+            self.has_next = True
+            self.has_previous = has_following
+        else:
+            self.has_next = has_following
+            self.has_previous = self.cursor is not None
+            self.lookahead_rows = results[self.page_size:]
+        return self.page
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(page_size, 1), self.max_page_size)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            reverse, position, pk = b64decode(encoded.encode('ascii')).decode('ascii').split('|')
+            return reverse == 'p', datetime.fromisoformat(position), int(pk)
+        except (TypeError, ValueError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, reverse, instance):
+        time_field, id_field = self.ordering
+        position = getattr(instance, time_field).isoformat()
+        raw = '|'.join(('p' if reverse else 'n', position, str(getattr(instance, id_field))))
+        encoded = b64encode(raw.encode('ascii')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        if not self.page:
+            # Paged backwards past the newest row; restart from the top.
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(False, self.page[-1])
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(True, self.page[0])
+
+    def get_paginated_response(self, data):
+        return Response({'status': status.HTTP_200_OK, 'detail': self.detail,
+                         'next': self.get_next_link(), 'previous': self.get_previous_link(),
+                         'data': data})
+
+
+class NotesHistoryPagination(KeysetPagination):
+    ordering = ('created_at', 'id')
+    detail = 'Note History successfully retrieved.'
+
+    def get_page_queryset(self, queryset, request):
+        # With delta storage the rows back to the keyframe of the page's oldest row come with the page
+        self.lookahead = get_keyframe_interval() - 1 if get_storage_mode() == 'delta' else 0
+        return super().get_page_queryset(queryset, request)
+
+
+class NotesFeedPagination(KeysetPagination):
+    """
+    Pages of share rows (NotesUser or NotesRole) by their copy of the note's
+    modified_at, as used by the notes listing and the feed
+    """
+    ordering = ('note_modified_at', 'notes_id')
@@ -0,0 +1,108 @@
+"""
+Read-through cache of serialized note payloads. Entries depend on version tokens
+of the note and of every user and role nested in the payload; saving any of them
+bumps its token, so stale entries are never served and never have to be found.
+"""
+from notes_management.cache import MISSING, get_cache
+from .models import Notes
+from .serializers import NoteSerializer
+
+
+def _responses_cache():
+    return get_cache('responses')
+
+
+def note_dependency(note_id):
+    return f'note:{note_id}'
+
+
+def user_dependency(user_id):
+    return f'user:{user_id}'
+
+
+def role_dependency(role_id):
+    return f'role:{role_id}'
+
+
+def _detail_dependencies(note):
+    users = [note.created_by, note.modified_by, *(share.user for share in note.notes_user.all())]
+    dependencies = {note_dependency(note.id)}
+    for user in users:
+        dependencies.add(user_dependency(user.id))
+        if user.role_id:
+            dependencies.add(role_dependency(user.role_id))
+    return dependencies
+
+
+def _detail_queryset(note_id):
+    return NoteSerializer.setup_eager_loading(Notes.objects.active()).filter(pk=note_id)
+
+
+def _plain(value):
+    # The serializer's ReturnDict keeps a reference to the serializer and its note
+    if isinstance(value, dict):
+        return {key: _plain(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_plain(item) for item in value]
+    return value
+
+
+def _store_detail(cache, key, note, versions):
+    if note is None:
+        return None
+    data = _plain(NoteSerializer(note).data)
+    cache.set(key, data, dependencies=_detail_dependencies(note), versions=versions)
+    return data
+
+
+async def _astore_detail(cache, key, note, versions):
+    if note is None:
+        return None
+    data = _plain(NoteSerializer(note).data)
+    await cache.aset(key, data, _detail_dependencies(note), versions)
+    return data
+
+
+def get_note_detail(note_id):
+    """
+    NoteSerializer payload of the active note, or None when there is no such note
+    """
+    cache = _responses_cache()
+    key = f'note-detail:{note_id}'
+    data = cache.get(key)
+    if data is not MISSING:
+        return data
+
+    # Read before the note so that a save racing with the queries below leaves the entry stale
+    versions = cache.get_versions(note_dependency(note_id))
+    return _store_detail(cache, key, _detail_queryset(note_id).first(), versions)
+
+
+async def aget_note_detail(note_id):
+    """
+    get_note_detail for async views; a cache miss is read with the async ORM
+    """
+    cache = _responses_cache()
+    key = f'note-detail:{note_id}'
+    data = await cache.aget(key)
+    if data is not MISSING:
+        return data
+
+    versions = await cache.aget_versions(note_dependency(note_id))
+    return await _astore_detail(cache, key, await _detail_queryset(note_id).afirst(), versions)
+
+
+def invalidate_notes(note_ids):
+    _responses_cache().bump(*(note_dependency(note_id) for note_id in note_ids))
+
+
+def invalidate_users(user_ids):
+    _responses_cache().bump(*(user_dependency(user_id) for user_id in user_ids))
+
+
+def invalidate_roles(role_ids):
+    _responses_cache().bump(*(role_dependency(role_id) for role_id in role_ids))
+
+
+def cache_stats():
+    return _responses_cache().stats()
@@ -0,0 +1,119 @@
+import re
+
+from django.db import connection
+
+
+INDEX_TABLE = 'notes_app_notes_fts'
+
+# Only active notes are indexed. The triggers keep the index in sync on every
+# write path (save, bulk_create, queryset updates), one row at a time.
+TRIGGERS_SQL = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS notes_app_notes_fts_insert AFTER INSERT ON notes_app_notes
+    WHEN new.is_active AND NOT new.is_deleted
+    BEGIN
+        INSERT INTO {INDEX_TABLE}(rowid, note_content) VALUES (new.id, new.note_content);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS notes_app_notes_fts_delete AFTER DELETE ON notes_app_notes
+    WHEN old.is_active AND NOT old.is_deleted
+    BEGIN
+        INSERT INTO {INDEX_TABLE}({INDEX_TABLE}, rowid, note_content) VALUES ('delete', old.id, old.note_content);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS notes_app_notes_fts_update AFTER UPDATE OF note_content, is_active, is_deleted ON notes_app_notes
+    WHEN old.note_content IS NOT new.note_content OR old.is_active IS NOT new.is_active OR old.is_deleted IS NOT new.is_deleted
+    BEGIN
+        INSERT INTO {INDEX_TABLE}({INDEX_TABLE}, rowid, note_content)
+            SELECT 'delete', old.id, old.note_content WHERE old.is_active AND NOT old.is_deleted;
+        INSERT INTO {INDEX_TABLE}(rowid, note_content)
+            SELECT new.id, new.note_content WHERE new.is_active AND NOT new.is_deleted;
+    END
+    """,
+]
+
+SEARCH_SQL = f"""
+    SELECT {INDEX_TABLE}.rowid, bm25({INDEX_TABLE}), snippet({INDEX_TABLE}, 0, '[', ']', '...', 16)
+    FROM {INDEX_TABLE}
+    INNER JOIN notes_app_notesuser ON notes_app_notesuser.notes_id = {INDEX_TABLE}.rowid
+    WHERE {INDEX_TABLE} MATCH %s
+        AND notes_app_notesuser.user_id = %s
+        AND notes_app_notesuser.can_read AND notes_app_notesuser.is_active AND NOT notes_app_notesuser.is_deleted
+    ORDER BY bm25({INDEX_TABLE})
+    LIMIT %s OFFSET %s
+"""
+
+# For users with a role: notes shared with the user or with their (active) role
+ROLE_SEARCH_SQL = f"""
+    SELECT {INDEX_TABLE}.rowid, bm25({INDEX_TABLE}), snippet({INDEX_TABLE}, 0, '[', ']', '...', 16)
+    FROM {INDEX_TABLE}
+    WHERE {INDEX_TABLE} MATCH %s
+        AND ({INDEX_TABLE}.rowid IN (
+                SELECT notes_id FROM notes_app_notesuser
+                WHERE user_id = %s AND can_read AND is_active AND NOT is_deleted)
+            OR {INDEX_TABLE}.rowid IN (
+                SELECT notes_app_notesrole.notes_id FROM notes_app_notesrole
+                INNER JOIN user_app_role ON user_app_role.id = notes_app_notesrole.role_id
+                WHERE notes_app_notesrole.role_id = %s AND notes_app_notesrole.can_read
+                    AND notes_app_notesrole.is_active AND NOT notes_app_notesrole.is_deleted
+                    AND user_app_role.is_active AND NOT user_app_role.is_deleted))
+    ORDER BY bm25({INDEX_TABLE})
+    LIMIT %s OFFSET %s
+"""
+
+WORD_PATTERN = re.compile(r'\w+')
+
+
+class SearchUnavailable(Exception):
+    pass
+
+
+def search_available(using_connection=connection):
+    if using_connection.vendor != 'sqlite':
+        return False
+    with using_connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [INDEX_TABLE])
+        return cursor.fetchone() is not None
+
+
+def install_triggers(using_connection=connection):
+    """
+    (Re)create the sync triggers. SQLite drops them whenever a migration rebuilds
+    notes_app_notes, so this also runs after every migrate.
+    """
+    if not search_available(using_connection):
+        return
+    with using_connection.cursor() as cursor:
+        for statement in TRIGGERS_SQL:
+            cursor.execute(statement)
+
+
+def build_match_query(text):
+    """
+    Turn free text into an FTS5 query: every word must match, the last one as a prefix
+    """
+    words = WORD_PATTERN.findall(text)
+    if not words:
+        return None
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def search_notes(user, text, limit, offset=0):
+    """
+    Ranked (note_id, rank, snippet) rows of the notes the user can read that match text
+    """
+    if connection.vendor != 'sqlite':
+        raise SearchUnavailable("Full-text search needs the SQLite FTS5 index.")
+    match_query = build_match_query(text)
+    if match_query is None:
+        return []
+    with connection.cursor() as cursor:
+        if user.role_id:
+            cursor.execute(ROLE_SEARCH_SQL, [match_query, user.id, user.role_id, limit, offset])
+        else:
+            cursor.execute(SEARCH_SQL, [match_query, user.id, limit, offset])
+        return cursor.fetchall()
@@ -0,0 +1,260 @@
+"""
+Synthetic data for benchmarks and capacity planning, used by the seed_notes
+command. Users are bulk created with one precomputed password hash. Notes,
+shares and version history are generated as plain rows and written with
+executemany, bypassing the ORM and the audit signal. Notes are generated in
+chunks with their own random stream derived from the seed, so the data is the
+same whatever the number of worker processes.
+"""
+import math
+import random
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta, timezone as dt_timezone
+from types import SimpleNamespace
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+
+from user_app.models import Role, User
+from .audit import prepare_audits
+from .models import ChangeSequence, Notes, NotesAudit, NotesUser
+
+
+WORDS = (
+    'agenda', 'budget', 'call', 'client', 'deadline', 'design', 'draft', 'email', 'estimate', 'feedback', 'follow',
+    'goal', 'idea', 'invoice', 'issue', 'launch', 'list', 'meeting', 'milestone', 'note', 'owner', 'plan', 'priority',
+    'project', 'question', 'release', 'report', 'review', 'risk', 'schedule', 'scope', 'sprint', 'status', 'summary',
+    'task', 'team', 'test', 'timeline', 'todo', 'update', 'vendor', 'version', 'weekly', 'workshop', 'the', 'a', 'for',
+    'with', 'before', 'after', 'and', 'to', 'on', 'about', 'next', 'new', 'open', 'done', 'check', 'send', 'prepare',
+)
+WORDS_PER_LINE = 12
+
+
+class Distribution:
+    """
+    Non-negative integer distribution parsed from a spec: 'N' or 'fixed:N',
+    'uniform:LOW-HIGH', 'poisson:MEAN' or 'lognormal:MEDIAN,SIGMA'.
+    """
+    KINDS = ('fixed', 'uniform', 'poisson', 'lognormal')
+
+    def __init__(self, spec):
+        kind, _, arguments = spec.partition(':') if ':' in spec else ('fixed', ':', spec)
+        if kind not in self.KINDS:
+            raise ValueError(f"Unknown distribution {kind!r}, expected one of {', '.join(self.KINDS)}.")
+        try:
+            if kind == 'uniform':
+                low, high = arguments.split('-')
+                self.parameters = (int(low), int(high))
+            elif kind == 'lognormal':
+                median, sigma = arguments.split(',')
+                self.parameters = (float(median), float(sigma))
+            else:
+                self.parameters = (float(arguments), )
+        except ValueError:
+            raise ValueError(f"Invalid {kind} distribution {spec!r}.")
+        self.kind = kind
+        self.spec = spec
+
+    def sample(self, rng):
+        if self.kind == 'fixed':
+            return int(self.parameters[0])
+        if self.kind == 'uniform':
+            return rng.randint(*self.parameters)
+        if self.kind == 'lognormal':
+            median, sigma = self.parameters
+            return max(0, round(rng.lognormvariate(math.log(median), sigma))) if median > 0 else 0
+        mean = self.parameters[0]
+        if mean > 30:
+            return max(0, round(rng.gauss(mean, math.sqrt(mean))))
+        # Knuth's method, fine for small means
+        limit, count, product = math.exp(-mean), 0, rng.random()
+        while product > limit:
+            count += 1
+            product *= rng.random()
+        return count
+
+    def __repr__(self):
+        return self.spec
+
+
+def _text(rng, words):
+    tokens = rng.choices(WORDS, k=max(1, words))
+    return '\n'.join(' '.join(tokens[start:start + WORDS_PER_LINE]) for start in range(0, len(tokens), WORDS_PER_LINE))
+
+
+def _edit(rng, lines):
+    index = rng.randrange(len(lines))
+    action = rng.random()
+    if action < 0.7:
+        words = lines[index].split(' ')
+        words[rng.randrange(len(words))] = rng.choice(WORDS)
+        lines[index] = ' '.join(words)
+    elif action < 0.9 or len(lines) == 1:
+        lines.insert(index + 1, ' '.join(rng.choices(WORDS, k=WORDS_PER_LINE)))
+    else:
+        del lines[index]
+    return '\n'.join(lines)
+
+
+NOTE_COLUMNS = ('id', 'created_at', 'modified_at', 'is_active', 'is_deleted', 'note_content', 'note_type',
+                'created_by_id', 'modified_by_id', 'audit_count', 'change_seq')
+SHARE_COLUMNS = ('created_at', 'modified_at', 'is_active', 'is_deleted', 'can_read', 'can_edit', 'can_delete',
+                 'notes_id', 'user_id', 'note_modified_at', 'change_seq')
+AUDIT_COLUMNS = ('created_at', 'modified_at', 'is_active', 'is_deleted', 'old_note_content', 'new_note_content',
+                 'old_note_type', 'new_note_type', 'is_keyframe', 'chain_position', 'content_delta', 'notes_id',
+                 'modified_by_id')
+
+# Notes are backdated by up to this many minutes; their edits fall in between
+MAX_NOTE_AGE_MINUTES = 60 * 24 * 365
+# Time the generated history leads up to, unless another one is given; fixed so that runs can be repeated
+REFERENCE_TIME = datetime(2024, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def generate_chunk(seed, chunk_index, first_note_id, count, user_ids, options, started_at):
+    """
+    Row tuples (NOTE_COLUMNS, SHARE_COLUMNS, AUDIT_COLUMNS) of one chunk, with
+    values already adapted for the database, except change_seq: the note and
+    share rows get it appended when the chunk is written. Model instances and
+    the ORM's INSERT compilation cost more than the INSERTs themselves at this
+    volume.
+    """
+    rng = random.Random(f'{seed}:notes:{chunk_index}')
+    adapt_datetime = connection.ops.adapt_datetimefield_value
+    notes, shares, audits = [], [], []
+    for note_id in range(first_note_id, first_note_id + count):
+        owner = user_ids[rng.randrange(len(user_ids))]
+        note_type = 'list' if rng.random() < 0.2 else 'text'
+        content = _text(rng, options['note_words'].sample(rng))
+        created_at = started_at - timedelta(minutes=rng.randrange(1, MAX_NOTE_AGE_MINUTES))
+        created = adapt_datetime(created_at)
+
+        share_count = min(options['shares'].sample(rng), len(user_ids) - 1)
+        shared_with = [user_id for user_id in rng.sample(user_ids, min(share_count + 1, len(user_ids))) if user_id != owner]
+        note_shares = [(created, created, True, False, True, True, True, note_id, owner)]
+        editors = [owner]
+        for user_id in shared_with[:share_count]:
+            can_edit = rng.random() < 0.3
+            note_shares.append((created, created, True, False, True, can_edit, can_edit and rng.random() < 0.3, note_id, user_id))
+            if can_edit:
+                editors.append(user_id)
+
+        editor, modified_at = owner, created_at
+        edits = options['edits'].sample(rng)
+        step = (started_at - created_at) / (edits + 1)
+        lines = content.split('\n')
+        for position in range(edits):
+            editor = rng.choice(editors)
+            modified_at = created_at + step * (position + 1)
+            old_content, content = content, _edit(rng, lines)
+            audits.append(SimpleNamespace(notes_id=note_id, modified_by_id=editor, old_note_content=old_content,
+                                          new_note_content=content, note_type=note_type, created_at=adapt_datetime(modified_at),
+                                          is_keyframe=True, chain_position=0, content_delta=None))
+        modified = adapt_datetime(modified_at)
+        notes.append((note_id, created, modified, True, False, content, note_type, owner, editor, edits))
+        shares += [(*share, modified) for share in note_shares]
+
+    # prepare_audits only reads the content and sets the storage fields; new notes have no stored rows yet
+    prepare_audits(audits, tails={})
+    audit_rows = [(audit.created_at, audit.created_at, True, False, audit.old_note_content, audit.new_note_content,
+                   audit.note_type, audit.note_type, audit.is_keyframe, audit.chain_position, audit.content_delta,
+                   audit.notes_id, audit.modified_by_id) for audit in audits]
+    return notes, shares, audit_rows
+
+
+def _insert_sql(model, field_names):
+    quote_name = connection.ops.quote_name
+    columns = ', '.join(quote_name(model._meta.get_field(name).column) for name in field_names)
+    placeholders = ', '.join(['%s'] * len(field_names))
+    return f'INSERT INTO {quote_name(model._meta.db_table)} ({columns}) VALUES ({placeholders})'
+
+
+# Users and options of the seeding run, sent once to every worker process
+_worker_context = None
+
+
+def _init_worker(user_ids, options):
+    global _worker_context
+    import django
+
+    django.setup()
+    _worker_context = (user_ids, options)
+
+
+def _generate_chunk(seed, chunk_index, first_note_id, count, started_at):
+    user_ids, options = _worker_context
+    return generate_chunk(seed, chunk_index, first_note_id, count, user_ids, options, started_at)
+
+
+def seed_users(seed, users, roles, password, prefix, role_probability=0.8):
+    """
+    Create the roles and users; returns the ids of the users
+    """
+    rng = random.Random(f'{seed}:users')
+    created_roles = Role.objects.bulk_create([Role(name=f'{prefix}-role-{index}', description=f'Seeded role {index}')
+                                              for index in range(roles)])
+    password_hash = make_password(password)
+    created_users = User.objects.bulk_create([
+        User(username=f'{prefix}-user-{index}', email=f'{prefix}-user-{index}@mail.com', password=password_hash,
+             role=rng.choice(created_roles) if created_roles and rng.random() < role_probability else None)
+        for index in range(users)], batch_size=1000)
+    return [user.id for user in created_users]
+
+
+def seed_notes(user_ids, notes, options, seed=0, chunk_size=1000, workers=1, progress=None, reference_time=None):
+    """
+    Generate and insert `notes` notes with their shares and version history.
+    `options` holds the note_words, shares and edits Distributions. Every
+    timestamp falls before `reference_time` (REFERENCE_TIME by default), so the
+    same seed and options give the same rows. Returns counts of the created rows
+    and the elapsed time.
+    """
+    started = time.perf_counter()
+    started_at = (reference_time or REFERENCE_TIME).replace(microsecond=0)
+    first_note_id = (Notes.objects.aggregate(last_id=Max('id'))['last_id'] or 0) + 1
+    chunks = [(seed, index, first_note_id + start, min(chunk_size, notes - start), started_at)
+              for index, start in enumerate(range(0, notes, chunk_size))]
+
+    summary = {'notes': 0, 'shares': 0, 'audits': 0}
+    statements = [_insert_sql(Notes, NOTE_COLUMNS), _insert_sql(NotesUser, SHARE_COLUMNS),
+                  _insert_sql(NotesAudit, AUDIT_COLUMNS)]
+
+    def insert(chunk):
+        chunk_notes, chunk_shares, chunk_audits = chunk
+        with transaction.atomic(), connection.cursor() as cursor:
+            first_seq = ChangeSequence.allocate(len(chunk_notes) + len(chunk_shares))
+            sequenced = [(*row, first_seq + offset) for offset, row in enumerate([*chunk_notes, *chunk_shares])]
+            for sql, rows in zip(statements, (sequenced[:len(chunk_notes)], sequenced[len(chunk_notes):], chunk_audits)):
+                cursor.executemany(sql, rows)
+        summary['notes'] += len(chunk_notes)
+        summary['shares'] += len(chunk_shares)
+        summary['audits'] += len(chunk_audits)
+        if progress:
+            progress(summary)
+
+    if workers > 1:
+        with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(user_ids, options)) as executor:
+            # Keep a bounded number of generated chunks waiting to be inserted, in order
+            pending = deque()
+            for arguments in chunks:
+                pending.append(executor.submit(_generate_chunk, *arguments))
+                if len(pending) >= workers * 2:
+                    insert(pending.popleft().result())
+            while pending:
+                insert(pending.popleft().result())
+    else:
+        for seed, index, first_id, count, started_at in chunks:
+            insert(generate_chunk(seed, index, first_id, count, user_ids, options, started_at))
+
+    # Ids were assigned here; sequences (PostgreSQL) must continue after them
+    with connection.cursor() as cursor:
+        for sql in connection.ops.sequence_reset_sql(no_style(), [Notes]):
+            cursor.execute(sql)
+
+    elapsed = time.perf_counter() - started
+    summary['seconds'] = round(elapsed, 3)
+    summary['rows_per_second'] = round((summary['notes'] + summary['shares'] + summary['audits']) / elapsed, 1) if elapsed else 0.0
+    return summary
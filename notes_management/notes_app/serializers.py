@@ -1,14 +1,18 @@
 from rest_framework import serializers
-from django.db.models import Q
+from django.db import models
+from django.db.models import Q, Prefetch
 from rest_framework.exceptions import NotFound
 
+from notes_management.serializers import EagerLoadingMixin, TimedSerializerMixin
+from user_app.models import User
 from user_app.serializers import UserSerializerLite
-from .models import Notes, NotesUser, NotesAudit
+from .models import Notes, NotesRole, NotesUser, NotesAudit
+from .audit import materialize_audits
 
-class NoteCreateSerializer(serializers.ModelSerializer):
+class NoteCreateSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Notes
-        fields = "__all__"
+        exclude = ("change_seq", "audit_count")
 
     def create(self, validated_data):
         note_owner = validated_data.get('created_by')
@@ -26,26 +30,84 @@ class NoteCreateSerializer(serializers.ModelSerializer):
         return instance
 
 
-class NoteShareSerializer1(serializers.ModelSerializer):
+class NoteImportSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Notes
+        fields = ("note_content", "note_type")
+
+
+class NoteImportErrorSerializer(serializers.Serializer):
+    line = serializers.IntegerField()
+    errors = serializers.DictField()
+
+
+class NoteImportSummarySerializer(serializers.Serializer):
+    imported = serializers.IntegerField()
+    failed = serializers.IntegerField()
+    errors = NoteImportErrorSerializer(many=True)
+    seconds = serializers.FloatField()
+    notes_per_second = serializers.FloatField()
+
+
+class NoteShareSerializer1(TimedSerializerMixin, EagerLoadingMixin, serializers.ModelSerializer):
+    select_related_fields = ('user__role',)
+
     user = UserSerializerLite(read_only=True)
     class Meta:
         model = NotesUser
-        fields = "__all__"
+        exclude = ("change_seq", "note_modified_at")
 
 
-class NoteSerializer(serializers.ModelSerializer):
+class NoteSerializer(TimedSerializerMixin, EagerLoadingMixin, serializers.ModelSerializer):
+    select_related_fields = ('created_by__role', 'modified_by__role')
+    prefetch_related_fields = (
+        Prefetch('notes_user', queryset=NoteShareSerializer1.setup_eager_loading(NotesUser.objects.order_by('id'))),
+        Prefetch('users', queryset=User.objects.order_by('id')),
+    )
+
     created_by = UserSerializerLite(read_only=True)
     modified_by = UserSerializerLite(read_only=True)
     notes_user = NoteShareSerializer1(read_only=True, many=True)
     class Meta:
         model = Notes
-        fields = "__all__"
+        exclude = ("change_seq", "audit_count")
 
 
-class NoteShareSerializer(serializers.ModelSerializer):
+class NoteShareSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = NotesUser
-        fields = "__all__"
+        exclude = ("change_seq", "note_modified_at")
+
+class NoteShareBulkSerializer(serializers.ModelSerializer):
+    """
+    Validates one share item without touching the database. Notes and users are
+    resolved for the whole payload at once by NotesShareView.
+    """
+    notes = serializers.IntegerField()
+    user = serializers.IntegerField()
+    class Meta:
+        model = NotesUser
+        fields = ("notes", "user", "can_read", "can_edit", "can_delete", "is_active", "is_deleted")
+        validators = []
+
+
+class NoteRoleShareSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    class Meta:
+        model = NotesRole
+        exclude = ("change_seq", "note_modified_at")
+
+
+class NoteRoleShareBulkSerializer(serializers.ModelSerializer):
+    """
+    NoteShareBulkSerializer for role shares; roles are resolved by NotesRoleShareView
+    """
+    notes = serializers.IntegerField()
+    role = serializers.IntegerField()
+    class Meta:
+        model = NotesRole
+        fields = ("notes", "role", "can_read", "can_edit", "can_delete", "is_active", "is_deleted")
+        validators = []
+
 
 class NoteReturnSerializer(serializers.Serializer):
     status = serializers.IntegerField(default=200)
@@ -53,6 +115,32 @@ class NoteReturnSerializer(serializers.Serializer):
     data = NoteSerializer(many=True)
 
 
+class NotePageReturnSerializer(serializers.Serializer):
+    status = serializers.IntegerField(default=200)
+    detail = serializers.CharField(max_length=50, default="Success")
+    next = serializers.URLField(allow_null=True)
+    previous = serializers.URLField(allow_null=True)
+    data = NoteSerializer(many=True)
+
+
+class CacheStatsSerializer(serializers.Serializer):
+    hits = serializers.IntegerField()
+    misses = serializers.IntegerField()
+    hit_rate = serializers.FloatField()
+
+
+class CacheStatsReturnSerializer(serializers.Serializer):
+    status = serializers.IntegerField(default=200)
+    detail = serializers.CharField(max_length=50, default="Success")
+    data = serializers.DictField(child=CacheStatsSerializer())
+
+
+class NoteImportReturnSerializer(serializers.Serializer):
+    status = serializers.IntegerField(default=201)
+    detail = serializers.CharField(max_length=50, default="Notes Imported.")
+    data = NoteImportSummarySerializer()
+
+
 class NoteReturnSerializer1(serializers.Serializer):
     status = serializers.IntegerField(default=200)
     detail = serializers.CharField(max_length=50, default="Resource successfully retrieved.")
@@ -71,18 +159,107 @@ class NoteShareReturnSerializer(serializers.Serializer):
     data = NoteShareFormattingSerializer(many=True)
 
 
-class NotesAuditSerializer(serializers.ModelSerializer):
+class NoteRoleShareFormattingSerializer(serializers.Serializer):
+    note_shared = NoteRoleShareSerializer(many=True)
+    note_updated = NoteRoleShareSerializer(many=True)
+    validation_errors = serializers.ListField()
+
+
+class NoteRoleShareReturnSerializer(serializers.Serializer):
+    status = serializers.IntegerField(default=200)
+    detail = serializers.CharField(max_length=50, default="Resource successfully retrieved.")
+    data = NoteRoleShareFormattingSerializer()
+
+
+class NoteSearchSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    rank = serializers.FloatField(read_only=True)
+    snippet = serializers.CharField(read_only=True)
+    # The model fields it reads; rank and snippet come from the search index
+    MODEL_FIELDS = ("id", "note_type", "created_by", "modified_by", "created_at", "modified_at")
+
+    class Meta:
+        model = Notes
+        fields = ("id", "note_type", "created_by", "modified_by", "created_at", "modified_at", "rank", "snippet")
+
+
+class NoteSearchReturnSerializer(serializers.Serializer):
+    status = serializers.IntegerField(default=200)
+    detail = serializers.CharField(max_length=50, default="Success")
+    data = NoteSearchSerializer(many=True)
+
+
+class NoteChangeSerializer(serializers.Serializer):
+    seq = serializers.IntegerField()
+    note_id = serializers.IntegerField()
+    action = serializers.ChoiceField(choices=['created', 'updated', 'deleted', 'unshared'])
+    note = NoteSerializer(allow_null=True)
+
+
+class NoteChangesSerializer(serializers.Serializer):
+    cursor = serializers.IntegerField()
+    has_more = serializers.BooleanField()
+    changes = NoteChangeSerializer(many=True)
+
+
+class NoteChangesReturnSerializer(serializers.Serializer):
+    status = serializers.IntegerField(default=200)
+    detail = serializers.CharField(max_length=50, default="Success")
+    data = NoteChangesSerializer()
+
+
+class NoteVersionSerializer(serializers.Serializer):
+    version = serializers.IntegerField()
+    note_content = serializers.CharField()
+    note_type = serializers.CharField(max_length=20)
+    created_at = serializers.DateTimeField()
+    modified_by = serializers.IntegerField()
+
+
+class NoteVersionReturnSerializer(serializers.Serializer):
+    status = serializers.IntegerField(default=200)
+    detail = serializers.CharField(max_length=50, default="Success")
+    data = NoteVersionSerializer()
+
+
+class NoteDiffSerializer(serializers.Serializer):
+    note_id = serializers.IntegerField()
+    format = serializers.ChoiceField(choices=['unified', 'structured'])
+    from_version = NoteVersionSerializer()
+    to_version = NoteVersionSerializer()
+    diff = serializers.JSONField(help_text='Unified diff text, or a list of opcodes for the structured format.')
+
+
+class NoteDiffReturnSerializer(serializers.Serializer):
+    status = serializers.IntegerField(default=200)
+    detail = serializers.CharField(max_length=50, default="Success")
+    data = NoteDiffSerializer()
+
+
+class NotesAuditListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        # Rebuild delta-stored rows for the whole list at once
+        audits = list(data.all() if isinstance(data, models.Manager) else data)
+        materialize_audits(audits)
+        return super().to_representation(audits)
+
+
+class NotesAuditSerializer(TimedSerializerMixin, EagerLoadingMixin, serializers.ModelSerializer):
+    select_related_fields = ('modified_by__role',)
+
     modified_by = UserSerializerLite(read_only=True)
     class Meta:
         model = NotesAudit
-        fields = "__all__"
-    
-    def get_total_changes(self, obj):
-        total_counts = NotesAudit.objects.filter(notes_id=obj.notes_id, is_active=True, is_deleted=False).count()
-        return total_counts
+        exclude = ("is_keyframe", "chain_position", "content_delta")
+        list_serializer_class = NotesAuditListSerializer
+
+    def to_representation(self, instance):
+        materialize_audits([instance])
+        return super().to_representation(instance)
+
 
+class NotesAuditSerializer1(EagerLoadingMixin, serializers.Serializer):
+    select_related_fields = ('created_by__role',)
 
-class NotesAuditSerializer1(serializers.Serializer):
     notes = NoteCreateSerializer(read_only=True)
     old_note_content = serializers.CharField(max_length=255)
     new_note_content = serializers.CharField(max_length=255)
@@ -116,4 +293,6 @@ class NotesAuditSerializer2(serializers.Serializer):
 class NotesAuditReturnSerializer(serializers.Serializer):
     status = serializers.IntegerField(default=200)
     detail = serializers.CharField(max_length=50, default="Resource successfully retrieved.")
+    next = serializers.URLField(allow_null=True)
+    previous = serializers.URLField(allow_null=True)
     data = NotesAuditSerializer2()
@@ -1,24 +1,125 @@
-from django.db.models.signals import pre_save
+from django.db import connections
+from django.db.models.signals import pre_save, post_save, post_delete, post_migrate
 from django.dispatch import receiver
-from .models import Notes, NotesAudit
+from django.utils import timezone
+from user_app.models import Role, User
+from .models import Notes, NotesAudit, NotesRole, NotesUser
+from .audit_writer import write_audits
+from . import acl, response_cache, search, versions
 
 
 @receiver(pre_save, sender=Notes)
-def track_note_changes(sender, instance, **kwargs):
-    try:
-        old_instance = Notes.objects.get(pk=instance.pk)
-    except Notes.DoesNotExist:
-        # This is empty because does not exist. We have to create one
+def track_note_changes(sender, instance, update_fields=None, **kwargs):
+    if instance.pk is None:
+        # This is a new note. Nothing to compare against
         return None
+    if update_fields is not None and not set(update_fields) & set(Notes.TRACKED_FIELDS):
+        return None
+
+    old_values = instance.get_loaded_values()
+    if old_values is None:
+        # Not loaded from the DB (or tracked fields were deferred); read just the tracked fields
+        old_values = Notes.objects.filter(pk=instance.pk).values(*Notes.TRACKED_FIELDS).first()
+        if old_values is None:
+            # This is empty because does not exist. We have to create one
+            return None
 
-    if old_instance.note_content != instance.note_content or old_instance.note_type != instance.note_type:
+    if old_values['note_content'] != instance.note_content or old_values['note_type'] != instance.note_type:
         audit_log = NotesAudit(
             notes=instance,
-            modified_by=instance.modified_by,
-            old_note_content=old_instance.note_content,
+            modified_by_id=instance.modified_by_id,
+            old_note_content=old_values['note_content'],
             new_note_content=instance.note_content,
-            old_note_type=old_instance.note_type,
+            old_note_type=old_values['note_type'],
             new_note_type=instance.note_type,
-            created_at=instance.created_at
+            created_at=timezone.now()
         )
-        audit_log.save()
\ No newline at end of file
+        write_audits([audit_log])
+
+
+@receiver(post_save, sender=NotesAudit)
+@receiver(post_delete, sender=NotesAudit)
+def invalidate_note_versions(sender, instance, created=False, **kwargs):
+    # New rows add versions without changing the cached ones
+    if not created:
+        versions.invalidate_audits([instance.notes_id])
+
+
+@receiver(post_save, sender=Notes)
+def reset_note_tracking(sender, instance, **kwargs):
+    # The saved values are what the next save has to be compared against
+    instance.reset_loaded_values()
+
+
+@receiver(post_save, sender=Notes)
+def update_share_feeds(sender, instance, created, update_fields=None, **kwargs):
+    # One row per share of the note, a role share standing for all its members
+    if created or (update_fields is not None and 'modified_at' not in update_fields):
+        return None
+    # Rows already carrying this modified_at are left alone
+    NotesUser.objects.filter(notes_id=instance.pk).exclude(note_modified_at=instance.modified_at).update(
+        note_modified_at=instance.modified_at)
+    NotesRole.objects.filter(notes_id=instance.pk).exclude(note_modified_at=instance.modified_at).update(
+        note_modified_at=instance.modified_at)
+
+
+@receiver(pre_save, sender=NotesUser)
+@receiver(pre_save, sender=NotesRole)
+def copy_note_modified_at(sender, instance, **kwargs):
+    if instance._state.adding:
+        # Usually the note the share was built with, so no query
+        instance.note_modified_at = instance.notes.modified_at
+
+
+@receiver(post_save, sender=Notes)
+@receiver(post_delete, sender=Notes)
+def invalidate_note_responses(sender, instance, **kwargs):
+    response_cache.invalidate_notes([instance.pk])
+
+
+@receiver(post_save, sender=NotesUser)
+@receiver(post_delete, sender=NotesUser)
+def invalidate_share_responses(sender, instance, **kwargs):
+    response_cache.invalidate_notes([instance.notes_id])
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_user_responses(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        # Logging in does not change anything serialized in a note
+        return None
+    response_cache.invalidate_users([instance.pk])
+
+
+@receiver(post_save, sender=Role)
+@receiver(post_delete, sender=Role)
+def invalidate_role_responses(sender, instance, **kwargs):
+    response_cache.invalidate_roles([instance.pk])
+
+
+@receiver(post_save, sender=Role)
+@receiver(post_delete, sender=Role)
+def invalidate_role_permissions(sender, instance, **kwargs):
+    # Shares of an inactive role grant nothing
+    acl.invalidate_role(instance.pk)
+
+
+@receiver(post_save, sender=NotesUser)
+@receiver(post_delete, sender=NotesUser)
+def invalidate_share_permissions(sender, instance, **kwargs):
+    # Bulk writes send no signals; their callers invalidate the shares themselves
+    acl.invalidate_share(instance.notes_id, instance.user_id)
+
+
+@receiver(post_save, sender=NotesRole)
+@receiver(post_delete, sender=NotesRole)
+def invalidate_role_share_permissions(sender, instance, **kwargs):
+    acl.invalidate_note(instance.notes_id)
+
+
+@receiver(post_migrate)
+def install_search_triggers(sender, using, **kwargs):
+    # SQLite drops triggers when a migration rebuilds the notes table
+    if sender.name == 'notes_app':
+        search.install_triggers(connections[using])
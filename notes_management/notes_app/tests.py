@@ -1,13 +1,43 @@
-from django.test import TestCase
-from rest_framework.test import APITestCase
+import asyncio
+import importlib
+import json
+import os
+import shutil
+import tempfile
+import time
+from datetime import datetime, timezone as dt_timezone
+from unittest import mock
+from django.apps import apps as django_apps
+from django.conf import settings
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.core.management import CommandError, call_command
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory, APITestCase
 from django.urls import reverse
+from django.utils import timezone
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from asgiref.sync import sync_to_async
 from rest_framework_simplejwt.tokens import RefreshToken, Token, AccessToken
 import pdb
 
-from .models import Notes, User
+from notes_management.cache import MISSING, DjangoCacheBackend, clear_caches, get_cache
+from . import acl, audit_writer, etags, feed, response_cache
+from .audit import materialize_audits
+from .delta import apply_delta, make_delta
+from .importer import import_notes
+from . import fast_serializers, serializers
+from .search import SEARCH_SQL, build_match_query
+from .versions import get_latest_version
+from .models import Notes, NotesRole, NotesUser, NotesAudit, User
+from .pagination import NotesFeedPagination
+from user_app.models import Role
 
+# Timed requests log a line each; TestRequestTiming turns timing on
+@override_settings(NOTES_REQUEST_TIMING={'SAMPLE_RATE': 0.0})
 class TestSetup(APITestCase):
     def setUp(self):
+        clear_caches()
         self.user_object = User.objects.create(username='testuser001', password='testpassword', email='testmail001@mail.com', is_superuser=True)
         self.refresh = AccessToken.for_user(self.user_object)
         return super().setUp()
@@ -26,11 +56,20 @@ class TestCreateNotes(TestSetup):
 
     def test_get_all_notes_w_data(self):
         self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.refresh}')
-        Notes.objects.create(note_content='Test Note', created_by=self.user_object,modified_by=self.user_object)
+        note = Notes.objects.create(note_content='Test Note', created_by=self.user_object,modified_by=self.user_object)
+        NotesUser.objects.create(notes=note, user=self.user_object)
         res = self.client.get(reverse('get_all_notes'))
         # pdb.set_trace()
         self.assertEqual(res.data['status'], 200)
 
+    def test_get_all_notes_not_shared(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.refresh}')
+        another_user = User.objects.create(username='testuser005', password='testpassword', email='testmail005@mail.com')
+        Notes.objects.create(note_content='Test Note', created_by=another_user, modified_by=another_user)
+        res = self.client.get(reverse('get_all_notes'))
+        # pdb.set_trace()
+        self.assertEqual(res.data['status'], 404)
+
     def test_create_new_notes_wo_data(self):
         self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.refresh}')
         res = self.client.post(reverse('create_notes'))
@@ -48,6 +87,90 @@ class TestCreateNotes(TestSetup):
         self.assertEqual(res.data['status'], 201)
 
 
+class TestNotesPagination(TestSetup):
+    def create_notes(self, count):
+        for i in range(count):
+            note = Notes.objects.create(note_content=f'Test Note {i}', created_by=self.user_object, modified_by=self.user_object)
+            NotesUser.objects.create(notes=note, user=self.user_object)
+
+    def test_get_all_notes_pages(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.refresh}')
+        self.create_notes(5)
+        res = self.client.get(reverse('get_all_notes'), {'page_size': 2})
+        self.assertEqual(len(res.data['data']), 2)
+        self.assertIsNone(res.data['previous'])
+
+        seen = [note['id'] for note in res.data['data']]
+        next_link = res.data['next']
+        while next_link:
+            res = self.client.get(next_link)
+            seen.extend(note['id'] for note in res.data['data'])
+            next_link = res.data['next']
+        self.assertEqual(seen, sorted(seen, reverse=True))
+        self.assertEqual(len(seen), 5)
+
+        # Walking back from the last page returns the page before it
+        res = self.client.get(res.data['previous'])
+        self.assertEqual([note['id'] for note in res.data['data']], seen[2:4])
+
+    def test_get_all_notes_page_size_bounded(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.refresh}')
+        self.create_notes(3)
+        res = self.client.get(reverse('get_all_notes'), {'page_size': 0})
+        self.assertEqual(len(res.data['data']), 1)
+
+    def test_get_all_notes_invalid_cursor(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.refresh}')
+        res = self.client.get(reverse('get_all_notes'), {'cursor': 'not-a-cursor'})
+        self.assertEqual(res.status_code, 404)
+
+
+class TestNotesQueryCount(TestSetup):
+    def create_shared_note(self, index):
+        another_user = User.objects.create(username=f'testsharer{index:03}', password='testpassword', email=f'testsharer{index:03}@mail.com')
+        note = Notes.objects.create(note_content=f'Test Note {index}', created_by=another_user, modified_by=self.user_object)
+        NotesUser.objects.create(notes=note, user=another_user, can_edit=True, can_delete=True)
+        NotesUser.objects.create(notes=note, user=self.user_object)
+        note.note_content = f'Test Note {index} Edit'
+        note.save()
+        return note
+
+    def count_queries(self, url):
+        # Warm the permission cache so both measurements skip the ACL lookup
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as context:
+            res = self.client.get(url)
+        self.assertEqual(res.status_code, 200)
+        return len(context.captured_queries)
+
+    def test_get_all_notes_constant_queries(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.refresh}')
+        self.create_shared_note(1)
+        few_notes = self.count_queries(reverse('get_all_notes'))
+        for i in range(2, 8):
+            self.create_shared_note(i)
+        self.assertEqual(self.count_queries(reverse('get_all_notes')), few_notes)
+
+    def test_get_detailed_note_constant_queries(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.refresh}')
+        note = self.create_shared_note(1)
+        few_shares = self.count_queries(reverse('get_detailed_notes', kwargs={"note_id": note.id}))
+        for i in range(2, 8):
+            another_user = User.objects.create(username=f'testreader{i:03}', password='testpassword', email=f'testreader{i:03}@mail.com')
+            NotesUser.objects.create(notes=note, user=another_user)
+        self.assertEqual(self.count_queries(reverse('get_detailed_notes', kwargs={"note_id": note.id})), few_shares)
+
+    def test_get_history_constant_queries(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.refresh}')
+        note = self.create_shared_note(1)
+        few_changes = self.count_queries(reverse('get_history', kwargs={"note_id": note.id}))
+        for i in range(2, 8):
+            note.modified_by = User.objects.create(username=f'testeditor{i:03}', password='testpassword', email=f'testeditor{i:03}@mail.com')
+            note.note_content = f'Test Note Edit {i}'
+            note.save()
+        self.assertEqual(self.count_queries(reverse('get_history', kwargs={"note_id": note.id})), few_changes)
+
+
 class TestNoteGetEdit(TestSetup):
     
     # random_user = User.objects.create(username='testrandomuser002', password='testpassword', email='testrandomuser002@mail.com')
@@ -238,6 +361,307 @@ class TestShareNotes(TestSetup):
         # pdb.set_trace()
         self.assertEqual(edit_note.status_code, 403)
 
+class TestBulkShareNotes(TestSetup):
+    def create_notes(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.refresh}')
+
+        data = {
+            "note_content": "Test Note Create for Share",
+            "is_active": True
+        }
+        note_create = self.client.post(reverse('create_notes'), data=data, format='json')
+        note_id = note_create.data.get('data').get('id')
+        return note_id
+
+    def create_user(self):
+        another_user = User.objects.create(username='testrandomuser003', password='testpassword', email='testrandomuser003@mail.com')
+        refresh_token = AccessToken.for_user(another_user)
+        return another_user.id, refresh_token
+
+    def create_users(self, count, offset=0):
+        users = [User(username=f'testbulkuser{i:04}', password='testpassword', email=f'testbulkuser{i:04}@mail.com')
+                 for i in range(offset, offset + count)]
+        return [user.id for user in User.objects.bulk_create(users)]
+
+    def share(self, data):
+        with CaptureQueriesContext(connection) as context:
+            res = self.client.post(reverse('share_notes'), data=data, format='json')
+        self.assertEqual(res.status_code, 200)
+        return res, len(context.captured_queries)
+
+    def test_share_constant_queries(self):
+        new_note = self.create_notes()
+        _, few_users = self.share([{"notes": new_note, "user": user_id} for user_id in self.create_users(2)])
+        res, many_users = self.share([{"notes": new_note, "user": user_id} for user_id in self.create_users(50, offset=2)])
+        self.assertEqual(many_users, few_users)
+        self.assertEqual(len(res.data['data']['note_shared']), 50)
+
+    def test_share_creates_and_updates(self):
+        new_note = self.create_notes()
+        existing_user, new_user = self.create_users(2)
+        self.share([{"notes": new_note, "user": existing_user}])
+
+        res, _ = self.share([
+            {"notes": new_note, "user": existing_user, "can_edit": True},
+            {"notes": new_note, "user": new_user},
+            {"notes": new_note, "user": 100099},
+        ])
+        self.assertEqual([share['user']['username'] for share in res.data['data']['note_shared']], ['testbulkuser0001'])
+        self.assertEqual([share['user']['username'] for share in res.data['data']['note_updated']], ['testbulkuser0000'])
+        self.assertEqual(len(res.data['data']['validation_errors']), 1)
+
+        share = NotesUser.objects.get(notes_id=new_note, user_id=existing_user)
+        self.assertTrue(share.can_read)
+        self.assertTrue(share.can_edit)
+        self.assertEqual(NotesUser.objects.filter(notes_id=new_note).count(), 3)
+
+    def test_share_requires_ownership(self):
+        new_note = self.create_notes()
+        new_user, refresh_token = self.create_user()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {refresh_token}')
+        res = self.client.post(reverse('share_notes'), data=[{"notes": new_note, "user": new_user}], format='json')
+        self.assertEqual(res.status_code, 403)
+        res = self.client.post(reverse('share_notes'), data=[{"notes": 100099, "user": new_user}], format='json')
+        self.assertEqual(res.status_code, 404)
+
+
+class TestNotesPermissionCache(TestSetup):
+    def create_notes(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.refresh}')
+
+        data = {
+            "note_content": "Test Note Create for Share",
+            "is_active": True
+        }
+        note_create = self.client.post(reverse('create_notes'), data=data, format='json')
+        note_id = note_create.data.get('data').get('id')
+        return note_id
+
+    def create_user(self):
+        another_user = User.objects.create(username='testrandomuser003', password='testpassword', email='testrandomuser003@mail.com')
+        refresh_token = AccessToken.for_user(another_user)
+        return another_user.id, refresh_token
+
+    def test_permission_lookup_cached(self):
+        new_note = self.create_notes()
+        self.client.get(reverse('get_notes', kwargs={'note_id': new_note}))
+        hits = acl.cache_stats()['hits']
+        with CaptureQueriesContext(connection) as context:
+            res = self.client.get(reverse('get_notes', kwargs={'note_id': new_note}))
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(acl.cache_stats()['hits'], hits + 1)
+        self.assertFalse(any('"can_read"' in query['sql'] for query in context.captured_queries))
+
+    def test_share_invalidates_permission(self):
+        new_note = self.create_notes()
+        new_user, refresh_token = self.create_user()
+
+        # Cache the "not shared" answer first
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {refresh_token}')
+        res = self.client.get(reverse('get_notes', kwargs={'note_id': new_note}))
+        self.assertEqual(res.status_code, 404)
+
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.refresh}')
+        data = [{"notes": new_note, "user": new_user, "can_read": False}]
+        self.client.post(reverse('share_notes'), data=data, format='json')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {refresh_token}')
+        res = self.client.get(reverse('get_notes', kwargs={'note_id': new_note}))
+        self.assertEqual(res.status_code, 403)
+
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.refresh}')
+        data = [{"notes": new_note, "user": new_user, "can_read": True}]
+        self.client.post(reverse('share_notes'), data=data, format='json')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {refresh_token}')
+        res = self.client.get(reverse('get_notes', kwargs={'note_id': new_note}))
+        self.assertEqual(res.status_code, 200)
+
+    def test_orm_writes_invalidate_permission(self):
+        new_note = self.create_notes()
+        new_user, refresh_token = self.create_user()
+        share = NotesUser.objects.create(notes_id=new_note, user_id=new_user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {refresh_token}')
+        self.assertEqual(self.client.get(reverse('get_notes', kwargs={'note_id': new_note})).status_code, 200)
+        share.can_read = False
+        share.save()
+        self.assertEqual(self.client.get(reverse('get_notes', kwargs={'note_id': new_note})).status_code, 403)
+        share.delete()
+        self.assertEqual(self.client.get(reverse('get_notes', kwargs={'note_id': new_note})).status_code, 404)
+
+    def test_bump_while_reading_leaves_entry_stale(self):
+        cache = get_cache('acl')
+
+        def read_then_revoke():
+            cache.bump('share:1:2')
+            return (True, True, True)
+
+        self.assertEqual(cache.get_or_set('1:2:', read_then_revoke, dependencies=['share:1:2']), (True, True, True))
+        self.assertIs(cache.get('1:2:', ['share:1:2']), MISSING)
+
+    def test_create_invalidates_permission(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.refresh}')
+        next_note_id = (Notes.objects.order_by('-id').values_list('id', flat=True).first() or 0) + 1
+        res = self.client.get(reverse('get_notes', kwargs={'note_id': next_note_id}))
+        self.assertEqual(res.status_code, 404)
+        new_note = self.create_notes()
+        self.assertEqual(new_note, next_note_id)
+        res = self.client.get(reverse('get_notes', kwargs={'note_id': new_note}))
+        self.assertEqual(res.status_code, 200)
+
+
+class TestRoleSharing(TestSetup):
+    def setUp(self):
+        super().setUp()
+        self.role = Role.objects.create(name='testteam')
+        self.member = User.objects.create(username='testmember001', password='testpassword', email='testmember001@mail.com', role=self.role)
+        self.member_token = AccessToken.for_user(self.member)
+        self.note = Notes.objects.create(note_content='Team Note about the budget', created_by=self.user_object, modified_by=self.user_object)
+        NotesUser.objects.create(notes=self.note, user=self.user_object, can_edit=True, can_delete=True)
+
+    def share(self, **permissions):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.refresh}')
+        res = self.client.post(reverse('share_notes_with_role'), data=[{'notes': self.note.id, 'role': self.role.id, **permissions}],
+                               format='json')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.member_token}')
+        return res
+
+    def test_role_share_grants_members(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.member_token}')
+        self.assertEqual(self.client.get(reverse('get_notes', kwargs={'note_id': self.note.id})).status_code, 404)
+        res = self.share()
+        self.assertEqual(len(res.data['data']['note_shared']), 1)
+        self.assertEqual(self.client.get(reverse('get_notes', kwargs={'note_id': self.note.id})).status_code, 200)
+        self.assertEqual(self.client.put(reverse('get_notes', kwargs={'note_id': self.note.id}), data={'note_content': 'Edit'}).status_code, 403)
+        self.assertEqual([note['id'] for note in self.client.get(reverse('get_all_notes')).data['data']], [self.note.id])
+        self.assertEqual([note['id'] for note in self.client.get(reverse('search_notes'), {'q': 'budget'}).data['data']], [self.note.id])
+        changes = self.client.get(reverse('get_note_changes')).data['data']['changes']
+        self.assertEqual([(change['note_id'], change['action']) for change in changes], [(self.note.id, 'created')])
+
+    def test_direct_and_role_permissions_combine(self):
+        NotesUser.objects.create(notes=self.note, user=self.member, can_read=False)
+        self.share(can_read=True, can_edit=False)
+        self.assertEqual(acl.get_note_permissions(self.note.id, self.member.id, self.role.id), (True, False, False))
+        self.assertEqual(self.share(can_read=False, can_edit=True).data['data']['note_updated'][0]['can_edit'], True)
+        self.assertEqual(acl.get_note_permissions(self.note.id, self.member.id, self.role.id), (False, True, False))
+        res = self.client.put(reverse('get_notes', kwargs={'note_id': self.note.id}), data={'note_content': 'Edit'})
+        self.assertEqual(res.status_code, 200)
+
+    def test_permissions_resolved_in_one_indexed_query(self):
+        self.share()
+        clear_caches()
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(acl.get_note_permissions(self.note.id, self.member.id, self.role.id), (True, False, False))
+        self.assertEqual(len(context.captured_queries), 1)
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + context.captured_queries[0]['sql'])
+            plan = ' '.join(str(row[-1]) for row in cursor.fetchall())
+        self.assertNotIn('SCAN notes_app_notesuser', plan)
+        self.assertNotIn('SCAN notes_app_notesrole', plan)
+        with CaptureQueriesContext(connection) as context:
+            acl.get_note_permissions(self.note.id, self.member.id, self.role.id)
+        self.assertEqual(len(context.captured_queries), 0)
+
+    def test_revoking_the_role_share_or_the_role(self):
+        self.share()
+        self.assertEqual(self.client.get(reverse('get_notes', kwargs={'note_id': self.note.id})).status_code, 200)
+        self.share(can_read=False)
+        self.assertEqual(self.client.get(reverse('get_notes', kwargs={'note_id': self.note.id})).status_code, 403)
+        self.share(can_read=True)
+        self.role.is_active = False
+        self.role.save()
+        self.assertEqual(self.client.get(reverse('get_notes', kwargs={'note_id': self.note.id})).status_code, 404)
+
+    def test_only_owner_shares_with_roles(self):
+        self.share()
+        res = self.client.post(reverse('share_notes_with_role'), data=[{'notes': self.note.id, 'role': self.role.id}], format='json')
+        self.assertEqual(res.status_code, 403)
+        res = self.share(role=100003)
+        self.assertEqual(res.data['data']['validation_errors'], [{'role': ['Invalid pk "100003" - object does not exist.']}])
+
+
+class TestNotesFeed(TestSetup):
+    def setUp(self):
+        super().setUp()
+        self.role = Role.objects.create(name='testfeedteam')
+        self.reader = User.objects.create(username='testreader001', password='testpassword', email='testreader001@mail.com', role=self.role)
+        self.reader_token = AccessToken.for_user(self.reader)
+        self.notes = []
+        for index in range(3):
+            self.notes.append(self.create_shared_note(f'Feed Note {index}'))
+
+    def create_shared_note(self, content):
+        note = Notes.objects.create(note_content=content, created_by=self.user_object, modified_by=self.user_object)
+        NotesUser.objects.create(notes=note, user=self.user_object, can_edit=True, can_delete=True)
+        NotesUser.objects.create(notes=note, user=self.reader)
+        return note
+
+    def get_feed(self, **params):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.reader_token}')
+        return self.client.get(reverse('get_notes_feed'), params)
+
+    def test_most_recently_modified_first(self):
+        res = self.get_feed()
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual([note['id'] for note in res.data['data']], [note.id for note in reversed(self.notes)])
+        self.notes[0].note_content = 'Feed Note 0, edited'
+        self.notes[0].save()
+        feed_ids = [note['id'] for note in self.get_feed().data['data']]
+        self.assertEqual(feed_ids, [self.notes[0].id, self.notes[2].id, self.notes[1].id])
+        self.assertEqual(NotesUser.objects.get(notes=self.notes[0], user=self.reader).note_modified_at,
+                         Notes.objects.get(pk=self.notes[0].pk).modified_at)
+
+    def test_role_shares_are_merged(self):
+        team_note = Notes.objects.create(note_content='Team Note', created_by=self.user_object, modified_by=self.user_object)
+        NotesRole.objects.create(notes=team_note, role=self.role)
+        NotesRole.objects.create(notes=self.notes[1], role=self.role)
+        NotesUser.objects.filter(notes=self.notes[2], user=self.reader).update(can_read=False)
+        feed_ids = [note['id'] for note in self.get_feed().data['data']]
+        self.assertEqual(feed_ids, [team_note.id, self.notes[1].id, self.notes[0].id])
+
+    def test_pages_follow_next_links(self):
+        res = self.get_feed(page_size=2)
+        first_page = [note['id'] for note in res.data['data']]
+        self.assertEqual(len(first_page), 2)
+        res = self.client.get(res.data['next'])
+        self.assertEqual([note['id'] for note in res.data['data']], [self.notes[0].id])
+        self.assertIsNone(res.data['next'])
+        res = self.client.get(res.data['previous'])
+        self.assertEqual([note['id'] for note in res.data['data']], first_page)
+
+    def test_same_as_note_list(self):
+        res = self.get_feed(page_size=2)
+        notes_res = self.client.get(reverse('get_all_notes'), {'page_size': 2})
+        self.assertEqual(res.data['data'], notes_res.data['data'])
+        self.assertEqual(res['ETag'], notes_res['ETag'])
+
+    def test_empty_feed(self):
+        NotesUser.objects.filter(user=self.reader).update(can_read=False)
+        self.assertEqual(self.get_feed().status_code, 404)
+
+    def test_queries_do_not_grow_with_shares(self):
+        NotesRole.objects.create(notes=self.notes[0], role=self.role)
+        # Loads the requesting user into the cache
+        self.get_feed()
+        with CaptureQueriesContext(connection) as context:
+            self.get_feed()
+        queries = len(context.captured_queries)
+        for index in range(20):
+            self.create_shared_note(f'More Feed Note {index}')
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(len(self.get_feed().data['data']), 23)
+        self.assertEqual(len(context.captured_queries), queries)
+
+    def test_page_is_an_index_range_scan(self):
+        paginator = NotesFeedPagination()
+        request = Request(APIRequestFactory().get(reverse('get_notes_feed')))
+        queryset = feed._share_querysets(self.reader)[0]
+        sql, params = paginator.get_page_queryset(queryset, request).query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            plan = ' '.join(str(row[-1]) for row in cursor.fetchall())
+        self.assertIn('notesuser_user_feed_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+
 class TestVersionHistory(TestSetup):
     def update_note(self, note_id):
         edit_data = {
@@ -282,3 +706,1066 @@ class TestVersionHistory(TestSetup):
         res = self.client.get(reverse('get_history', kwargs={"note_id": new_note_id}))
         # pdb.set_trace()
         self.assertEqual(res.status_code, 200)
+
+    def edit_note(self, edits):
+        note = Notes.objects.create(note_content='Version 0', created_by=self.user_object, modified_by=self.user_object)
+        NotesUser.objects.create(notes=note, user=self.user_object, can_edit=True, can_delete=True)
+        for version in range(1, edits + 1):
+            note.note_content = f'Version {version}'
+            note.save()
+        return note
+
+    def test_history_paginated_newest_first(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.refresh}')
+        note = self.edit_note(5)
+        res = self.client.get(reverse('get_history', kwargs={"note_id": note.id}), {'page_size': 2})
+        self.assertEqual(res.data['data']['total_changes'], 5)
+        versions = [change['new_note_content'] for change in res.data['data']['changes_history']]
+        while res.data['next']:
+            res = self.client.get(res.data['next'])
+            versions += [change['new_note_content'] for change in res.data['data']['changes_history']]
+        self.assertEqual(versions, [f'Version {version}' for version in range(5, 0, -1)])
+
+    def test_audit_count_survives_stale_instances(self):
+        note = self.edit_note(2)
+        stale = Notes.objects.get(pk=note.pk)
+        note.note_content = 'Version 3'
+        note.save()
+        stale.note_type = 'list'
+        stale.save()
+        self.assertEqual(Notes.objects.get(pk=note.pk).audit_count, 4)
+        self.assertEqual(NotesAudit.objects.filter(notes=note).count(), 4)
+
+    def test_history_in_two_queries(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.refresh}')
+        note = self.edit_note(30)
+        url = reverse('get_history', kwargs={"note_id": note.id})
+        # Warm the permission cache, the history itself is what is measured
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as context:
+            res = self.client.get(url)
+        self.assertEqual(res.data['data']['total_changes'], 30)
+        self.assertEqual(len(context.captured_queries), 2)
+
+    @override_settings(NOTES_AUDIT_STORAGE='delta', NOTES_AUDIT_KEYFRAME_INTERVAL=5)
+    def test_delta_history_pages_in_two_queries(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.refresh}')
+        note = self.edit_note(30)
+        url = reverse('get_history', kwargs={"note_id": note.id})
+        self.client.get(url)
+        versions = []
+        # Every page ends on a delta row whose keyframe is on the next page
+        while url:
+            with CaptureQueriesContext(connection) as context:
+                res = self.client.get(url, {'page_size': 7} if not versions else None)
+            self.assertEqual(len(context.captured_queries), 2)
+            versions += [change['new_note_content'] for change in res.data['data']['changes_history']]
+            url = res.data['next']
+        self.assertEqual(versions, [f'Version {version}' for version in range(30, 0, -1)])
+
+
+class TestNoteVersions(TestSetup):
+    def setUp(self):
+        super().setUp()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.refresh}')
+        self.note = Notes.objects.create(note_content='line one\nline two', created_by=self.user_object, modified_by=self.user_object)
+        NotesUser.objects.create(notes=self.note, user=self.user_object, can_edit=True, can_delete=True)
+        self.times = []
+        for content in ('line one\nline 2', 'line one\nline 2\nline three'):
+            self.times.append(timezone.now())
+            self.note.note_content = content
+            self.note.save()
+        self.audits = list(NotesAudit.objects.filter(notes=self.note).order_by('id'))
+
+    def get(self, name, **params):
+        return self.client.get(reverse(name, kwargs={'note_id': self.note.id}), params)
+
+    def test_unified_diff_against_latest(self):
+        res = self.get('get_note_diff', **{'from': 0})
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.data['data']['to_version']['version'], self.audits[-1].id)
+        self.assertIn('-line two\n+line 2\n+line three', res.data['data']['diff'])
+
+    def test_structured_diff_between_versions(self):
+        res = self.get('get_note_diff', **{'from': self.audits[0].id, 'to': self.audits[1].id, 'diff_format': 'structured'})
+        self.assertEqual([(op['op'], op['new_lines']) for op in res.data['data']['diff']],
+                         [('equal', []), ('insert', ['line three'])])
+
+    def test_unknown_version(self):
+        self.assertEqual(self.get('get_note_diff', **{'from': 0, 'to': 100003}).status_code, 404)
+        self.assertEqual(self.get('get_note_diff', **{'from': 'abc'}).status_code, 400)
+
+    def test_as_of(self):
+        res = self.get('get_note_as_of', at=self.times[1].isoformat())
+        self.assertEqual(res.data['data']['note_content'], 'line one\nline 2')
+        self.assertEqual(res.data['data']['version'], self.audits[0].id)
+        self.assertEqual(self.get('get_note_as_of', at=self.times[0].isoformat()).data['data']['version'], 0)
+        self.assertEqual(self.get('get_note_as_of', at=timezone.now().isoformat()).data['data']['note_content'],
+                         self.note.note_content)
+        self.assertEqual(self.get('get_note_as_of', at='2000-01-01T00:00:00Z').status_code, 404)
+        self.assertEqual(self.get('get_note_as_of', at='yesterday').status_code, 400)
+
+    @override_settings(NOTES_AUDIT_STORAGE='delta', NOTES_AUDIT_KEYFRAME_INTERVAL=5)
+    def test_cost_independent_of_history_length(self):
+        def count_queries():
+            clear_caches()
+            self.get('get_note_as_of', at=timezone.now().isoformat())
+            with CaptureQueriesContext(connection) as context:
+                res = self.get('get_note_as_of', at=timezone.now().isoformat())
+            self.assertEqual(res.data['data']['note_content'], self.note.note_content)
+            return len(context.captured_queries)
+
+        for version in range(3):
+            self.note.note_content = f'short history {version}'
+            self.note.save()
+        short_history = count_queries()
+        for version in range(40):
+            self.note.note_content = f'long history {version}'
+            self.note.save()
+        self.assertEqual(count_queries(), short_history)
+
+    def test_deactivated_rows_leave_the_cache(self):
+        self.assertEqual(self.get('get_note_diff', **{'from': self.audits[0].id}).status_code, 200)
+        self.audits[0].is_active = False
+        self.audits[0].save()
+        self.assertEqual(self.get('get_note_diff', **{'from': self.audits[0].id}).status_code, 404)
+
+    def test_backfill_legacy_audit_times(self):
+        migration = importlib.import_module('notes_app.migrations.0015_backfill_audit_created_at')
+        NotesAudit.objects.filter(pk=self.audits[0].pk).update(created_at=self.note.created_at)
+        migration.backfill_created_at(django_apps, None)
+        legacy, current = NotesAudit.objects.filter(notes=self.note).order_by('id')
+        self.assertEqual(legacy.created_at, legacy.modified_at)
+        self.assertEqual(current.created_at, self.audits[1].created_at)
+
+    def test_versions_are_cached(self):
+        self.get('get_note_diff', **{'from': self.audits[0].id, 'to': self.audits[1].id})
+        with CaptureQueriesContext(connection) as context:
+            self.get('get_note_diff', **{'from': self.audits[0].id, 'to': self.audits[1].id})
+        self.assertFalse(any('notes_app_notesaudit' in query['sql'] for query in context.captured_queries))
+
+
+class TestNoteChangeTracking(TestSetup):
+    def create_note(self):
+        note = Notes.objects.create(note_content='Test Note', created_by=self.user_object, modified_by=self.user_object)
+        return Notes.objects.get(pk=note.pk)
+
+    def test_update_does_not_reload_note(self):
+        note = self.create_note()
+        note.note_content = 'Test Note Edit'
+        with CaptureQueriesContext(connection) as context:
+            note.save()
+        self.assertFalse(any('FROM "notes_app_notes"' in query['sql'] for query in context.captured_queries))
+        audit = NotesAudit.objects.get(notes=note)
+        self.assertEqual((audit.old_note_content, audit.new_note_content), ('Test Note', 'Test Note Edit'))
+
+        # The saved values become the new baseline
+        note.note_content = 'Test Note Edit Again'
+        note.save()
+        audit = materialize_audits([NotesAudit.objects.filter(notes=note).latest('id')])[0]
+        self.assertEqual(audit.old_note_content, 'Test Note Edit')
+
+    def test_untracked_update_skips_audit(self):
+        note = self.create_note()
+        note.is_active = False
+        note.is_deleted = True
+        with CaptureQueriesContext(connection) as context:
+            note.save()
+        # Taking a change_seq (one UPDATE ... RETURNING), the UPDATE and copying modified_at to the
+        # user and role shares for the feed; no audit read
+        self.assertEqual(len(context.captured_queries), 4)
+        self.assertFalse(NotesAudit.objects.filter(notes=note).exists())
+
+    def test_change_seq_taken_after_audit(self):
+        note = self.create_note()
+        note.note_content = 'Test Note Edit'
+        with CaptureQueriesContext(connection) as context:
+            note.save()
+        statements = [query['sql'] for query in context.captured_queries]
+        audit_insert = next(index for index, sql in enumerate(statements) if 'INSERT INTO "notes_app_notesaudit"' in sql)
+        counter_update = next(index for index, sql in enumerate(statements) if 'UPDATE "notes_app_changesequence"' in sql)
+        # The counter row is locked for the note UPDATE only, not for building the audit row
+        self.assertLess(audit_insert, counter_update)
+        self.assertIn('UPDATE "notes_app_notes"', statements[counter_update + 1])
+        self.assertGreater(Notes.objects.get(pk=note.pk).change_seq, 0)
+
+    def test_deferred_content_falls_back_to_query(self):
+        note = self.create_note()
+        note = Notes.objects.defer('note_content').get(pk=note.pk)
+        note.note_content = 'Test Note Edit'
+        note.save()
+        audit = NotesAudit.objects.get(notes=note)
+        self.assertEqual(audit.old_note_content, 'Test Note')
+
+
+@override_settings(NOTES_AUDIT_STORAGE='delta', NOTES_AUDIT_KEYFRAME_INTERVAL=3)
+class TestAuditDeltaStorage(TestSetup):
+    contents = ['first line\nsecond line', 'first line\nsecond line edited', 'first line changed\nsecond line edited',
+                '', 'third version', 'third version\nwith more lines', 'fourth']
+
+    def edit_note(self):
+        note = Notes.objects.create(note_content='original', created_by=self.user_object, modified_by=self.user_object)
+        for content in self.contents:
+            note.note_content = content
+            note.save()
+        return note
+
+    def expected_history(self):
+        versions = ['original', *self.contents]
+        return list(zip(versions, versions[1:]))
+
+    def test_delta_roundtrip(self):
+        for old, new in self.expected_history():
+            self.assertEqual(apply_delta(old, make_delta(old, new)), new)
+
+    def test_large_rewrite_replaced_whole(self):
+        old_body = ''.join(f'old line {index}\n' for index in range(3000))
+        new_body = ''.join(f'new line {index}\n' for index in range(3000))
+        old, new = f'kept\n{old_body}end\n', f'kept\n{new_body}end\n'
+        with mock.patch('notes_app.delta.SequenceMatcher') as matcher:
+            delta = make_delta(old, new)
+        matcher.assert_not_called()
+        self.assertEqual(json.loads(delta), [1, -3000, new_body, 1])
+        self.assertEqual(apply_delta(old, delta), new)
+        # Edits at one end only diff the changed lines
+        self.assertEqual(json.loads(make_delta(old, old + 'appended\n')), [3002, 'appended\n'])
+
+    def test_rows_stored_as_keyframes_and_deltas(self):
+        note = self.edit_note()
+        rows = list(NotesAudit.objects.filter(notes=note).order_by('id'))
+        self.assertEqual([row.chain_position for row in rows], [0, 1, 2, 0, 1, 2, 0])
+        self.assertTrue(all(row.new_note_content == '' for row in rows if not row.is_keyframe))
+
+    def test_history_returns_full_content(self):
+        note = self.edit_note()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.refresh}')
+        NotesUser.objects.create(notes=note, user=self.user_object)
+        res = self.client.get(reverse('get_history', kwargs={"note_id": note.id}))
+        history = sorted(res.data['data']['changes_history'], key=lambda change: change['id'])
+        self.assertEqual([(change['old_note_content'], change['new_note_content']) for change in history],
+                         self.expected_history())
+
+    def test_stale_saves_start_a_new_chain(self):
+        note = Notes.objects.create(note_content='one\ntwo\nfour\n', created_by=self.user_object, modified_by=self.user_object)
+        first, second = Notes.objects.get(pk=note.pk), Notes.objects.get(pk=note.pk)
+        first.note_content = 'zero\none\ntwo\nfour\n'
+        first.save()
+        # Saved from a copy read before the first save
+        second.note_content = 'one\ntwo\nthree\nfour\n'
+        second.save()
+        rows = materialize_audits(list(NotesAudit.objects.filter(notes=note).order_by('id')))
+        self.assertEqual([row.is_keyframe for row in rows], [True, True])
+        self.assertEqual([(row.old_note_content, row.new_note_content) for row in rows],
+                         [('one\ntwo\nfour\n', 'zero\none\ntwo\nfour\n'), ('one\ntwo\nfour\n', 'one\ntwo\nthree\nfour\n')])
+        self.assertEqual(get_latest_version(Notes.objects.get(pk=note.pk))['note_content'],
+                         Notes.objects.get(pk=note.pk).note_content)
+
+        # Later saves continue from what the note holds again
+        second.note_content = 'one\ntwo\nthree\nfour\nfive\n'
+        second.save()
+        row = materialize_audits([NotesAudit.objects.filter(notes=note).latest('id')])[0]
+        self.assertFalse(row.is_keyframe)
+        self.assertEqual(row.new_note_content, 'one\ntwo\nthree\nfour\nfive\n')
+
+    def test_materialize_single_row(self):
+        note = self.edit_note()
+        audit = materialize_audits([NotesAudit.objects.filter(notes=note, chain_position=2).latest('id')])[0]
+        self.assertEqual((audit.old_note_content, audit.new_note_content), self.expected_history()[5])
+
+    def test_compact_and_expand_existing_rows(self):
+        with self.settings(NOTES_AUDIT_STORAGE='full'):
+            note = self.edit_note()
+        self.assertTrue(all(row.is_keyframe for row in NotesAudit.objects.filter(notes=note)))
+
+        call_command('compact_notes_audit', verbosity=0)
+        rows = materialize_audits(list(NotesAudit.objects.filter(notes=note).order_by('id')))
+        self.assertEqual([row.chain_position for row in rows], [0, 1, 2, 0, 1, 2, 0])
+        self.assertEqual([(row.old_note_content, row.new_note_content) for row in rows], self.expected_history())
+
+        call_command('compact_notes_audit', expand=True, verbosity=0)
+        rows = list(NotesAudit.objects.filter(notes=note).order_by('id'))
+        self.assertTrue(all(row.is_keyframe for row in rows))
+        self.assertEqual([(row.old_note_content, row.new_note_content) for row in rows], self.expected_history())
+
+
+class TestSearchNotes(TestSetup):
+    def create_note(self, content, owner=None):
+        owner = owner or self.user_object
+        note = Notes.objects.create(note_content=content, created_by=owner, modified_by=owner)
+        NotesUser.objects.create(notes=note, user=owner, can_edit=True, can_delete=True)
+        return note
+
+    def search(self, query):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.refresh}')
+        res = self.client.get(reverse('search_notes'), {'q': query})
+        return [note['id'] for note in res.data['data']]
+
+    def test_search_ranks_shared_notes(self):
+        weak = self.create_note('groceries: milk, bread')
+        strong = self.create_note('milk milk milk and more milk')
+        another_user = User.objects.create(username='testuser006', password='testpassword', email='testmail006@mail.com')
+        self.create_note('milk for somebody else', owner=another_user)
+        self.assertEqual(self.search('milk'), [strong.id, weak.id])
+        self.assertEqual(self.search('mil'), [strong.id, weak.id])
+
+    def test_search_index_follows_updates(self):
+        note = self.create_note('quarterly report draft')
+        note.note_content = 'annual summary'
+        note.save()
+        self.assertEqual(self.search('quarterly'), [])
+        self.assertEqual(self.search('annual'), [note.id])
+
+        note.is_active = False
+        note.is_deleted = True
+        note.save()
+        self.assertEqual(self.search('annual'), [])
+
+    def test_search_reads_only_serialized_fields(self):
+        self.create_note('milk')
+        with CaptureQueriesContext(connection) as context:
+            self.search('milk')
+        notes_query = next(query['sql'] for query in context.captured_queries if query['sql'].startswith('SELECT "notes_app_notes"'))
+        self.assertNotIn('"note_content"', notes_query)
+        self.assertEqual(set(serializers.NoteSearchSerializer.Meta.fields) - set(serializers.NoteSearchSerializer.MODEL_FIELDS),
+                         {'rank', 'snippet'})
+
+    def test_search_requires_query(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.refresh}')
+        res = self.client.get(reverse('search_notes'))
+        self.assertEqual(res.status_code, 400)
+
+    def test_search_uses_indexes(self):
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + SEARCH_SQL, [build_match_query('milk'), self.user_object.id, 20, 0])
+            plan = ' '.join(str(row[-1]) for row in cursor.fetchall())
+        self.assertIn('VIRTUAL TABLE INDEX', plan)
+        self.assertNotIn('SCAN notes_app_notesuser', plan)
+
+
+class TestSoftDeleteIndexes(TestSetup):
+    def setUp(self):
+        super().setUp()
+        users = User.objects.bulk_create([User(username=f'planuser{i}', email=f'planuser{i}@mail.com') for i in range(20)])
+        notes = Notes.objects.bulk_create([Notes(note_content='Test Note', created_by=users[i % 20], modified_by=users[i % 20],
+                                                 is_deleted=i % 10 == 0) for i in range(500)])
+        NotesUser.objects.bulk_create([NotesUser(notes=note, user=users[(i + k) % 20], is_deleted=k == 2)
+                                       for i, note in enumerate(notes) for k in range(3)])
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        self.plan_user, self.plan_note = users[1], notes[1]
+
+    def test_active_manager(self):
+        self.assertEqual(Notes.objects.active().count(), 450)
+        self.assertEqual(Notes.get_active().count(), Notes.objects.filter(is_active=True, is_deleted=False).count())
+        self.assertEqual(User.objects.active().count(), 21)
+
+    def test_shared_notes_page_walks_the_feed_index(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.plan_user)}')
+        with CaptureQueriesContext(connection) as context:
+            res = self.client.get(reverse('get_all_notes'), {'page_size': 20})
+        self.assertEqual(len(res.data['data']), 20)
+        page_query = next(query['sql'] for query in context.captured_queries
+                          if query['sql'].startswith('SELECT "notes_app_notesuser"') and 'note_modified_at' in query['sql'])
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + page_query)
+            plan = ' '.join(str(row[-1]) for row in cursor.fetchall())
+        self.assertIn('notesuser_user_feed_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_history_uses_partial_index(self):
+        plan = NotesAudit.objects.active().filter(notes_id=self.plan_note.id).order_by('-created_at', '-id')[:50].explain()
+        self.assertIn('notesaudit_active_notes_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_active_notes_use_partial_index(self):
+        plan = Notes.get_active().order_by('-modified_at', '-id')[:50].explain()
+        self.assertIn('notes_active_modified_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+
+class TestConditionalRequests(TestSetup):
+    def setUp(self):
+        super().setUp()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.refresh}')
+        self.note = Notes.objects.create(note_content='Test Note', created_by=self.user_object, modified_by=self.user_object)
+        NotesUser.objects.create(notes=self.note, user=self.user_object, can_edit=True, can_delete=True)
+
+    def test_note_not_modified(self):
+        url = reverse('get_notes', kwargs={'note_id': self.note.id})
+        etag = self.client.get(url)['ETag']
+        res = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, 304)
+
+        self.note.note_content = 'Changed Note'
+        self.note.save()
+        res = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, 200)
+        self.assertNotEqual(res['ETag'], etag)
+
+    def test_update_requires_matching_etag(self):
+        url = reverse('get_notes', kwargs={'note_id': self.note.id})
+        etag = self.client.get(url)['ETag']
+        res = self.client.put(url, {'note_content': 'First Edit'}, HTTP_IF_MATCH=etag)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res['ETag'], self.client.get(url)['ETag'])
+
+        res = self.client.put(url, {'note_content': 'Lost Edit'}, HTTP_IF_MATCH=etag)
+        self.assertEqual(res.status_code, 412)
+        self.assertEqual(Notes.objects.get(pk=self.note.id).note_content, 'First Edit')
+
+    def test_update_deactivating_note_has_no_etag(self):
+        url = reverse('get_notes', kwargs={'note_id': self.note.id})
+        res = self.client.put(url, {'is_deleted': True})
+        self.assertEqual(res.status_code, 200)
+        self.assertFalse(res.has_header('ETag'))
+
+    def test_note_etag_follows_shares(self):
+        url = reverse('get_notes', kwargs={'note_id': self.note.id})
+        etag = self.client.get(url)['ETag']
+        another_user = User.objects.create(username='testuser007', password='testpassword', email='testmail007@mail.com')
+        NotesUser.objects.create(notes=self.note, user=another_user)
+        res = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(sorted(res.data['data']['users']), sorted([self.user_object.id, another_user.id]))
+        self.assertEqual(self.client.put(url, {'note_content': 'Stale Edit'}, HTTP_IF_MATCH=etag).status_code, 412)
+
+    def test_detail_etag_follows_shares(self):
+        url = reverse('get_detailed_notes', kwargs={'note_id': self.note.id})
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        another_user = User.objects.create(username='testuser007', password='testpassword', email='testmail007@mail.com')
+        NotesUser.objects.create(notes=self.note, user=another_user)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_list_not_modified(self):
+        url = reverse('get_all_notes')
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(self.client.get(url, {'page_size': 1}, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        note = Notes.objects.create(note_content='Another Note', created_by=self.user_object, modified_by=self.user_object)
+        NotesUser.objects.create(notes=note, user=self.user_object)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+    def test_list_etag_follows_edits_and_revoked_shares(self):
+        url = reverse('get_all_notes')
+        etag = self.client.get(url)['ETag']
+        self.note.note_content = 'Changed Note'
+        self.note.save()
+        etag, previous = self.client.get(url)['ETag'], etag
+        self.assertNotEqual(etag, previous)
+        NotesUser.objects.filter(notes=self.note, user=self.user_object).first().delete()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 404)
+
+    def test_list_etag_reads_index_tops(self):
+        request = Request(APIRequestFactory().get(reverse('get_all_notes')))
+        request.user = self.user_object
+        with CaptureQueriesContext(connection) as context:
+            etags.notes_list_etag(request)
+        self.assertEqual(len(context.captured_queries), 1)
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + context.captured_queries[0]['sql'])
+            plan = ' '.join(str(row[-1]) for row in cursor.fetchall())
+        self.assertIn('notesuser_user_change_seq_idx', plan)
+        self.assertIn('notesuser_user_feed_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+class TestNoteResponseCache(TestSetup):
+    def setUp(self):
+        super().setUp()
+        self.role = Role.objects.create(name='Editor')
+        self.another_user = User.objects.create(username='testuser008', password='testpassword', email='testmail008@mail.com',
+                                                role=self.role)
+        self.note = Notes.objects.create(note_content='Test Note', created_by=self.user_object, modified_by=self.user_object)
+        NotesUser.objects.create(notes=self.note, user=self.user_object, can_edit=True, can_delete=True)
+        NotesUser.objects.create(notes=self.note, user=self.another_user)
+
+    def assert_cached(self):
+        with self.assertNumQueries(0):
+            return response_cache.get_note_detail(self.note.id)
+
+    def test_detail_served_from_cache(self):
+        data = response_cache.get_note_detail(self.note.id)
+        self.assertEqual(self.assert_cached(), data)
+        self.assertEqual(response_cache.cache_stats()['hits'], 1)
+
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.refresh}')
+        res = self.client.get(reverse('get_detailed_notes', kwargs={'note_id': self.note.id}))
+        self.assertEqual(res.data['data'], data)
+
+    def test_entries_are_plain_data(self):
+        data = response_cache.get_note_detail(self.note.id)
+        self.assertIs(type(data), dict)
+        self.assertIs(type(data['created_by']), dict)
+        self.assertIs(type(data['notes_user']), list)
+        self.assertIs(type(data['notes_user'][0]['user']), dict)
+
+    def test_stats_endpoint(self):
+        response_cache.get_note_detail(self.note.id)
+        self.assert_cached()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.refresh}')
+        res = self.client.get(reverse('get_cache_stats'))
+        self.assertEqual(res.data['status'], 200)
+        self.assertEqual(res.data['data']['responses'], {'hits': 1, 'misses': 1, 'hit_rate': 0.5})
+        self.assertEqual(set(res.data['data']), set(settings.NOTES_CACHES))
+
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.another_user)}')
+        self.assertEqual(self.client.get(reverse('get_cache_stats')).status_code, 401)
+
+    def test_note_save_invalidates(self):
+        response_cache.get_note_detail(self.note.id)
+        self.note.note_content = 'Changed Note'
+        self.note.save()
+        self.assertEqual(response_cache.get_note_detail(self.note.id)['note_content'], 'Changed Note')
+        self.assert_cached()
+
+    def test_user_and_role_save_invalidate(self):
+        response_cache.get_note_detail(self.note.id)
+        self.role.name = 'Reviewer'
+        self.role.save()
+        shares = response_cache.get_note_detail(self.note.id)['notes_user']
+        self.assertIn('Reviewer', [share['user']['role']['name'] for share in shares if share['user']['role']])
+
+        self.another_user.email = 'changed008@mail.com'
+        self.another_user.save()
+        shares = response_cache.get_note_detail(self.note.id)['notes_user']
+        self.assertIn('changed008@mail.com', [share['user']['email'] for share in shares])
+
+    def test_bulk_share_invalidates(self):
+        response_cache.get_note_detail(self.note.id)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.refresh}')
+        self.client.post(reverse('share_notes'), [{'notes': self.note.id, 'user': self.another_user.id, 'can_edit': True}], format='json')
+        shares = response_cache.get_note_detail(self.note.id)['notes_user']
+        self.assertTrue(all(share['can_edit'] for share in shares))
+
+    @override_settings(NOTES_CACHES={'responses': {'BACKEND': 'django', 'CACHE_ALIAS': 'default'}},
+                       CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_django_cache_backend(self):
+        response_cache.get_note_detail(self.note.id)
+        self.assert_cached()
+        self.note.note_content = 'Changed Note'
+        self.note.save()
+        self.assertEqual(response_cache.get_note_detail(self.note.id)['note_content'], 'Changed Note')
+
+
+class TestExportNotes(TestSetup):
+    def setUp(self):
+        super().setUp()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.refresh}')
+        self.notes = []
+        for i in range(5):
+            note = Notes.objects.create(note_content=f'Test Note {i}', created_by=self.user_object, modified_by=self.user_object)
+            NotesUser.objects.create(notes=note, user=self.user_object, can_edit=True, can_delete=True)
+            self.notes.append(note)
+
+    def export(self, **params):
+        res = self.client.get(reverse('export_notes'), params)
+        self.assertEqual(res['Content-Type'], 'application/x-ndjson')
+        return [json.loads(line) for line in b''.join(res.streaming_content).decode().splitlines()]
+
+    def test_export_streams_every_note(self):
+        lines = self.export()
+        self.assertEqual([line['id'] for line in lines], [note.id for note in self.notes])
+        self.assertEqual(lines[0]['note_content'], 'Test Note 0')
+        self.assertEqual(lines[0]['notes_user'][0]['user']['username'], self.user_object.username)
+
+    def test_export_resumes_from_cursor(self):
+        lines = self.export(cursor=self.notes[2].id)
+        self.assertEqual([line['id'] for line in lines], [note.id for note in self.notes[3:]])
+
+    def test_export_with_history(self):
+        note = self.notes[0]
+        for content in ('First Edit', 'Second Edit'):
+            note.note_content = content
+            note.save()
+        lines = self.export(include_history='true')
+        history = lines[0]['history']
+        self.assertEqual([(row['old_note_content'], row['new_note_content']) for row in history],
+                         [('Test Note 0', 'First Edit'), ('First Edit', 'Second Edit')])
+        self.assertEqual(lines[1]['history'], [])
+
+    def test_export_queries_per_chunk(self):
+        self.export()
+        with CaptureQueriesContext(connection) as small_export:
+            self.export()
+        for i in range(20):
+            note = Notes.objects.create(note_content=f'Extra Note {i}', created_by=self.user_object, modified_by=self.user_object)
+            NotesUser.objects.create(notes=note, user=self.user_object)
+        with CaptureQueriesContext(connection) as large_export:
+            self.export()
+        self.assertEqual(len(small_export), len(large_export))
+
+
+class TestNoteChanges(TestSetup):
+    def setUp(self):
+        super().setUp()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.refresh}')
+        self.other_user = User.objects.create(username='testuser002', password='testpassword', email='testmail002@mail.com')
+        self.note = self.create_note('Test Note')
+
+    def create_note(self, content):
+        note = Notes.objects.create(note_content=content, created_by=self.other_user, modified_by=self.other_user)
+        NotesUser.objects.create(notes=note, user=self.other_user, can_edit=True, can_delete=True)
+        NotesUser.objects.create(notes=note, user=self.user_object)
+        return note
+
+    def sync(self, since=0, **params):
+        res = self.client.get(reverse('get_note_changes'), {'since': since, **params})
+        self.assertEqual(res.status_code, 200)
+        return res.data['data']
+
+    def actions(self, data):
+        return [(change['note_id'], change['action']) for change in data['changes']]
+
+    def test_first_sync_returns_shared_notes(self):
+        data = self.sync()
+        self.assertEqual(self.actions(data), [(self.note.id, 'created')])
+        self.assertEqual(data['changes'][0]['note']['note_content'], 'Test Note')
+        self.assertFalse(data['has_more'])
+        self.assertEqual(self.sync(data['cursor'])['changes'], [])
+
+    def test_update_delete_and_unshare(self):
+        cursor = self.sync()['cursor']
+        self.note.note_content = 'Test Note Edit'
+        self.note.save()
+        data = self.sync(cursor)
+        self.assertEqual(self.actions(data), [(self.note.id, 'updated')])
+        self.assertEqual(data['changes'][0]['note']['note_content'], 'Test Note Edit')
+        self.assertGreater(data['cursor'], cursor)
+
+        unshared, cursor = self.create_note('Unshared Note'), data['cursor']
+        share = NotesUser.objects.get(notes=unshared, user=self.user_object)
+        share.can_read = False
+        share.save()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.other_user)}')
+        self.assertEqual(self.client.delete(reverse('get_notes', kwargs={'note_id': self.note.id})).status_code, 200)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.refresh}')
+        data = self.sync(cursor)
+        self.assertEqual(self.actions(data), [(unshared.id, 'unshared'), (self.note.id, 'deleted')])
+        self.assertEqual([change['note'] for change in data['changes']], [None, None])
+
+    def test_unrelated_notes_are_not_reported(self):
+        cursor = self.sync()['cursor']
+        note = Notes.objects.create(note_content='Private Note', created_by=self.other_user, modified_by=self.other_user)
+        NotesUser.objects.create(notes=note, user=self.other_user)
+        self.assertEqual(self.sync(cursor)['changes'], [])
+
+    def test_limit_pages_through_changes(self):
+        notes = [self.note] + [self.create_note(f'Test Note {i}') for i in range(4)]
+        data = self.sync(limit=2)
+        self.assertTrue(data['has_more'])
+        seen = self.actions(data)
+        while data['has_more']:
+            data = self.sync(data['cursor'], limit=2)
+            seen += self.actions(data)
+        self.assertEqual(seen, [(note.id, 'created') for note in notes])
+
+    def test_invalid_cursor(self):
+        res = self.client.get(reverse('get_note_changes'), {'since': 'abc'})
+        self.assertEqual(res.status_code, 400)
+
+    def test_queries_independent_of_note_count(self):
+        for i in range(10):
+            self.create_note(f'Test Note {i}')
+        cursor = self.sync()['cursor']
+        self.note.note_content = 'Test Note Edit'
+        self.note.save()
+        with CaptureQueriesContext(connection) as few_notes:
+            self.sync(cursor)
+        for i in range(10, 30):
+            self.create_note(f'Test Note {i}')
+        cursor = self.sync()['cursor']
+        self.note.note_content = 'Test Note Edit Again'
+        self.note.save()
+        with CaptureQueriesContext(connection) as many_notes:
+            data = self.sync(cursor)
+        self.assertEqual(self.actions(data), [(self.note.id, 'updated')])
+        self.assertEqual(len(few_notes), len(many_notes))
+
+
+class TestImportNotes(TestSetup):
+    def ndjson(self, rows):
+        return ''.join((row if isinstance(row, str) else json.dumps(row)) + '\n' for row in rows)
+
+    def test_import_endpoint(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.refresh}')
+        body = self.ndjson([{'note_content': 'First', 'note_type': 'text'}, '{broken', {'note_type': 'text'}, '',
+                            {'note_content': 'Second'}])
+        res = self.client.post(reverse('import_notes'), body, content_type='application/x-ndjson')
+        self.assertEqual(res.status_code, 201)
+        self.assertEqual(res.data['data']['imported'], 2)
+        self.assertEqual([error['line'] for error in res.data['data']['errors']], [2, 3])
+        self.assertIn('note_content', res.data['data']['errors'][1]['errors'])
+
+        notes = Notes.get_shared_with(self.user_object).order_by('id')
+        self.assertEqual([note.note_content for note in notes], ['First', 'Second'])
+        self.assertTrue(all(share.can_delete for share in NotesUser.objects.filter(user=self.user_object)))
+        res = self.client.get(reverse('get_notes', kwargs={'note_id': notes[0].id}))
+        self.assertEqual(res.status_code, 200)
+
+    def test_import_nothing_valid(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.refresh}')
+        res = self.client.post(reverse('import_notes'), self.ndjson(['[]']), content_type='application/x-ndjson')
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(res.data['data']['failed'], 1)
+
+    def test_import_queries_per_chunk(self):
+        rows = self.ndjson([{'note_content': f'Note {i}'} for i in range(10)]).splitlines()
+        with CaptureQueriesContext(connection) as queries:
+            summary = import_notes(rows, self.user_object, chunk_size=5)
+        self.assertEqual(summary['imported'], 10)
+        inserts = [query for query in queries if query['sql'].startswith('INSERT')]
+        self.assertEqual(len(inserts), 4)
+
+    def test_import_command(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.ndjson', delete=False) as file:
+            file.write(self.ndjson([{'note_content': 'From File'}]))
+        self.addCleanup(os.remove, file.name)
+        call_command('import_notes', file.name, owner=self.user_object.username, verbosity=0)
+        self.assertEqual(Notes.get_shared_with(self.user_object).get().note_content, 'From File')
+
+
+class TestAsyncNotesViews(TestSetup):
+    def setUp(self):
+        super().setUp()
+        self.note = Notes.objects.create(note_content='Test Note', created_by=self.user_object, modified_by=self.user_object)
+        NotesUser.objects.create(notes=self.note, user=self.user_object, can_edit=True, can_delete=True)
+        self.note.note_content = 'Changed Note'
+        self.note.save()
+        self.headers = {'Authorization': f'Bearer {self.refresh}'}
+
+    async def assert_same_as_sync(self, async_name, sync_name, **kwargs):
+        res = await self.async_client.get(reverse(async_name, kwargs=kwargs), headers=self.headers)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.refresh}')
+        sync_res = await sync_to_async(self.client.get)(reverse(sync_name, kwargs=kwargs))
+        self.assertEqual(res.status_code, sync_res.status_code)
+        self.assertEqual(res.json(), json.loads(sync_res.content))
+
+    async def test_async_endpoints_match_sync(self):
+        await self.assert_same_as_sync('async_get_notes', 'get_notes', note_id=self.note.id)
+        await self.assert_same_as_sync('async_get_detailed_notes', 'get_detailed_notes', note_id=self.note.id)
+        await self.assert_same_as_sync('async_get_history', 'get_history', note_id=self.note.id)
+
+    async def test_async_list(self):
+        res = await self.async_client.get(reverse('async_get_all_notes'), headers=self.headers)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual([note['id'] for note in res.json()['data']], [self.note.id])
+
+    async def test_async_requires_authentication(self):
+        res = await self.async_client.get(reverse('async_get_notes', kwargs={'note_id': self.note.id}))
+        self.assertEqual(res.status_code, 401)
+        self.assertIn('WWW-Authenticate', res)
+        res = await self.async_client.get(reverse('async_get_notes', kwargs={'note_id': self.note.id}),
+                                          headers={'Authorization': 'Bearer invalid'})
+        self.assertEqual(res.status_code, 401)
+
+    async def test_async_permission_denied(self):
+        another_user = await User.objects.acreate(username='testuser009', password='testpassword', email='testmail009@mail.com')
+        headers = {'Authorization': f'Bearer {AccessToken.for_user(another_user)}'}
+        res = await self.async_client.get(reverse('async_get_notes', kwargs={'note_id': self.note.id}), headers=headers)
+        self.assertEqual(res.status_code, 404)
+        self.assertEqual(res.json(), {'detail': 'Requested Note is not shared with the User'})
+
+
+    async def test_blocking_cache_kept_off_the_event_loop(self):
+        calls_on_loop = []
+        get_many = DjangoCacheBackend.get_many
+
+        def recording_get_many(backend, keys):
+            try:
+                asyncio.get_running_loop()
+                calls_on_loop.append(keys)
+            except RuntimeError:
+                pass
+            return get_many(backend, keys)
+
+        django_backend = {'BACKEND': 'django', 'CACHE_ALIAS': 'default'}
+        with self.settings(NOTES_CACHES={'acl': django_backend, 'responses': django_backend, 'users': django_backend}), \
+                mock.patch.object(DjangoCacheBackend, 'get_many', recording_get_many):
+            for name in ('async_get_notes', 'async_get_detailed_notes'):
+                res = await self.async_client.get(reverse(name, kwargs={'note_id': self.note.id}), headers=self.headers)
+                self.assertEqual(res.status_code, 200)
+        self.assertEqual(calls_on_loop, [])
+
+class TestFastSerializers(TestSetup):
+    def setUp(self):
+        super().setUp()
+        roles = [Role.objects.create(name=f'FastRole{i}', description=None if i else 'first') for i in range(2)]
+        users = [self.user_object] + [
+            User.objects.create(username=f'fastuser{i}', email=f'fastuser{i}@mail.com', role=roles[i % 3] if i % 3 < 2 else None)
+            for i in range(5)]
+        for i in range(8):
+            owner = users[i % len(users)]
+            note = Notes.objects.create(note_content=f'Test Note {i}', note_type='text' if i % 2 else 'list',
+                                        created_by=owner, modified_by=users[(i + 1) % len(users)])
+            for offset in range(i % 4):
+                NotesUser.objects.create(notes=note, user=users[(i + offset) % len(users)], can_edit=bool(offset % 2),
+                                         is_active=offset != 2, is_deleted=offset == 2)
+
+    def assert_same_json(self, fast_data, drf_data):
+        self.assertEqual(json.dumps(fast_data), json.dumps(drf_data))
+
+    def test_notes_match_note_serializer(self):
+        queryset = Notes.objects.order_by('id')
+        drf_data = serializers.NoteSerializer(serializers.NoteSerializer.setup_eager_loading(queryset), many=True).data
+        self.assert_same_json(fast_serializers.serialize_notes(queryset), drf_data)
+        self.assert_same_json(fast_serializers.serialize_notes(queryset.values(*fast_serializers.NOTE_FIELDS)), drf_data)
+
+    def test_shares_match_share_serializer(self):
+        queryset = NotesUser.objects.order_by('id')
+        drf_data = serializers.NoteShareSerializer1(serializers.NoteShareSerializer1.setup_eager_loading(queryset), many=True).data
+        self.assert_same_json(fast_serializers.serialize_note_shares(queryset), drf_data)
+
+    def test_notes_list_query_count(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.refresh}')
+        self.client.get(reverse('get_all_notes'))
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get(reverse('get_all_notes'))
+        self.assertEqual(res.status_code, 200)
+        # ETag, the page, its shares and its users
+        self.assertEqual(len(queries), 4)
+
+
+@override_settings(NOTES_REQUEST_TIMING={'SAMPLE_RATE': 1.0})
+class TestRequestTiming(TestSetup):
+    def setUp(self):
+        super().setUp()
+        note = Notes.objects.create(note_content='Timed note', created_by=self.user_object, modified_by=self.user_object)
+        NotesUser.objects.create(notes=note, user=self.user_object, can_read=True, can_edit=True, can_delete=True)
+        self.note = note
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.refresh}')
+
+    def server_timing(self, response):
+        return dict(metric.split(';', 1) for metric in response['Server-Timing'].split(', '))
+
+    def test_server_timing_header(self):
+        with self.assertLogs('notes_management.middleware', 'INFO'):
+            res = self.client.get(reverse('get_all_notes'))
+        self.assertEqual(res.status_code, 200)
+        metrics = self.server_timing(res)
+        self.assertEqual(set(metrics), {'db', 'view', 'serialize', 'render', 'total', 'route'})
+        self.assertIn('queries"', metrics['db'])
+        self.assertEqual(metrics['route'], 'desc="get_all_notes"')
+
+    def test_log_line_tagged_with_url_name(self):
+        with self.assertLogs('notes_management.middleware', 'INFO') as logs:
+            with CaptureQueriesContext(connection) as queries:
+                self.client.get(reverse('get_history', kwargs={'note_id': self.note.id}))
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record['url_name'], 'get_history')
+        self.assertEqual(record['status'], 200)
+        self.assertEqual(record['queries'], len(queries))
+        self.assertGreaterEqual(record['total_ms'], record['view_ms'])
+
+    async def test_async_request_timed(self):
+        with self.assertLogs('notes_management.middleware', 'INFO') as logs:
+            res = await self.async_client.get(reverse('async_get_all_notes'), headers={'Authorization': f'Bearer {self.refresh}'})
+        self.assertEqual(res.status_code, 200)
+        self.assertIn('route;desc="async_get_all_notes"', res['Server-Timing'])
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record['url_name'], 'async_get_all_notes')
+        self.assertGreater(record['queries'], 0)
+
+    def test_disabled_when_not_sampled(self):
+        with override_settings(NOTES_REQUEST_TIMING={'SAMPLE_RATE': 0}):
+            self.client.handler.load_middleware()
+            res = self.client.get(reverse('get_all_notes'))
+        self.assertNotIn('Server-Timing', res)
+
+
+class TestRequestProfiling(TestSetup):
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        note = Notes.objects.create(note_content='Profiled note', created_by=self.user_object, modified_by=self.user_object)
+        NotesUser.objects.create(notes=note, user=self.user_object, can_read=True, can_edit=True, can_delete=True)
+
+    def profile_settings(self, **options):
+        return override_settings(NOTES_REQUEST_PROFILING={'ENABLED': True, 'DIRECTORY': self.directory, **options})
+
+    def get_notes(self, token, **headers):
+        self.client.handler.load_middleware()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        return self.client.get(reverse('get_all_notes'), headers=headers)
+
+    def index(self):
+        with open(os.path.join(self.directory, 'index.jsonl')) as index_file:
+            return [json.loads(line) for line in index_file]
+
+    def test_header_profiles_superuser_request(self):
+        with self.profile_settings(INTERVAL=0.0001):
+            res = self.get_notes(self.refresh, X_Profile='1')
+        self.assertEqual(res.status_code, 200)
+        [record] = self.index()
+        self.assertEqual(record['request_id'], res['X-Profile-Id'])
+        self.assertEqual(record['url_name'], 'get_all_notes')
+        pstats_path, collapsed_path = record['files']
+        self.assertEqual(pstats_path, os.path.join(self.directory, 'get_all_notes', f"{res['X-Profile-Id']}.pstats"))
+        self.assertTrue(os.path.exists(pstats_path))
+        with open(collapsed_path) as collapsed_file:
+            lines = collapsed_file.read().splitlines()
+        self.assertTrue(any('get (views.py:' in line for line in lines))
+        self.assertTrue(all(line.rsplit(' ', 1)[1].isdigit() for line in lines))
+
+    def test_header_ignored_for_other_users(self):
+        user = User.objects.create(username='profileuser', email='profileuser@mail.com')
+        with self.profile_settings():
+            res = self.get_notes(AccessToken.for_user(user), X_Profile='1')
+        self.assertNotIn('X-Profile-Id', res)
+        self.assertFalse(os.path.exists(os.path.join(self.directory, 'index.jsonl')))
+
+    def test_sampled_request_with_sampling_profiler(self):
+        with self.profile_settings(SAMPLE_RATE=1.0, PROFILER='sampling', INTERVAL=0.0001):
+            res = self.get_notes(self.refresh)
+        [record] = self.index()
+        self.assertEqual(record['files'], [os.path.join(self.directory, 'get_all_notes', f"{res['X-Profile-Id']}.collapsed")])
+
+    async def test_async_request_profiled(self):
+        with self.profile_settings(INTERVAL=0.0001):
+            res = await self.async_client.get(reverse('async_get_all_notes'),
+                                              headers={'Authorization': f'Bearer {self.refresh}', 'X-Profile': '1'})
+        self.assertEqual(res.status_code, 200)
+        [record] = await sync_to_async(self.index)()
+        self.assertEqual(record['request_id'], res['X-Profile-Id'])
+        self.assertEqual(record['url_name'], 'async_get_all_notes')
+
+    def test_not_loaded_when_disabled(self):
+        with override_settings(NOTES_REQUEST_PROFILING={'ENABLED': False, 'SAMPLE_RATE': 1.0, 'DIRECTORY': self.directory}):
+            res = self.get_notes(self.refresh, X_Profile='1')
+        self.assertNotIn('X-Profile-Id', res)
+        self.assertEqual(os.listdir(self.directory), [])
+
+
+class TestSeedNotes(TestCase):
+    def seed(self, prefix, **options):
+        options = {'users': 6, 'roles': 2, 'notes': 25, 'shares': 'fixed:2', 'edits': 'uniform:1-4',
+                   'note_words': 'lognormal:30,0.5', 'chunk_size': 10, 'seed': 3, 'prefix': prefix, 'verbosity': 0, **options}
+        call_command('seed_notes', **options)
+        notes = Notes.objects.filter(created_by__username__startswith=f'{prefix}-').order_by('id')
+        return [(note.note_content, note.note_type, note.created_by.username.split('-')[-1], note.created_at, note.modified_at)
+                for note in notes]
+
+    def test_creates_notes_with_shares_and_history(self):
+        self.seed('one')
+        self.assertEqual(User.objects.filter(username__startswith='one-user-').count(), 6)
+        self.assertEqual(Role.objects.filter(name__startswith='one-role-').count(), 2)
+        self.assertEqual(User.objects.filter(username='one-user-0').first().check_password('Welcome@123'), True)
+        self.assertEqual(NotesUser.objects.count(), 25 * 3)
+        for note in Notes.objects.all():
+            self.assertTrue(NotesUser.objects.filter(notes=note, user=note.created_by, can_delete=True).exists())
+            audits = materialize_audits(list(NotesAudit.objects.filter(notes=note).order_by('id')))
+            self.assertTrue(1 <= len(audits) <= 4)
+            self.assertEqual(note.audit_count, len(audits))
+            self.assertEqual(audits[-1].new_note_content, note.note_content)
+            for previous, audit in zip(audits, audits[1:]):
+                self.assertEqual(audit.old_note_content, previous.new_note_content)
+
+    def test_deterministic_whatever_the_workers(self):
+        first = self.seed('one')
+        self.assertEqual(self.seed('two'), first)
+        self.assertEqual(self.seed('three', workers=2), first)
+        self.assertNotEqual(self.seed('four', seed=4), first)
+
+    def test_reference_time(self):
+        notes = self.seed('one', reference_time='2020-06-01T12:00:00')
+        self.assertTrue(all(modified_at <= datetime(2020, 6, 1, 12, tzinfo=dt_timezone.utc) for *_, modified_at in notes))
+        self.assertNotEqual(self.seed('two'), notes)
+        with self.assertRaises(CommandError):
+            self.seed('three', reference_time='yesterday')
+
+    def test_existing_prefix_rejected(self):
+        self.seed('one')
+        with self.assertRaises(CommandError):
+            self.seed('one')
+
+
+# The in-memory test database locks whole tables between threads, so the tests
+# change notes inside a transaction and only query again once the writer is done
+@override_settings(NOTES_AUDIT_WRITER={'MODE': 'batched', 'BATCH_SIZE': 3})
+class TestBatchedAuditWriter(TransactionTestCase):
+    def setUp(self):
+        clear_caches()
+        self.user = User.objects.create(username='writeruser', email='writeruser@mail.com', is_superuser=True)
+        self.notes = [Notes.objects.create(note_content=f'Note {i} v0', created_by=self.user, modified_by=self.user)
+                      for i in range(2)]
+        self.addCleanup(audit_writer.close_writer)
+
+    def edit(self, note, content):
+        note.note_content = content
+        note.save()
+
+    def history(self, note):
+        return [(audit.old_note_content, audit.new_note_content)
+                for audit in materialize_audits(list(NotesAudit.objects.filter(notes=note).order_by('id')))]
+
+    def test_rows_written_in_order_per_note(self):
+        with transaction.atomic():
+            for version in range(1, 6):
+                for note in self.notes:
+                    self.edit(note, f'{note.note_content[:-1]}{version}')
+        audit_writer.get_writer().flush()
+        for note in self.notes:
+            expected = [(f'{note.note_content[:-1]}{version}', f'{note.note_content[:-1]}{version + 1}') for version in range(5)]
+            self.assertEqual(self.history(note), expected)
+            self.assertEqual(Notes.objects.get(pk=note.pk).audit_count, 5)
+
+    def test_written_after_commit_only(self):
+        with transaction.atomic():
+            self.edit(self.notes[0], 'Note 0 committed')
+            self.assertFalse(NotesAudit.objects.exists())
+        audit_writer.get_writer().flush()
+        try:
+            with transaction.atomic():
+                self.edit(self.notes[1], 'Note 1 rolled back')
+                raise ValueError
+        except ValueError:
+            pass
+        audit_writer.get_writer().flush()
+        self.assertEqual(self.history(self.notes[0]), [('Note 0 v0', 'Note 0 committed')])
+        self.assertEqual(self.history(self.notes[1]), [])
+
+    def test_close_drains_the_queue(self):
+        with transaction.atomic():
+            for version in range(1, 21):
+                self.edit(self.notes[0], f'Note 0 v{version}')
+        audit_writer.close_writer()
+        self.assertEqual(len(self.history(self.notes[0])), 20)
+        # A closed writer falls back to writing in the request
+        writer = audit_writer.BatchedAuditWriter()
+        writer.close()
+        writer.enqueue([NotesAudit(notes=self.notes[1], modified_by=self.user, old_note_content='a', new_note_content='b',
+                                   old_note_type='text', new_note_type='text', created_at=self.notes[1].created_at)])
+        self.assertEqual(self.history(self.notes[1]), [('a', 'b')])
+
+    def test_full_queue_writes_in_the_request(self):
+        writer = audit_writer.BatchedAuditWriter(max_pending=1, enqueue_timeout=0.01)
+        self.addCleanup(writer.close)
+        audit = NotesAudit(notes=self.notes[0], modified_by=self.user, old_note_content='a', new_note_content='b',
+                           old_note_type='text', new_note_type='text', created_at=self.notes[0].created_at)
+        # Keeps the writer thread from taking anything off the queue
+        with mock.patch.object(writer, '_write', side_effect=lambda audits: time.sleep(0.5)):
+            writer.enqueue([])
+            time.sleep(0.05)
+            writer.enqueue([])
+            with CaptureQueriesContext(connection) as queries, self.assertLogs('notes_app.audit_writer', 'WARNING'):
+                writer.enqueue([audit])
+        self.assertTrue(any('INSERT INTO "notes_app_notesaudit"' in query['sql'] for query in queries))
+
+    def test_dead_thread_writes_in_the_request(self):
+        writer = audit_writer.BatchedAuditWriter()
+        writer._queue.put(None)
+        writer._thread.join()
+        writer.enqueue([NotesAudit(notes=self.notes[0], modified_by=self.user, old_note_content='a', new_note_content='b',
+                                   old_note_type='text', new_note_type='text', created_at=self.notes[0].created_at)])
+        self.assertEqual(self.history(self.notes[0]), [('a', 'b')])
+        writer.close()
+
+    def test_sync_mode_writes_in_the_request(self):
+        with override_settings(NOTES_AUDIT_WRITER={'MODE': 'sync'}):
+            with CaptureQueriesContext(connection) as queries:
+                self.edit(self.notes[0], 'Note 0 v1')
+        self.assertTrue(any('INSERT INTO "notes_app_notesaudit"' in query['sql'] for query in queries))
+        self.assertEqual(self.history(self.notes[0]), [('Note 0 v0', 'Note 0 v1')])
@@ -1,14 +1,29 @@
 from django.urls import path
 
-from . import views
+from . import async_views, views
 
 urlpatterns = [
     path("notes/", views.NotesView.as_view(), name='get_all_notes'),
+    # Kept for existing clients; the note list already is the feed
+    path("notes/feed/", views.NotesView.as_view(), name='get_notes_feed'),
+    path("notes/search/", views.NotesSearchView.as_view(), name='search_notes'),
+    path("notes/changes/", views.NotesChangesView.as_view(), name='get_note_changes'),
+    path("notes/export/", views.NotesExportView.as_view(), name='export_notes'),
+    path("notes/import/", views.NotesImportView.as_view(), name='import_notes'),
+    path("notes/cache-stats/", views.CacheStatsView.as_view(), name='get_cache_stats'),
     path("notes/create/", views.NotesCreateView.as_view(), name='create_notes'),
     path("notes/<int:note_id>/", views.SingleNoteView.as_view(), name='get_notes'),
     path("notes/<int:note_id>/detail/", views.SingleNoteDetailView.as_view(), name='get_detailed_notes'),
+    path("notes/<int:note_id>/diff/", views.NotesDiffView.as_view(), name='get_note_diff'),
+    path("notes/<int:note_id>/as-of/", views.NotesAsOfView.as_view(), name='get_note_as_of'),
     path("notes/share/", views.NotesShareView.as_view(), name='share_notes'),
+    path("notes/share/role/", views.NotesRoleShareView.as_view(), name='share_notes_with_role'),
     path("notes/version-history/<int:note_id>/", views.NotesHistoryView.as_view(), name='get_history'),
+    # Async-native variants of the read endpoints, for ASGI deployments
+    path("async/notes/", async_views.AsyncNotesView.as_view(), name='async_get_all_notes'),
+    path("async/notes/<int:note_id>/", async_views.AsyncSingleNoteView.as_view(), name='async_get_notes'),
+    path("async/notes/<int:note_id>/detail/", async_views.AsyncSingleNoteDetailView.as_view(), name='async_get_detailed_notes'),
+    path("async/notes/version-history/<int:note_id>/", async_views.AsyncNotesHistoryView.as_view(), name='async_get_history'),
     # path("user/", views.UserView.as_view(), name='get_user'), 
     # path("signup/", views.SignUpView.as_view(), name='create_user'), 
     # path("user/<int:pk>/", views.SingleUserView.as_view(), name='get_put_delete_user'), 
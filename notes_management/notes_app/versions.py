@@ -0,0 +1,127 @@
+"""
+Single versions of a note rebuilt from its NotesAudit rows, for the diff and
+as-of endpoints. Version N is the content right after audit row N; version 0
+(ORIGINAL) is the content before the first change. A version is found with one
+indexed lookup and, with delta storage, at most one keyframe interval of rows,
+so its cost does not grow with the length of the history. Rebuilt versions are
+kept in the 'versions' cache; audit rows only change when they are deactivated
+or deleted, which invalidates the versions of their note.
+"""
+import difflib
+
+from notes_management.cache import MISSING, get_cache
+from .audit import materialize_audits
+from .models import NotesAudit
+
+
+ORIGINAL = 0
+DIFF_FORMATS = ('unified', 'structured')
+
+
+def _versions_cache():
+    return get_cache('versions')
+
+
+def _audits_dependency(note_id):
+    return f'audits:{note_id}'
+
+
+def _cached(note, version_id, build):
+    """
+    The version from the cache, or built by `build`, which returns the version
+    and whether it may be cached
+    """
+    cache = _versions_cache()
+    key, dependencies = f'{note.id}:{version_id}', [_audits_dependency(note.id)]
+    version = cache.get(key, dependencies)
+    if version is not MISSING:
+        return version
+    # Read before the rows, so that a row deleted meanwhile leaves the entry stale
+    versions = cache.get_versions(*dependencies)
+    version, cacheable = build()
+    if cacheable:
+        cache.set(key, version, dependencies, versions=versions)
+    return version
+
+
+def _audits(note):
+    return NotesAudit.objects.active().filter(notes_id=note.id)
+
+
+def _original(note):
+    def build():
+        first = _audits(note).order_by('id').first()
+        if first is None:
+            # Never changed: the note itself is the only version, and it may still change
+            return {'version': ORIGINAL, 'note_content': note.note_content, 'note_type': note.note_type,
+                    'created_at': note.created_at, 'modified_by': note.created_by_id}, False
+        materialize_audits([first])
+        return {'version': ORIGINAL, 'note_content': first.old_note_content, 'note_type': first.old_note_type,
+                'created_at': note.created_at, 'modified_by': note.created_by_id}, True
+    return _cached(note, ORIGINAL, build)
+
+
+def get_version(note, version_id):
+    """
+    The version of the note after audit row `version_id` (ORIGINAL for the
+    content before the first change), or None when the note has no such row
+    """
+    if version_id == ORIGINAL:
+        return _original(note)
+
+    def build():
+        audit = _audits(note).filter(pk=version_id).first()
+        if audit is None:
+            return None, False
+        materialize_audits([audit])
+        return {'version': audit.id, 'note_content': audit.new_note_content, 'note_type': audit.new_note_type,
+                'created_at': audit.created_at, 'modified_by': audit.modified_by_id}, True
+    return _cached(note, version_id, build)
+
+
+def get_latest_version(note):
+    latest_id = _audits(note).order_by('-id').values_list('id', flat=True).first()
+    return get_version(note, latest_id or ORIGINAL)
+
+
+def get_version_at(note, at):
+    """
+    The version of the note current at datetime `at`, or None if the note did
+    not exist yet
+    """
+    version_id = (_audits(note).filter(created_at__lte=at).order_by('-created_at', '-id')
+                  .values_list('id', flat=True).first())
+    if version_id is not None:
+        return get_version(note, version_id)
+    if note.created_at <= at:
+        return _original(note)
+    return None
+
+
+def diff_versions(old, new, diff_format='unified'):
+    """
+    Line diff between two versions. 'unified' is the text of a unified diff;
+    'structured' is a list of difflib opcodes with the lines they remove and add.
+    """
+    old_lines, new_lines = old['note_content'].splitlines(), new['note_content'].splitlines()
+    if diff_format == 'unified':
+        return '\n'.join(difflib.unified_diff(old_lines, new_lines, fromfile=f"version {old['version']}",
+                                              tofile=f"version {new['version']}", lineterm=''))
+
+    matcher = difflib.SequenceMatcher(None, old_lines, new_lines, autojunk=False)
+    return [{
+        'op': tag,
+        'old_start': old_start,
+        'old_end': old_end,
+        'new_start': new_start,
+        'new_end': new_end,
+        'old_lines': old_lines[old_start:old_end] if tag != 'equal' else [],
+        'new_lines': new_lines[new_start:new_end] if tag != 'equal' else [],
+    } for tag, old_start, old_end, new_start, new_end in matcher.get_opcodes()]
+
+
+def invalidate_audits(note_ids):
+    """
+    Drop the cached versions of the notes, after audit rows changed or went away
+    """
+    _versions_cache().bump(*(_audits_dependency(note_id) for note_id in note_ids))
@@ -1,14 +1,27 @@
+from django.db import transaction
 from django.db.models import Q
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.cache import quote_etag
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.permissions import BasePermission
-from rest_framework.exceptions import PermissionDenied, NotFound, NotAuthenticated
-from rest_framework import status
+from rest_framework.exceptions import PermissionDenied, NotFound, NotAuthenticated, ValidationError
+from rest_framework import fields, status
+from drf_yasg import openapi
 from drf_yasg.utils import swagger_auto_schema
-from .models import Notes, NotesUser, NotesAudit
-from . import serializers
+from user_app.models import Role, User
+from user_app.serializers import UserSerializerLite
+from .models import ChangeSequence, Notes, NotesRole, NotesUser, NotesAudit
+from . import acl, changes, etags, export, fast_serializers, feed, importer, response_cache, search, serializers, versions
+from .audit import materialize_audits
+from .pagination import NotesFeedPagination, NotesHistoryPagination
+from .parsers import NDJSONParser
 from notes_management import serializers as gs
+from notes_management.cache import cache_stats
 # Create your views here.
 
 
@@ -21,20 +34,25 @@ class IsAuthorized(BasePermission):
         """
         Check if the user making the request is authorized.
         """
-        note_id = view.kwargs.get('note_id')
-        try:
-            is_present = NotesUser.objects.get(notes_id=note_id, user_id=request.user, is_active=True, is_deleted=False)
-        except NotesUser.DoesNotExist:
+        permissions = acl.get_note_permissions(view.kwargs.get('note_id'), request.user.id, getattr(request.user, 'role_id', None))
+        return self.check_note_permissions(request, permissions)
+
+    def check_note_permissions(self, request, permissions):
+        """
+        Check the (can_read, can_edit, can_delete) triple against the request method.
+        """
+        if permissions is None:
             raise NotFound("Requested Note is not shared with the User")
+        can_read, can_edit, can_delete = permissions
         
         if request.method == "GET":
-            if not is_present.can_read:
+            if not can_read:
                 raise PermissionDenied("You Do Not Permission to Read the Note")
         elif request.method == "PUT":
-            if not is_present.can_edit:
+            if not can_edit:
                 raise PermissionDenied("You Do Not Permission to Edit the Note")
         elif request.method == "DELETE":
-            if not is_present.can_delete:
+            if not can_delete:
                 raise PermissionDenied("You Do Not Permission to Delete the Note")
         else:
             return False
@@ -50,15 +68,23 @@ class IsAuthorizedToShare(BasePermission):
         """
         Check if the user making the request is authorized.
         """
-        req_data = request.data.copy()
-        can_share = False
+        req_data = request.data
+        if not isinstance(req_data, list):
+            return False
+        note_ids = []
         for i in req_data:
             try:
-                note_exist = Notes.objects.get(pk=i.get('notes'), is_active=True, is_deleted=False)
-            except Notes.DoesNotExist:
+                note_ids.append(int(i.get('notes')))
+            except (AttributeError, TypeError, ValueError):
+                raise NotFound("Requested Note Not Present.!")
+
+        # One query for every note referenced by the payload
+        note_owners = dict(Notes.get_active().filter(pk__in=set(note_ids)).values_list('id', 'created_by_id'))
+        can_share = False
+        for note_id in note_ids:
+            if note_id not in note_owners:
                 raise NotFound("Requested Note Not Present.!")
-            # is_owner = note_exist.created_by
-            if note_exist.created_by != request.user:
+            if note_owners[note_id] != request.user.id:
                 raise PermissionDenied("Only Owner Can Share the Note.!")
             can_share = True
         return can_share
@@ -66,23 +92,137 @@ class IsAuthorizedToShare(BasePermission):
 
 class NotesView(APIView):
     permission_classes = (IsAuthenticated, )
+    pagination_class = NotesFeedPagination
 
     @swagger_auto_schema(
-        responses={200: serializers.NoteReturnSerializer(), 403:gs.Generic403Serializer(), 404:gs.Generic404Serializer()}
+        manual_parameters=[NotesFeedPagination.cursor_parameter, NotesFeedPagination.page_size_parameter],
+        responses={200: serializers.NotePageReturnSerializer(), 304:'Not Modified', 403:gs.Generic403Serializer(), 404:gs.Generic404Serializer()}
     )
+    @method_decorator(condition(etag_func=etags.notes_list_etag))
     def get(self, request):
         """
-        Get All Roles
+        Get All Notes Shared with the User. Newest first, paginated with an opaque cursor
         """
-        notes_queryset = Notes.get_active()
-        if notes_queryset.exists():
-            serialized_data = serializers.NoteSerializer(notes_queryset, many=True)
-            return Response({'status': status.HTTP_200_OK, 'detail': 'Success', 'data':serialized_data.data})
-        else:
+        paginator = self.pagination_class()
+        # Walks the (user, -note_modified_at) share index instead of sorting every shared note
+        notes_page = feed.get_feed_page(request.user, paginator, request)
+        if not notes_page and paginator.cursor is None:
             return Response({'status': status.HTTP_404_NOT_FOUND, 'detail': 'Note Not Found. Please Create a Note', 'data':[]},
                             status=status.HTTP_404_NOT_FOUND)
+        # Same output as NoteSerializer, without serializer instances
+        return paginator.get_paginated_response(fast_serializers.serialize_notes(notes_page))
         
 
+class NotesSearchView(APIView):
+    permission_classes = (IsAuthenticated, )
+    page_size = 20
+    max_page_size = 100
+
+    @swagger_auto_schema(
+        manual_parameters=[
+            openapi.Parameter('q', openapi.IN_QUERY, type=openapi.TYPE_STRING, required=True, description='Words to search for.'),
+            openapi.Parameter('page_size', openapi.IN_QUERY, type=openapi.TYPE_INTEGER, description='Number of results (max 100).'),
+            openapi.Parameter('offset', openapi.IN_QUERY, type=openapi.TYPE_INTEGER, description='Number of results to skip.'),
+        ],
+        responses={200: serializers.NoteSearchReturnSerializer(), 400:gs.Generic400Serializer(), 403:gs.Generic403Serializer(), 404:gs.Generic404Serializer()}
+    )
+    def get(self, request):
+        """
+        Full-Text Search over the Notes Shared with the User. Best matches first
+        """
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response({'status': status.HTTP_400_BAD_REQUEST, 'detail': {'q': ['This field is required.']}, 'data':[]},
+                            status=status.HTTP_400_BAD_REQUEST)
+        try:
+            page_size = min(max(int(request.query_params.get('page_size', self.page_size)), 1), self.max_page_size)
+            offset = max(int(request.query_params.get('offset', 0)), 0)
+        except ValueError:
+            return Response({'status': status.HTTP_400_BAD_REQUEST, 'detail': 'page_size and offset must be integers.', 'data':[]},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            matches = search.search_notes(request.user, query, page_size, offset)
+        except search.SearchUnavailable as error:
+            return Response({'status': status.HTTP_501_NOT_IMPLEMENTED, 'detail': str(error), 'data':[]},
+                            status=status.HTTP_501_NOT_IMPLEMENTED)
+        if not matches:
+            return Response({'status': status.HTTP_404_NOT_FOUND, 'detail': 'No Notes Match the Search.', 'data':[]},
+                            status=status.HTTP_404_NOT_FOUND)
+
+        notes = Notes.objects.only(*serializers.NoteSearchSerializer.MODEL_FIELDS).in_bulk([note_id for note_id, _, _ in matches])
+        results = []
+        for note_id, rank, snippet in matches:
+            note = notes[note_id]
+            note.rank, note.snippet = rank, snippet
+            results.append(note)
+        serialized_data = serializers.NoteSearchSerializer(results, many=True)
+        return Response({'status': status.HTTP_200_OK, 'detail': 'Success', 'data':serialized_data.data})
+
+
+class NotesChangesView(APIView):
+    permission_classes = (IsAuthenticated, )
+    page_size = 500
+    max_page_size = 1000
+
+    @swagger_auto_schema(
+        manual_parameters=[
+            openapi.Parameter('since', openapi.IN_QUERY, type=openapi.TYPE_INTEGER,
+                              description='Cursor returned by the previous sync; 0 or omitted for everything.'),
+            openapi.Parameter('limit', openapi.IN_QUERY, type=openapi.TYPE_INTEGER, description='Number of changes (max 1000).'),
+        ],
+        responses={200: serializers.NoteChangesReturnSerializer(), 400:gs.Generic400Serializer(), 403:gs.Generic403Serializer()}
+    )
+    def get(self, request):
+        """
+        Notes Created, Updated, Deleted or Unshared for the User since a Cursor, oldest change first. Sync again from the returned cursor while has_more is true
+        """
+        try:
+            since = int(request.query_params.get('since') or 0)
+            limit = min(max(int(request.query_params.get('limit', self.page_size)), 1), self.max_page_size)
+        except ValueError:
+            return Response({'status': status.HTTP_400_BAD_REQUEST, 'detail': 'since and limit must be integers.', 'data':[]},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if since < 0:
+            return Response({'status': status.HTTP_400_BAD_REQUEST, 'detail': 'since must not be negative.', 'data':[]},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        note_changes, cursor, has_more = changes.get_changes(request.user, since, limit)
+        return Response({'status': status.HTTP_200_OK, 'detail': 'Success',
+                         'data': {'cursor': cursor, 'has_more': has_more, 'changes': note_changes}})
+
+
+class NotesExportView(APIView):
+    permission_classes = (IsAuthenticated, )
+    chunk_size = 500
+
+    @swagger_auto_schema(
+        manual_parameters=[
+            openapi.Parameter('cursor', openapi.IN_QUERY, type=openapi.TYPE_INTEGER,
+                              description='Resume after this note id (the id of the last line received).'),
+            openapi.Parameter('include_history', openapi.IN_QUERY, type=openapi.TYPE_BOOLEAN,
+                              description='Add the version history of every note.'),
+        ],
+        responses={200: 'One JSON note per line (application/x-ndjson).', 400:gs.Generic400Serializer(), 403:gs.Generic403Serializer()}
+    )
+    def get(self, request):
+        """
+        Export All Notes Shared with the User as NDJSON, ordered by id. Streamed, so it works for any number of notes
+        """
+        cursor = request.query_params.get('cursor')
+        try:
+            after_id = int(cursor) if cursor else None
+        except ValueError:
+            return Response({'status': status.HTTP_400_BAD_REQUEST, 'detail': 'cursor must be a note id.', 'data':[]},
+                            status=status.HTTP_400_BAD_REQUEST)
+        include_history = request.query_params.get('include_history', '').lower() in ('1', 'true', 'yes')
+
+        lines = export.iter_export_lines(request.user, after_id, include_history, chunk_size=self.chunk_size)
+        response = StreamingHttpResponse(lines, content_type='application/x-ndjson')
+        response['Content-Disposition'] = 'attachment; filename="notes.ndjson"'
+        return response
+
+
 class NotesCreateView(APIView):
     permission_classes = (IsAuthenticated, )
 
@@ -106,18 +246,40 @@ class NotesCreateView(APIView):
         return Response({'status': status.HTTP_400_BAD_REQUEST, 'detail': serializer.errors, 'data':[]}, status=status.HTTP_400_BAD_REQUEST)
 
 
+class NotesImportView(APIView):
+    permission_classes = (IsAuthenticated, )
+    parser_classes = (NDJSONParser, )
+    chunk_size = 1000
+
+    @swagger_auto_schema(
+        request_body=openapi.Schema(type=openapi.TYPE_STRING, description='One JSON note per line, with note_content and note_type.'),
+        responses={201: serializers.NoteImportReturnSerializer(), 400:gs.Generic400Serializer(), 403:gs.Generic403Serializer(),
+                   401:gs.Generic401Serializer()}
+    )
+    def post(self, request):
+        """
+        Import Notes from an NDJSON Body (Content-Type application/x-ndjson). Each valid line becomes a note owned by the User
+        """
+        summary = importer.import_notes(request.data, request.user, chunk_size=self.chunk_size)
+        if not summary['imported']:
+            return Response({'status': status.HTTP_400_BAD_REQUEST, 'detail': 'No Notes Imported.', 'data':summary},
+                            status=status.HTTP_400_BAD_REQUEST)
+        return Response({'status': status.HTTP_201_CREATED, 'detail': 'Notes Imported.', 'data':summary}, status=status.HTTP_201_CREATED)
+
+
 class SingleNoteView(APIView):
     permission_classes = (IsAuthenticated, IsAuthorized)
 
     @swagger_auto_schema(
-        responses={200: serializers.NoteReturnSerializer1(), 403:gs.Generic403Serializer(), 404:gs.Generic404Serializer()}
+        responses={200: serializers.NoteReturnSerializer1(), 304:'Not Modified', 403:gs.Generic403Serializer(), 404:gs.Generic404Serializer()}
     )
+    @method_decorator(condition(etag_func=etags.note_etag))
     def get(self, request, note_id):
         """
         Get Note By Primary Key. Available Only if Note is Shared with User
         """
         try:
-            notes_queryset = Notes.objects.get(pk=note_id, is_active=True, is_deleted=False)
+            notes_queryset = Notes.objects.active().get(pk=note_id)
         except Notes.DoesNotExist:
             return Response({'status': status.HTTP_404_NOT_FOUND, 'detail': 'Requested Note Not Found.', 'data':[]}, status=status.HTTP_404_NOT_FOUND)
         
@@ -127,14 +289,15 @@ class SingleNoteView(APIView):
     @swagger_auto_schema(
         request_body=serializers.NoteCreateSerializer,
         responses={201: serializers.NoteReturnSerializer(), 400:gs.Generic400Serializer(), 403:gs.Generic403Serializer(), 404:gs.Generic404Serializer(),
-                   401:gs.Generic401Serializer()}
+                   401:gs.Generic401Serializer(), 412:'Precondition Failed'}
     )
+    @method_decorator(condition(etag_func=etags.note_etag))
     def put(self, request, note_id):
         """
         Update Note By Primary Key. Available Only if Note is Shared with User and User can edit permission
         """
         try:
-            notes_queryset = Notes.objects.get(pk=note_id, is_active=True, is_deleted=False)
+            notes_queryset = Notes.objects.active().get(pk=note_id)
         except Notes.DoesNotExist:
             return Response({'status': status.HTTP_404_NOT_FOUND, 'detail': 'Requested Not Found.', 'data':[]}, status=status.HTTP_404_NOT_FOUND)
         
@@ -142,20 +305,24 @@ class SingleNoteView(APIView):
         request_data['modified_by'] = request.user.id
         serializer = serializers.NoteCreateSerializer(notes_queryset, data=request_data, partial=True)
         if serializer.is_valid():
-            serializer.save()
-            return Response({'status': status.HTTP_200_OK, 'detail': 'Note successfully updated.', 'data':serializer.data})
+            instance = serializer.save()
+            # A note the update deactivated has no tag any more
+            etag = etags.note_etag_for(instance)
+            return Response({'status': status.HTTP_200_OK, 'detail': 'Note successfully updated.', 'data':serializer.data},
+                            headers={'ETag': quote_etag(etag)} if etag else None)
         return Response({'status': status.HTTP_400_BAD_REQUEST, 'detail': 'Unable to update Note.', 'data':serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
     
     @swagger_auto_schema(
         responses={200: serializers.NoteReturnSerializer(), 400:gs.Generic400Serializer(), 403:gs.Generic403Serializer(), 404:gs.Generic404Serializer(),
-                   401:gs.Generic401Serializer()}
+                   401:gs.Generic401Serializer(), 412:'Precondition Failed'}
     )
+    @method_decorator(condition(etag_func=etags.note_etag))
     def delete(self, request, note_id):
         """
         Disable Note By Primary Key. Available Only if Note is Shared with User and User have delete permission
         """
         try:
-            notes_queryset = Notes.objects.get(pk=note_id, is_active=True, is_deleted=False)
+            notes_queryset = Notes.objects.active().get(pk=note_id)
         except Notes.DoesNotExist:
             return Response({'status': status.HTTP_404_NOT_FOUND, 'detail': 'Requested Note Not Found.', 'data':[]}, status=status.HTTP_404_NOT_FOUND)
         notes_queryset.is_active = False
@@ -164,6 +331,7 @@ class SingleNoteView(APIView):
         # request_data = request.data.copy()
         # request_data['modified_by'] = request.user.id
         notes_queryset.save()
+        acl.invalidate_note(note_id)
         # serializer = serializers.NoteCreateSerializer(notes_queryset, data=request_data, partial=True)
         # if serializer.is_valid():
         #     serializer.save()
@@ -174,19 +342,17 @@ class SingleNoteDetailView(APIView):
     permission_classes = (IsAuthenticated, IsAuthorized)
 
     @swagger_auto_schema(
-        responses={200: serializers.NoteReturnSerializer(), 403:gs.Generic403Serializer(), 404:gs.Generic404Serializer()}
+        responses={200: serializers.NoteReturnSerializer(), 304:'Not Modified', 403:gs.Generic403Serializer(), 404:gs.Generic404Serializer()}
     )
+    @method_decorator(condition(etag_func=etags.note_detail_etag))
     def get(self, request, note_id):
         """
         Get Note By Primary Key. Available Only if Note is Shared with User. Includes details of shared users and owner information
         """
-        try:
-            notes_queryset = Notes.objects.get(pk=note_id, is_active=True, is_deleted=False)
-        except Notes.DoesNotExist:
+        notes_data = response_cache.get_note_detail(note_id)
+        if notes_data is None:
             return Response({'status': status.HTTP_404_NOT_FOUND, 'detail': 'Requested Not Found.', 'data':[]}, status=status.HTTP_404_NOT_FOUND)
-        
-        notes_serializer = serializers.NoteSerializer(notes_queryset)
-        return Response({'status': status.HTTP_200_OK, 'detail': 'Note successfully retrieved.', 'data':notes_serializer.data})
+        return Response({'status': status.HTTP_200_OK, 'detail': 'Note successfully retrieved.', 'data':notes_data})
 
 
 class NotesShareView(APIView):
@@ -198,66 +364,254 @@ class NotesShareView(APIView):
     )
     def post(self, request):
         """
-        Share Notes with Other users. If already shared then Update the details with new input
+        Share Notes with Other users. If already shared then Update the details with new input.
+        The whole payload is resolved and written with a fixed number of queries
         """
-        request_data = request.data.copy()
-        new_note_shared = []
-        note_perm_updated = []
+        new_note_shared = {}
+        note_perm_updated = {}
         errors_in_data = []
-        for data in request_data:
-            user_id = data.get('user')
-            notes_id = data.get('notes')
+        valid_data = []
+        for data in request.data:
+            serializer = serializers.NoteShareBulkSerializer(data=data)
+            if serializer.is_valid():
+                valid_data.append(serializer.validated_data)
+            else:
+                errors_in_data.append(serializer.errors)
+
+        user_ids = {data['user'] for data in valid_data}
+        note_ids = {data['notes'] for data in valid_data}
+        users = {user.id: user for user in UserSerializerLite.setup_eager_loading(User.objects.filter(pk__in=user_ids))}
+        shared_notes = {(share.notes_id, share.user_id): share
+                        for share in NotesUser.objects.filter(notes_id__in=note_ids, user_id__in=user_ids)}
+        note_modified_at = dict(Notes.objects.filter(pk__in=note_ids).values_list('id', 'modified_at'))
+
+        for data in valid_data:
+            user_id = data.pop('user')
+            notes_id = data.pop('notes')
+            if user_id not in users:
+                errors_in_data.append({'user': [f'Invalid pk "{user_id}" - object does not exist.']})
+                continue
+
+            share_key = (notes_id, user_id)
+            shared_note = shared_notes.get(share_key)
+            if shared_note is None:
+                shared_note = NotesUser(notes_id=notes_id, note_modified_at=note_modified_at[notes_id], **data)
+                shared_notes[share_key] = new_note_shared[share_key] = shared_note
+            else:
+                for key, value in data.items():
+                    setattr(shared_note, key, value)
+                if share_key not in new_note_shared:
+                    note_perm_updated[share_key] = shared_note
+            shared_note.user = users[user_id]
+
+        now = timezone.now()
+        for shared_note in note_perm_updated.values():
+            shared_note.modified_at = now
+        with transaction.atomic():
+            ChangeSequence.stamp([*new_note_shared.values(), *note_perm_updated.values()])
+            NotesUser.objects.bulk_create(new_note_shared.values())
+            NotesUser.objects.bulk_update(note_perm_updated.values(), ['can_read', 'can_edit', 'can_delete', 'is_active',
+                                                                      'is_deleted', 'modified_at', 'change_seq'])
+        acl.invalidate_shares([*new_note_shared, *note_perm_updated])
+        # bulk_create and bulk_update send no post_save signals
+        response_cache.invalidate_notes({notes_id for notes_id, _ in [*new_note_shared, *note_perm_updated]})
 
-            try:
-                shared_note = NotesUser.objects.get(user_id=user_id, notes_id=notes_id)
-                data['modified_by'] = request.user
-                serializer = serializers.NoteShareSerializer(shared_note, data=data, partial=True)
-                if serializer.is_valid():
-                    instance = serializer.save()
-                    note_perm_updated.append(instance)
-                else:
-                    errors_in_data.append(serializer.errors)
-            except NotesUser.DoesNotExist:
-                data['created_by'] = request.user
-                data['modified_by'] = request.user
-                serializer = serializers.NoteShareSerializer(data=data)
-                if serializer.is_valid():
-                    instance = serializer.save()
-                    new_note_shared.append(instance)
-                else:
-                    errors_in_data.append(serializer.errors)
         return_data = {
-            'note_shared': serializers.NoteShareSerializer1(new_note_shared, many=True).data,
-            'note_updated': serializers.NoteShareSerializer1(note_perm_updated, many=True).data,
+            'note_shared': serializers.NoteShareSerializer1(new_note_shared.values(), many=True).data,
+            'note_updated': serializers.NoteShareSerializer1(note_perm_updated.values(), many=True).data,
             'validation_errors': errors_in_data
             }
         return Response({'status': status.HTTP_200_OK, 'detail': "Notes Share Completed.", 'data':return_data}, status=status.HTTP_200_OK)
 
 
+class NotesRoleShareView(APIView):
+    permission_classes = (IsAuthenticated, IsAuthorizedToShare)
+
+    @swagger_auto_schema(
+        request_body=serializers.NoteRoleShareBulkSerializer(many=True),
+        responses={200: serializers.NoteRoleShareReturnSerializer(), 403:gs.Generic403Serializer(), 404:gs.Generic404Serializer()}
+    )
+    def post(self, request):
+        """
+        Share Notes with Every Member of a Role. If already shared with the role then Update the details with new input.
+        A member's permissions are those of their own share and of their role's share combined
+        """
+        new_role_shares = {}
+        updated_role_shares = {}
+        errors_in_data = []
+        valid_data = []
+        for data in request.data:
+            serializer = serializers.NoteRoleShareBulkSerializer(data=data)
+            if serializer.is_valid():
+                valid_data.append(serializer.validated_data)
+            else:
+                errors_in_data.append(serializer.errors)
+
+        role_ids = set(Role.get_active().filter(pk__in={data['role'] for data in valid_data}).values_list('id', flat=True))
+        note_ids = {data['notes'] for data in valid_data}
+        role_shares = {(share.notes_id, share.role_id): share
+                       for share in NotesRole.objects.filter(notes_id__in=note_ids, role_id__in=role_ids)}
+        note_modified_at = dict(Notes.objects.filter(pk__in=note_ids).values_list('id', 'modified_at'))
+
+        for data in valid_data:
+            role_id = data.pop('role')
+            notes_id = data.pop('notes')
+            if role_id not in role_ids:
+                errors_in_data.append({'role': [f'Invalid pk "{role_id}" - object does not exist.']})
+                continue
+
+            share_key = (notes_id, role_id)
+            role_share = role_shares.get(share_key)
+            if role_share is None:
+                role_share = NotesRole(notes_id=notes_id, role_id=role_id, note_modified_at=note_modified_at[notes_id], **data)
+                role_shares[share_key] = new_role_shares[share_key] = role_share
+            else:
+                for key, value in data.items():
+                    setattr(role_share, key, value)
+                if share_key not in new_role_shares:
+                    updated_role_shares[share_key] = role_share
+
+        now = timezone.now()
+        for role_share in updated_role_shares.values():
+            role_share.modified_at = now
+        with transaction.atomic():
+            ChangeSequence.stamp([*new_role_shares.values(), *updated_role_shares.values()])
+            NotesRole.objects.bulk_create(new_role_shares.values())
+            NotesRole.objects.bulk_update(updated_role_shares.values(), ['can_read', 'can_edit', 'can_delete', 'is_active',
+                                                                        'is_deleted', 'modified_at', 'change_seq'])
+        # One share row covers every member, so the cached permissions of the whole note go
+        acl.invalidate_notes({notes_id for notes_id, _ in [*new_role_shares, *updated_role_shares]})
+
+        return_data = {
+            'note_shared': serializers.NoteRoleShareSerializer(new_role_shares.values(), many=True).data,
+            'note_updated': serializers.NoteRoleShareSerializer(updated_role_shares.values(), many=True).data,
+            'validation_errors': errors_in_data
+            }
+        return Response({'status': status.HTTP_200_OK, 'detail': "Notes Share Completed.", 'data':return_data}, status=status.HTTP_200_OK)
+
 
 class NotesHistoryView(APIView):
     permission_classes = (IsAuthenticated, IsAuthorized)
+    pagination_class = NotesHistoryPagination
 
     @swagger_auto_schema(
+        manual_parameters=[NotesHistoryPagination.cursor_parameter, NotesHistoryPagination.page_size_parameter],
         responses={200: serializers.NotesAuditReturnSerializer(), 403:gs.Generic403Serializer(), 404:gs.Generic404Serializer()}
     )
     def get(self, request, note_id):
         """
-        Get Note By Primary Key. Available Only if Note is Shared with User. Includes details of shared users and owner information
+        Get the Version History of a Note, newest change first, paginated with an opaque cursor. Available Only if Note is Shared with User
         """
-        
-        notes_history_queryset = NotesAudit.objects.filter(notes_id=note_id, is_active=True, is_deleted=False)
-        if not notes_history_queryset.exists():
-            try:
-                note_exist = Notes.objects.get(pk=note_id, is_active=True, is_deleted=False)
-            except NotesAudit.DoesNotExist:
-                return Response({'status': status.HTTP_404_NOT_FOUND, 'detail': 'Requested Note Not Found.', 'data':[]}, status=status.HTTP_404_NOT_FOUND)
-            serializer = serializers.NotesAuditSerializer1(note_exist)
+        # The note carries its audit_count, so the history costs this query and one for the page,
+        # which also reads the older rows the page's delta rows are rebuilt from
+        note = serializers.NotesAuditSerializer1.setup_eager_loading(Notes.objects.active()).filter(pk=note_id).first()
+        if note is None:
+            return Response({'status': status.HTTP_404_NOT_FOUND, 'detail': 'Requested Note Not Found.', 'data':[]}, status=status.HTTP_404_NOT_FOUND)
+        paginator = self.pagination_class()
+        if not note.audit_count and paginator.cursor_query_param not in request.query_params:
+            serializer = serializers.NotesAuditSerializer1(note)
             return Response({'status': status.HTTP_200_OK, 'detail': 'Requested Note Does Not Have Any Modifications Found.', 'data':serializer.data}, status=status.HTTP_200_OK)
-        total_changes = notes_history_queryset.count()
-        notes_audit_serializer = serializers.NotesAuditSerializer(notes_history_queryset, many=True)
+
+        notes_history_queryset = serializers.NotesAuditSerializer.setup_eager_loading(NotesAudit.objects.active().filter(notes_id=note_id))
+        history_page = paginator.paginate_queryset(notes_history_queryset, request, view=self)
+        materialize_audits(history_page, context=paginator.lookahead_rows)
         return_data = {
-            'total_changes': total_changes,
-            'changes_history': notes_audit_serializer.data
+            'total_changes': note.audit_count,
+            'changes_history': serializers.NotesAuditSerializer(history_page, many=True).data
         }
-        return Response({'status': status.HTTP_200_OK, 'detail': 'Note History successfully retrieved.', 'data':return_data})
+        return paginator.get_paginated_response(return_data)
+
+
+
+class NotesDiffView(APIView):
+    permission_classes = (IsAuthenticated, IsAuthorized)
+
+    @swagger_auto_schema(
+        manual_parameters=[
+            openapi.Parameter('from', openapi.IN_QUERY, type=openapi.TYPE_INTEGER, required=True,
+                              description='Version to compare from: the id of a version history entry, or 0 for the original content.'),
+            openapi.Parameter('to', openapi.IN_QUERY, type=openapi.TYPE_INTEGER,
+                              description='Version to compare to, like from. The latest version when omitted.'),
+            # Not 'format', which DRF reserves for choosing the renderer
+            openapi.Parameter('diff_format', openapi.IN_QUERY, type=openapi.TYPE_STRING, enum=list(versions.DIFF_FORMATS),
+                              description='unified (default) or structured.'),
+        ],
+        responses={200: serializers.NoteDiffReturnSerializer(), 400:gs.Generic400Serializer(), 403:gs.Generic403Serializer(), 404:gs.Generic404Serializer()}
+    )
+    def get(self, request, note_id):
+        """
+        Diff between Two Versions of a Note. Available Only if Note is Shared with User
+        """
+        diff_format = request.query_params.get('diff_format', 'unified')
+        try:
+            from_id = int(request.query_params['from'])
+            to_id = int(request.query_params['to']) if request.query_params.get('to') else None
+        except (KeyError, ValueError):
+            return Response({'status': status.HTTP_400_BAD_REQUEST, 'detail': 'from (and to) must be version ids.', 'data':[]},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if diff_format not in versions.DIFF_FORMATS:
+            return Response({'status': status.HTTP_400_BAD_REQUEST, 'detail': f"diff_format must be one of {', '.join(versions.DIFF_FORMATS)}.", 'data':[]},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        note = Notes.objects.active().filter(pk=note_id).first()
+        if note is None:
+            return Response({'status': status.HTTP_404_NOT_FOUND, 'detail': 'Requested Note Not Found.', 'data':[]}, status=status.HTTP_404_NOT_FOUND)
+        old = versions.get_version(note, from_id)
+        new = versions.get_latest_version(note) if to_id is None else versions.get_version(note, to_id)
+        if old is None or new is None:
+            return Response({'status': status.HTTP_404_NOT_FOUND, 'detail': 'Requested Version Not Found.', 'data':[]}, status=status.HTTP_404_NOT_FOUND)
+
+        return_data = {
+            'note_id': note.id,
+            'format': diff_format,
+            'from_version': {key: value for key, value in old.items() if key != 'note_content'},
+            'to_version': {key: value for key, value in new.items() if key != 'note_content'},
+            'diff': versions.diff_versions(old, new, diff_format),
+        }
+        return Response({'status': status.HTTP_200_OK, 'detail': 'Success', 'data':return_data})
+
+
+class NotesAsOfView(APIView):
+    permission_classes = (IsAuthenticated, IsAuthorized)
+
+    @swagger_auto_schema(
+        manual_parameters=[
+            openapi.Parameter('at', openapi.IN_QUERY, type=openapi.TYPE_STRING, format=openapi.FORMAT_DATETIME, required=True,
+                              description='ISO 8601 timestamp.'),
+        ],
+        responses={200: serializers.NoteVersionReturnSerializer(), 400:gs.Generic400Serializer(), 403:gs.Generic403Serializer(), 404:gs.Generic404Serializer()}
+    )
+    def get(self, request, note_id):
+        """
+        Content of a Note as it was at a Given Time. Available Only if Note is Shared with User
+        """
+        try:
+            at = fields.DateTimeField().to_internal_value(request.query_params.get('at', ''))
+        except ValidationError as error:
+            return Response({'status': status.HTTP_400_BAD_REQUEST, 'detail': {'at': error.detail}, 'data':[]},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        note = Notes.objects.active().filter(pk=note_id).first()
+        if note is None:
+            return Response({'status': status.HTTP_404_NOT_FOUND, 'detail': 'Requested Note Not Found.', 'data':[]}, status=status.HTTP_404_NOT_FOUND)
+        version = versions.get_version_at(note, at)
+        if version is None:
+            return Response({'status': status.HTTP_404_NOT_FOUND, 'detail': 'The Note Did Not Exist at That Time.', 'data':[]},
+                            status=status.HTTP_404_NOT_FOUND)
+        return Response({'status': status.HTTP_200_OK, 'detail': 'Success', 'data':version})
+
+
+class CacheStatsView(APIView):
+    permission_classes = (IsAuthenticated, )
+
+    @swagger_auto_schema(
+        responses={200: serializers.CacheStatsReturnSerializer(), 401:gs.Generic401Serializer(), 403:gs.Generic403Serializer()}
+    )
+    def get(self, request):
+        """
+        Hit Rates of the Note Caches in the Worker Serving the Request. Only for SuperUser
+        """
+        if not request.user.is_superuser:
+            return Response({'status': status.HTTP_401_UNAUTHORIZED, 'detail': "Only SuperUser Can View Cache Statistics", 'data':[]},
+                            status=status.HTTP_401_UNAUTHORIZED)
+        return Response({'status': status.HTTP_200_OK, 'detail': 'Success', 'data':cache_stats()})
@@ -0,0 +1,257 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+
+MISSING = object()
+
+
+class LRUCacheBackend:
+    """
+    Bounded in-process cache. The least recently used entry is evicted first and
+    every entry expires `timeout` seconds after it was written.
+    """
+    # Only takes an in-process lock; safe to call from the event loop
+    blocking = False
+
+    def __init__(self, max_entries=10000, timeout=300):
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, keys):
+        now = time.monotonic()
+        found = {}
+        with self._lock:
+            for key in keys:
+                item = self._data.get(key)
+                if item is None:
+                    continue
+                expires_at, value = item
+                if expires_at <= now:
+                    del self._data[key]
+                    continue
+                self._data.move_to_end(key)
+                found[key] = value
+        return found
+
+    def set_many(self, mapping):
+        expires_at = time.monotonic() + self.timeout
+        with self._lock:
+            for key, value in mapping.items():
+                self._data[key] = (expires_at, value)
+                self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete_many(self, keys):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class DjangoCacheBackend:
+    """
+    Adapter over one of the caches configured in settings.CACHES.
+    """
+    # Memcached, Redis and database caches do network or disk I/O
+    blocking = True
+
+    def __init__(self, alias='default', timeout=300, key_prefix=''):
+        self.cache = caches[alias]
+        self.timeout = timeout
+        self.key_prefix = key_prefix
+
+    def get_many(self, keys):
+        found = self.cache.get_many([self.key_prefix + key for key in keys])
+        return {key[len(self.key_prefix):]: value for key, value in found.items()}
+
+    def set_many(self, mapping):
+        self.cache.set_many({self.key_prefix + key: value for key, value in mapping.items()}, timeout=self.timeout)
+
+    def delete_many(self, keys):
+        self.cache.delete_many([self.key_prefix + key for key in keys])
+
+    def clear(self):
+        self.cache.clear()
+
+
+class VersionedCache:
+    """
+    Cache whose entries remember the version token of every dependency they were
+    built from. bump() replaces a dependency's token, so every entry built from
+    it stops matching without having to find and delete those entries.
+    """
+
+    def __init__(self, backend, prefix):
+        self.backend = backend
+        self.prefix = prefix
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def _entry_key(self, key):
+        return f'{self.prefix}:{key}'
+
+    def _version_key(self, dependency):
+        return f'{self.prefix}:v:{dependency}'
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def get(self, key, dependencies=None):
+        """
+        Return the cached value for key, or MISSING if it is absent or stale.
+        Without `dependencies` the entry is checked against the dependencies it
+        was stored with, for values whose dependencies are only known once built.
+        """
+        if dependencies is None:
+            return self._lookup_stored(key)
+        value, _ = self._lookup(key, dependencies)
+        return value
+
+    def get_or_set(self, key, default_func, dependencies=()):
+        value, versions = self._lookup(key, dependencies)
+        if value is MISSING:
+            # Tokens are created before the value is built, so a bump while building leaves the entry stale
+            versions = self._ensure_versions(versions)
+            value = default_func()
+            self._store(key, value, versions)
+        return value
+
+    def set(self, key, value, dependencies=(), versions=None):
+        """
+        `versions` are tokens from get_versions() read before the value was
+        built; a bump that happened while building then makes the entry stale.
+        """
+        self._store(key, value, {**self._fetch_versions(dependencies), **(versions or {})})
+
+    def get_versions(self, *dependencies):
+        return self._ensure_versions(self._fetch_versions(dependencies))
+
+    def delete(self, *keys):
+        self.backend.delete_many([self._entry_key(key) for key in keys])
+
+    def bump(self, *dependencies):
+        self.backend.set_many({self._version_key(dependency): uuid.uuid4().hex for dependency in dependencies})
+
+    def clear(self):
+        self.backend.clear()
+        with self._lock:
+            self.hits = self.misses = 0
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hits / total if total else 0.0}
+
+    async def aget(self, key, dependencies=None):
+        return await self._call(self.get, key, dependencies)
+
+    async def aset(self, key, value, dependencies=(), versions=None):
+        return await self._call(self.set, key, value, dependencies, versions)
+
+    async def aget_versions(self, *dependencies):
+        return await self._call(self.get_versions, *dependencies)
+
+    async def _call(self, method, *args):
+        # For async views: a blocking backend is called from a worker thread, not on the event loop
+        if self.backend.blocking:
+            return await sync_to_async(method)(*args)
+        return method(*args)
+
+    def _lookup(self, key, dependencies):
+        version_keys = {dependency: self._version_key(dependency) for dependency in dependencies}
+        entry_key = self._entry_key(key)
+        found = self.backend.get_many([entry_key, *version_keys.values()])
+        versions = {dependency: found.get(version_key) for dependency, version_key in version_keys.items()}
+
+        entry = found.get(entry_key)
+        if entry is not None:
+            value, built_from = entry
+            if all(version is not None and built_from.get(dependency) == version
+                   for dependency, version in versions.items()):
+                self._count(True)
+                return value, versions
+        self._count(False)
+        return MISSING, versions
+
+    def _lookup_stored(self, key):
+        entry = self.backend.get_many([self._entry_key(key)]).get(self._entry_key(key))
+        if entry is not None:
+            value, built_from = entry
+            versions = self._fetch_versions(built_from)
+            if all(version is not None and built_from[dependency] == version for dependency, version in versions.items()):
+                self._count(True)
+                return value
+        self._count(False)
+        return MISSING
+
+    def _fetch_versions(self, dependencies):
+        found = self.backend.get_many([self._version_key(dependency) for dependency in dependencies])
+        return {dependency: found.get(self._version_key(dependency)) for dependency in dependencies}
+
+    def _ensure_versions(self, versions):
+        missing = {dependency: uuid.uuid4().hex for dependency, version in versions.items() if version is None}
+        if missing:
+            self.backend.set_many({self._version_key(dependency): token for dependency, token in missing.items()})
+            versions = {**versions, **missing}
+        return versions
+
+    def _store(self, key, value, versions):
+        self.backend.set_many({self._entry_key(key): (value, self._ensure_versions(versions))})
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_cache(name):
+    """
+    Return the VersionedCache configured under settings.NOTES_CACHES[name].
+    """
+    with _caches_lock:
+        if name not in _caches:
+            config = getattr(settings, 'NOTES_CACHES', {}).get(name, {})
+            timeout = config.get('TIMEOUT', 300)
+            if config.get('BACKEND', 'lru') == 'django':
+                backend = DjangoCacheBackend(config.get('CACHE_ALIAS', 'default'), timeout=timeout)
+            else:
+                backend = LRUCacheBackend(config.get('MAX_ENTRIES', 10000), timeout=timeout)
+            _caches[name] = VersionedCache(backend, prefix=f'notes:{name}')
+        return _caches[name]
+
+
+def clear_caches():
+    with _caches_lock:
+        for cache in _caches.values():
+            cache.clear()
+
+
+def cache_stats():
+    """
+    Hits and misses of every configured cache, counted in this process
+    """
+    return {name: get_cache(name).stats() for name in getattr(settings, 'NOTES_CACHES', {})}
+
+
+@receiver(setting_changed)
+def reset_caches(setting, **kwargs):
+    if setting in ('NOTES_CACHES', 'CACHES'):
+        with _caches_lock:
+            _caches.clear()
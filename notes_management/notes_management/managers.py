@@ -0,0 +1,19 @@
+from django.contrib.auth.models import UserManager
+from django.db import models
+
+
+class SoftDeleteQuerySet(models.QuerySet):
+    def active(self):
+        """
+        Rows that are active and not soft deleted. Matches the condition of the
+        partial indexes on the AuditModel tables, so lookups can use them.
+        """
+        return self.filter(is_active=True, is_deleted=False)
+
+
+class SoftDeleteManager(models.Manager.from_queryset(SoftDeleteQuerySet)):
+    pass
+
+
+class SoftDeleteUserManager(UserManager.from_queryset(SoftDeleteQuerySet)):
+    pass
@@ -0,0 +1,261 @@
+import json
+import logging
+import os
+import random
+import time
+import uuid
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from rest_framework.exceptions import APIException
+
+from . import profiling, timing
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_REQUEST_TIMING = {
+    'SAMPLE_RATE': 0.0,
+    'HEADER': True,
+    'LOG': True,
+}
+
+DEFAULT_REQUEST_PROFILING = {
+    'ENABLED': False,
+    'HEADER': 'X-Profile',
+    'SAMPLE_RATE': 0.0,
+    'PROFILER': 'cprofile',
+    'INTERVAL': 0.001,
+    'DIRECTORY': 'profiles',
+}
+
+
+def get_request_timing_settings():
+    return {**DEFAULT_REQUEST_TIMING, **getattr(settings, 'NOTES_REQUEST_TIMING', {})}
+
+
+def get_request_profiling_settings():
+    return {**DEFAULT_REQUEST_PROFILING, **getattr(settings, 'NOTES_REQUEST_PROFILING', {})}
+
+
+class RequestTimingMiddleware:
+    """
+    Measures a sample of requests: SQL queries (count and time), the view, the
+    serializers and rendering, reported as a Server-Timing header and one JSON
+    log line tagged with the URL name. The view time includes the query and
+    serializer time spent inside it. Not loaded at all when SAMPLE_RATE is 0.
+    Runs async under ASGI, where the queries are timed in the thread the ORM
+    calls of the request run in.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        options = get_request_timing_settings()
+        self.sample_rate = options['SAMPLE_RATE']
+        if self.sample_rate <= 0:
+            raise MiddlewareNotUsed
+        self.header = options['HEADER']
+        self.log = options['LOG']
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.sampled():
+            return self.get_response(request)
+
+        timings, token = timing.start()
+        request._timings = timings
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                self.wrap_queries(stack)
+                response = self.get_response(request)
+        finally:
+            timing.stop(token)
+        self.finish(request, response, timings, started)
+        return response
+
+    async def __acall__(self, request):
+        if not self.sampled():
+            return await self.get_response(request)
+
+        timings, token = timing.start()
+        request._timings = timings
+        started = time.perf_counter()
+        # The database connections belong to the thread the ORM calls of the request are sent to
+        stack = ExitStack()
+        try:
+            await sync_to_async(self.wrap_queries)(stack)
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+            timing.stop(token)
+        self.finish(request, response, timings, started)
+        return response
+
+    def sampled(self):
+        return self.sample_rate >= 1 or random.random() < self.sample_rate
+
+    def wrap_queries(self, stack):
+        for alias in connections:
+            stack.enter_context(connections[alias].execute_wrapper(self.time_query))
+
+    def finish(self, request, response, timings, started):
+        total = time.perf_counter() - started
+        if hasattr(request, '_view_started') and 'view' not in timings.durations:
+            # No render step: the view ran until the response came back
+            timings.add('view', time.perf_counter() - request._view_started)
+        self.report(request, response, timings, total)
+
+    def time_query(self, execute, sql, params, many, context):
+        timings = timing.current()
+        if timings is None:
+            return execute(sql, params, many, context)
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            timings.add('db', time.perf_counter() - started)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if hasattr(request, '_timings'):
+            request._view_started = time.perf_counter()
+
+    def process_template_response(self, request, response):
+        timings = getattr(request, '_timings', None)
+        if timings is not None and hasattr(request, '_view_started'):
+            render_started = time.perf_counter()
+            timings.add('view', render_started - request._view_started)
+            response.add_post_render_callback(lambda _: timings.add('render', time.perf_counter() - render_started))
+        return response
+
+    def report(self, request, response, timings, total):
+        match = request.resolver_match
+        url_name = match.url_name if match else None
+        durations = {name: round(duration * 1000, 3) for name, duration in timings.durations.items()}
+
+        if self.header:
+            metrics = [f'{name};dur={duration}' for name, duration in durations.items()]
+            metrics.append(f'total;dur={round(total * 1000, 3)}')
+            if 'db' in durations:
+                metrics[list(durations).index('db')] += f';desc="{timings.counts["db"]} queries"'
+            if url_name:
+                metrics.append(f'route;desc="{url_name}"')
+            response.headers['Server-Timing'] = ', '.join(metrics)
+
+        if self.log:
+            record = {
+                'url_name': url_name,
+                'method': request.method,
+                'path': request.path,
+                'status': response.status_code,
+                'total_ms': round(total * 1000, 3),
+                'queries': timings.counts.get('db', 0),
+                **{f'{name}_ms': duration for name, duration in durations.items()},
+            }
+            logger.info(json.dumps(record), extra={'request_timing': record})
+
+
+class RequestProfilingMiddleware:
+    """
+    Profiles a request when it carries the HEADER and a superuser's token, or
+    when it is picked by SAMPLE_RATE. Every profile is saved as
+    DIRECTORY/<url name>/<request id>.<extension> and appended to
+    DIRECTORY/index.jsonl; the response gets an X-Profile-Id header. Not loaded
+    at all unless ENABLED. Runs async under ASGI; the profilers follow the
+    thread they are started in, the event loop, so the work of sync views and
+    ORM calls run in worker threads is not in those profiles.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        options = get_request_profiling_settings()
+        if not options['ENABLED']:
+            raise MiddlewareNotUsed
+        self.options = options
+        self.profiler_class = profiling.PROFILERS[options['PROFILER']]
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.should_profile(request):
+            return self.get_response(request)
+
+        request_id = uuid.uuid4().hex
+        profiler = self.profiler_class(self.options)
+        started = time.perf_counter()
+        profiler.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            profiler.stop()
+        elapsed = time.perf_counter() - started
+
+        self.save(request, response, profiler, request_id, elapsed)
+        response.headers['X-Profile-Id'] = request_id
+        return response
+
+    async def __acall__(self, request):
+        # Authenticating the header may query the database, and saving writes files
+        if not await sync_to_async(self.should_profile)(request):
+            return await self.get_response(request)
+
+        request_id = uuid.uuid4().hex
+        profiler = self.profiler_class(self.options)
+        started = time.perf_counter()
+        profiler.start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            profiler.stop()
+        elapsed = time.perf_counter() - started
+
+        await sync_to_async(self.save)(request, response, profiler, request_id, elapsed)
+        response.headers['X-Profile-Id'] = request_id
+        return response
+
+    def should_profile(self, request):
+        if request.headers.get(self.options['HEADER']):
+            # Imported here: the authentication module needs the app registry
+            from user_app.authentication import CachedJWTAuthentication
+
+            try:
+                user_auth = CachedJWTAuthentication().authenticate(request)
+            except APIException:
+                return False
+            return user_auth is not None and user_auth[0].is_superuser
+        sample_rate = self.options['SAMPLE_RATE']
+        return sample_rate > 0 and random.random() < sample_rate
+
+    def save(self, request, response, profiler, request_id, elapsed):
+        match = request.resolver_match
+        url_name = (match.url_name if match else None) or 'unresolved'
+        directory = os.path.join(self.options['DIRECTORY'], url_name)
+        os.makedirs(directory, exist_ok=True)
+        path_prefix = os.path.join(directory, request_id)
+        profiler.save(path_prefix)
+
+        record = {
+            'request_id': request_id,
+            'client_request_id': request.headers.get('X-Request-ID'),
+            'url_name': url_name,
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'duration_ms': round(elapsed * 1000, 3),
+            'profiler': self.options['PROFILER'],
+            'files': [f'{path_prefix}.{extension}' for extension in profiler.extensions],
+        }
+        with open(os.path.join(self.options['DIRECTORY'], 'index.jsonl'), 'a') as index_file:
+            index_file.write(json.dumps(record) + '\n')
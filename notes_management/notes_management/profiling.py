@@ -0,0 +1,88 @@
+"""
+Profilers for RequestProfilingMiddleware. Both write collapsed stacks
+("frame;frame;frame samples" per line), the input of flamegraph.pl, speedscope
+and similar tools; cProfile also writes a pstats file.
+"""
+import cProfile
+import os
+import sys
+import threading
+from collections import Counter
+
+
+def frame_label(filename, line, name):
+    return f'{name} ({os.path.basename(filename)}:{line})'.replace(';', ':')
+
+
+def write_collapsed(path, stacks):
+    with open(path, 'w') as collapsed_file:
+        for stack, samples in sorted(stacks.items()):
+            collapsed_file.write(f"{';'.join(stack)} {samples}\n")
+
+
+class SamplingProfiler:
+    """
+    Records the stack of the profiled thread every INTERVAL seconds from a
+    background thread. Cheap enough for a high sample rate, but statistical:
+    short requests get few samples. Writes collapsed stacks in sample counts.
+    """
+    extensions = ('collapsed', )
+
+    def __init__(self, options):
+        self.interval = options['INTERVAL']
+        self.stacks = Counter()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._sample, args=(threading.get_ident(), ), daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+
+    def save(self, path_prefix):
+        write_collapsed(f'{path_prefix}.collapsed', self.stacks)
+
+    def _sample(self, thread_id):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(frame_label(code.co_filename, code.co_firstlineno, code.co_name))
+                frame = frame.f_back
+            if stack:
+                self.stacks[tuple(reversed(stack))] += 1
+
+
+class CProfileProfiler:
+    """
+    Deterministic profile written as pstats. cProfile merges recursive calls
+    and keeps no whole stacks, so the collapsed stacks come from a
+    SamplingProfiler running alongside it.
+    """
+    extensions = ('pstats', 'collapsed')
+
+    def __init__(self, options):
+        self.profile = cProfile.Profile()
+        self.sampler = SamplingProfiler(options)
+
+    def start(self):
+        self.sampler.start()
+        self.profile.enable()
+
+    def stop(self):
+        self.profile.disable()
+        self.sampler.stop()
+
+    def save(self, path_prefix):
+        self.profile.dump_stats(f'{path_prefix}.pstats')
+        self.sampler.save(path_prefix)
+
+
+PROFILERS = {
+    'cprofile': CProfileProfiler,
+    'sampling': SamplingProfiler,
+}
@@ -1,5 +1,36 @@
 from rest_framework import serializers
 
+from .timing import timer
+
+
+class EagerLoadingMixin:
+    """
+    Serializers declare the relations they render; views call setup_eager_loading
+    on their queryset so nested serializers never query per row.
+    """
+    select_related_fields = ()
+    prefetch_related_fields = ()
+
+    @classmethod
+    def setup_eager_loading(cls, queryset):
+        if cls.select_related_fields:
+            queryset = queryset.select_related(*cls.select_related_fields)
+        if cls.prefetch_related_fields:
+            queryset = queryset.prefetch_related(*cls.prefetch_related_fields)
+        return queryset
+
+
+class TimedSerializerMixin:
+    """
+    Counts the time spent rendering objects towards the request's 'serialize'
+    timing, see RequestTimingMiddleware.
+    """
+
+    def to_representation(self, instance):
+        with timer('serialize'):
+            return super().to_representation(instance)
+
+
 class Generic403Serializer(serializers.Serializer):
     detail = serializers.CharField(max_length=50, default="Authentication credentials were not provided.")
 
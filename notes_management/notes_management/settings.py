@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
+import tempfile
 from pathlib import Path
 from datetime import timedelta
 
@@ -46,6 +47,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'notes_management.middleware.RequestProfilingMiddleware',
+    'notes_management.middleware.RequestTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -147,11 +150,120 @@ AUTH_USER_MODEL = "user_app.User"
 # For JWT Authentication
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'user_app.authentication.CachedJWTAuthentication',
     ),
 }
 
 
+# Shared by every worker process on the host, so an invalidation made by one
+# worker is seen by all of them. With several hosts, point it at Redis or
+# memcached instead.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'notes': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': str(Path(tempfile.gettempdir()) / 'notes_management_cache'),
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+}
+
+# Caches for hot lookups. BACKEND is 'django' (uses the CACHES entry named by
+# CACHE_ALIAS) or 'lru' (in-process, bounded by MAX_ENTRIES). 'lru' is only
+# correct with a single worker process: invalidations (bump) only reach the
+# process that made them, so other workers keep serving stale entries until
+# TIMEOUT. TIMEOUT is in seconds.
+NOTES_CACHES = {
+    'acl': {
+        'BACKEND': 'django',
+        'CACHE_ALIAS': 'notes',
+        'TIMEOUT': 300,
+    },
+    'responses': {
+        'BACKEND': 'django',
+        'CACHE_ALIAS': 'notes',
+        'TIMEOUT': 300,
+    },
+    # Authenticated users; saving or deleting a user or its role invalidates them
+    'users': {
+        'BACKEND': 'django',
+        'CACHE_ALIAS': 'notes',
+        'TIMEOUT': 60,
+    },
+    # Note versions rebuilt from the history; deactivating an audit row invalidates them
+    'versions': {
+        'BACKEND': 'django',
+        'CACHE_ALIAS': 'notes',
+        'TIMEOUT': 3600,
+    },
+}
+
+
+# Version history storage. 'full' keeps the old and new content on every
+# NotesAudit row. 'delta' keeps a full keyframe every
+# NOTES_AUDIT_KEYFRAME_INTERVAL rows and compact text deltas in between.
+NOTES_AUDIT_STORAGE = 'delta'
+NOTES_AUDIT_KEYFRAME_INTERVAL = 20
+
+# How audit rows are written. 'sync' inserts them in the request. 'batched'
+# queues them after the transaction commits; a background thread writes up to
+# BATCH_SIZE rows per INSERT and drains the queue on shutdown. Requests wait
+# up to ENQUEUE_TIMEOUT seconds when MAX_PENDING changes are queued, then write
+# their rows themselves. Failed batches are retried RETRIES times.
+NOTES_AUDIT_WRITER = {
+    'MODE': 'sync',
+    'BATCH_SIZE': 500,
+    'MAX_PENDING': 10000,
+    'RETRIES': 3,
+    'ENQUEUE_TIMEOUT': 5,
+}
+
+
+# Server-Timing headers and a JSON log line (logger 'notes_management.middleware',
+# level INFO) with query, view, serializer and render times for SAMPLE_RATE of
+# the requests. At 0 the middleware is not loaded.
+NOTES_REQUEST_TIMING = {
+    'SAMPLE_RATE': 1.0 if DEBUG else 0.0,
+    'HEADER': True,
+    'LOG': True,
+}
+
+# Sends the request timing lines to the console; without it they are below the
+# default WARNING level and dropped.
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'notes_management.middleware': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
+
+
+# Profiles of single requests, for requests sent with the HEADER by a superuser
+# and for SAMPLE_RATE of all requests. PROFILER is 'cprofile' (pstats and
+# collapsed stacks) or 'sampling' (collapsed stacks, a sample every INTERVAL
+# seconds). Profiles are written under DIRECTORY. When not ENABLED the
+# middleware is not loaded.
+NOTES_REQUEST_PROFILING = {
+    'ENABLED': False,
+    'HEADER': 'X-Profile',
+    'SAMPLE_RATE': 0.0,
+    'PROFILER': 'cprofile',
+    'INTERVAL': 0.001,
+    'DIRECTORY': BASE_DIR / 'profiles',
+}
+
+
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=240),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
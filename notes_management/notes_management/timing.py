@@ -0,0 +1,69 @@
+"""
+Per-request timing buckets filled by RequestTimingMiddleware. Code anywhere in
+a request can add to a bucket with `timer(name)` or `@timed(name)`; outside of a
+sampled request both are a single context variable lookup.
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+
+_current = ContextVar('request_timings', default=None)
+
+
+class RequestTimings:
+    def __init__(self):
+        self.durations = {}
+        self.counts = {}
+        self._active = set()
+
+    def add(self, name, duration, count=1):
+        self.durations[name] = self.durations.get(name, 0.0) + duration
+        self.counts[name] = self.counts.get(name, 0) + count
+
+
+def start():
+    """
+    Collect timings for the current request until stop(token)
+    """
+    timings = RequestTimings()
+    return timings, _current.set(timings)
+
+
+def stop(token):
+    _current.reset(token)
+
+
+def current():
+    return _current.get()
+
+
+@contextmanager
+def timer(name):
+    """
+    Add the time spent in the block to the `name` bucket. Nested blocks of the
+    same name (a serializer rendering another one) are only counted once.
+    """
+    timings = _current.get()
+    if timings is None or name in timings._active:
+        yield
+        return
+
+    timings._active.add(name)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings._active.discard(name)
+        timings.add(name, time.perf_counter() - started)
+
+
+def timed(name):
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with timer(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,118 @@
+import copy
+
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from notes_management.cache import MISSING, get_cache
+
+
+def _users_cache():
+    return get_cache('users')
+
+
+def _user_dependency(user_id):
+    return f'user:{user_id}'
+
+
+def _role_dependency(role_id):
+    return f'role:{role_id}'
+
+
+def invalidate_user(user_id):
+    """
+    Make the next request with a token of this user load the user again
+    """
+    _users_cache().bump(_user_dependency(user_id))
+
+
+def invalidate_role(role_id):
+    _users_cache().bump(_role_dependency(role_id))
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication resolving the user (with its role joined) through a short
+    lived cache keyed by the token's user id instead of a query per request.
+    Entries depend on the user and its role, see invalidate_user/invalidate_role;
+    user_app.signals calls them whenever either is saved or deleted.
+    Deactivated and soft deleted users are rejected.
+    """
+
+    def get_user(self, validated_token):
+        user_id = self.get_user_id(validated_token)
+        cache, key = _users_cache(), str(user_id)
+        user = cache.get(key)
+        if user is MISSING:
+            # Read before the user so that a change racing with the query leaves the entry stale
+            versions = cache.get_versions(_user_dependency(user_id))
+            user = self.store_user(cache, key, self.get_user_queryset(user_id).first(), versions)
+        return self.check_user(user, validated_token)
+
+    def get_user_id(self, validated_token):
+        try:
+            return validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+    def get_user_queryset(self, user_id):
+        return self.user_model.objects.select_related('role').filter(**{api_settings.USER_ID_FIELD: user_id})
+
+    def store_user(self, cache, key, user, versions):
+        if user is not None:
+            cache.set(key, user, dependencies=self.user_dependencies(user), versions=versions)
+        return user
+
+    def user_dependencies(self, user):
+        dependencies = [_user_dependency(user.pk)]
+        if user.role_id:
+            dependencies.append(_role_dependency(user.role_id))
+        return dependencies
+
+    def check_user(self, user, validated_token):
+        if user is None:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+
+        if not user.is_active or user.is_deleted:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+
+        # The in-process cache hands out the same instance to every request
+        return copy.copy(user)
+
+
+class AsyncJWTAuthentication(CachedJWTAuthentication):
+    """
+    CachedJWTAuthentication for async views. Token parsing and validation are CPU
+    only; a cache miss is read with the async ORM instead of a blocking query,
+    and a blocking cache backend is called through a worker thread.
+    """
+
+    async def aauthenticate(self, request):
+        header = self.get_header(request)
+        if header is None:
+            return None
+
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+
+        validated_token = self.get_validated_token(raw_token)
+
+        return await self.aget_user(validated_token), validated_token
+
+    async def aget_user(self, validated_token):
+        user_id = self.get_user_id(validated_token)
+        cache, key = _users_cache(), str(user_id)
+        user = await cache.aget(key)
+        if user is MISSING:
+            versions = await cache.aget_versions(_user_dependency(user_id))
+            user = await self.get_user_queryset(user_id).afirst()
+            if user is not None:
+                await cache.aset(key, user, self.user_dependencies(user), versions)
+        return self.check_user(user, validated_token)
@@ -0,0 +1,82 @@
+"""
+Read-only fast paths producing the same JSON as RoleSerializer and
+UserSerializerLite from .values() rows. DRF builds a field tree and calls
+to_representation per field of every object; these build the dicts directly and
+build every user and role only once per Memo, however often it is repeated.
+"""
+from rest_framework import serializers
+
+from notes_management.timing import timed
+from .models import User
+
+
+ROLE_FIELDS = ('id', 'created_at', 'modified_at', 'is_active', 'is_deleted', 'name', 'description')
+
+_datetime_field = serializers.DateTimeField()
+
+
+def datetime_representation(value):
+    # Same formatting and timezone handling as the serializers' DateTimeField
+    return None if value is None else _datetime_field.to_representation(value)
+
+
+def role_representation(row, prefix=''):
+    return {
+        'id': row[prefix + 'id'],
+        'created_at': datetime_representation(row[prefix + 'created_at']),
+        'modified_at': datetime_representation(row[prefix + 'modified_at']),
+        'is_active': row[prefix + 'is_active'],
+        'is_deleted': row[prefix + 'is_deleted'],
+        'name': row[prefix + 'name'],
+        'description': row[prefix + 'description'],
+    }
+
+
+@timed('serialize')
+def serialize_roles(queryset):
+    """
+    RoleSerializer(queryset, many=True).data
+    """
+    return [role_representation(row) for row in queryset.values(*ROLE_FIELDS)]
+
+
+class Memo:
+    """
+    Users and roles already serialized while building one response
+    """
+
+    def __init__(self):
+        self.users = {}
+        self.roles = {}
+
+    def load_users(self, user_ids):
+        """
+        Serialize the users not seen yet, with their roles, in one query
+        """
+        missing = set(user_ids) - self.users.keys()
+        if not missing:
+            return
+        role_fields = tuple('role__' + field for field in ROLE_FIELDS)
+        for row in User.objects.filter(id__in=missing).values('id', 'username', 'email', 'role_id', *role_fields):
+            role = None
+            if row['role_id'] is not None:
+                role = self.roles.get(row['role_id'])
+                if role is None:
+                    role = self.roles[row['role_id']] = role_representation(row, prefix='role__')
+            self.users[row['id']] = {'username': row['username'], 'email': row['email'], 'role': role}
+
+    def user(self, user_id):
+        """
+        UserSerializerLite(user).data of a user passed to load_users before
+        """
+        return self.users[user_id]
+
+
+@timed('serialize')
+def serialize_users_lite(user_ids, memo=None):
+    """
+    UserSerializerLite(users, many=True).data for the users with these ids, in that order
+    """
+    memo = memo or Memo()
+    memo.load_users(user_ids)
+    return [memo.user(user_id) for user_id in user_ids]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.10 on 2026-10-18 15:03
+
+from django.db import migrations, models
+import notes_management.managers
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user_app', '0002_role_is_active_role_is_deleted_user_is_deleted'),
+    ]
+
+    operations = [
+        migrations.AlterModelManagers(
+            name='user',
+            managers=[
+                ('objects', notes_management.managers.SoftDeleteUserManager()),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='role',
+            index=models.Index(condition=models.Q(('is_active', True), ('is_deleted', False)), fields=['id'], name='role_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(condition=models.Q(('is_active', True), ('is_deleted', False)), fields=['id'], name='user_active_idx'),
+        ),
+    ]
@@ -2,6 +2,8 @@ from django.db import models
 from django.contrib.auth.models import AbstractUser
 from django.utils.translation import gettext_lazy as _
 from django.core.exceptions import ValidationError
+from django.db.models import Q
+from notes_management.managers import SoftDeleteManager, SoftDeleteUserManager
 # Create your models here.
 
 
@@ -14,19 +16,29 @@ class AuditModel(models.Model):
     is_active = models.BooleanField(default=True)
     is_deleted = models.BooleanField(default=False)
 
+    objects = SoftDeleteManager()
+
     class Meta:
         abstract = True
 
 
+# Condition of the partial indexes on the soft-deletable tables
+ACTIVE_CONDITION = Q(is_active=True, is_deleted=False)
+
 
 class Role(AuditModel):
     name = models.CharField(max_length=20, null=False, unique=True,
                             error_messages={"unique": _("A Role with that name already exists."),})
     description = models.TextField(null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['id'], condition=ACTIVE_CONDITION, name='role_active_idx'),
+        ]
+
     @classmethod
     def get_active(self):
-        active_objects = Role.objects.filter(is_active=True, is_deleted=False)
+        active_objects = Role.objects.active()
         return active_objects
 
 
@@ -37,6 +49,14 @@ class User(AbstractUser, AuditModel):
     # created_at = models.DateTimeField(auto_now_add=True)
     # modified_at = models.DateTimeField(auto_now=True)
 
+    objects = SoftDeleteUserManager()
+
+    class Meta(AbstractUser.Meta):
+        swappable = "AUTH_USER_MODEL"
+        indexes = [
+            models.Index(fields=['id'], condition=ACTIVE_CONDITION, name='user_active_idx'),
+        ]
+
 
     def clean(self):
         super().clean()
@@ -47,7 +67,7 @@ class User(AbstractUser, AuditModel):
         
     @classmethod
     def get_active(self):
-        active_objects = User.objects.filter(is_active=True, is_deleted=False)
+        active_objects = User.objects.active()
         return active_objects
 
     
\ No newline at end of file
@@ -2,9 +2,10 @@ from rest_framework import serializers
 from .models import Role, User
 from django.db.models import Q
 from rest_framework.exceptions import NotFound
+from notes_management.serializers import EagerLoadingMixin, TimedSerializerMixin
 
 
-class RoleSerializer(serializers.ModelSerializer):
+class RoleSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Role
         fields = "__all__"
@@ -29,7 +30,7 @@ class RoleReturnSerializer(serializers.Serializer):
     data = RoleSerializer(many=True)
 
 
-class UserSerializerCreate(serializers.ModelSerializer):
+class UserSerializerCreate(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ("username", "email", "password", "role")
@@ -58,24 +59,24 @@ class UserSerializerCreate(serializers.ModelSerializer):
         return instance
 
 
-class UserSerializerLite(serializers.ModelSerializer):
+class UserSerializerLite(TimedSerializerMixin, EagerLoadingMixin, serializers.ModelSerializer):
+    select_related_fields = ('role',)
+
     role = RoleSerializer(read_only=True)
     class Meta:
         model = User
         fields = ("username", "email", "role")
 
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(TimedSerializerMixin, EagerLoadingMixin, serializers.ModelSerializer):
+    select_related_fields = ('role',)
+    prefetch_related_fields = ('groups', 'user_permissions')
+
     role = RoleSerializer(read_only=True)
     class Meta:
         model = User
         fields = "__all__"
         extra_kwargs = {'password': {'write_only': True}}
-    
-    @staticmethod
-    def setup_eager_loading(queryset):
-        queryset = queryset.select_related('role')
-        return queryset
 
 
 class UserReturnSerializer(serializers.Serializer):
@@ -1,14 +1,22 @@
-from django.test import TestCase
+import json
+from django.test import TestCase, override_settings
 from rest_framework.test import APITestCase, APIClient
 from django.urls import reverse
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from rest_framework_simplejwt.tokens import RefreshToken, Token, AccessToken
 import pdb
 
+from notes_management.cache import clear_caches
+from . import authentication, fast_serializers, serializers
 from .models import User, Role
 
 # Create your tests here.
+# Timed requests log a line each
+@override_settings(NOTES_REQUEST_TIMING={'SAMPLE_RATE': 0.0})
 class TestSetup(APITestCase):
     def setUp(self):
+        clear_caches()
         user_object = User.objects.create(username='testuser001', password='testpassword', email='testmail001@mail.com', is_superuser=True)
         self.refresh = AccessToken.for_user(user_object)
         # self.api_client = APIClient()
@@ -212,3 +220,64 @@ class TestGetUserDetails(TestSetup):
         res = self.client.delete(reverse('get_put_delete_user', kwargs={'pk': new_user.id}))
         # pdb.set_trace()
         self.assertEqual(res.data['status'], 200)
+
+
+class TestCachedAuthentication(TestSetup):
+    def setUp(self):
+        super().setUp()
+        self.user_object = User.objects.get(username='testuser001')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.refresh}')
+
+    def test_user_resolved_from_cache(self):
+        self.client.get(reverse('get_put_delete_user', kwargs={'pk': self.user_object.id}))
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get(reverse('get_put_delete_user', kwargs={'pk': self.user_object.id}))
+        self.assertEqual(res.data['status'], 200)
+        self.assertFalse([query for query in queries if 'FROM "user_app_user"' in query['sql'] and '"user_app_role"' in query['sql']])
+
+    def test_deleted_user_rejected(self):
+        self.client.get(reverse('get_put_delete_user', kwargs={'pk': self.user_object.id}))
+        res = self.client.delete(reverse('get_put_delete_user', kwargs={'pk': self.user_object.id}))
+        self.assertEqual(res.data['status'], 200)
+        res = self.client.get(reverse('get_user'))
+        self.assertEqual(res.status_code, 401)
+
+    def test_role_change_reloads_user(self):
+        role = Role.objects.create(name='TestRole009')
+        self.user_object.role = role
+        self.user_object.save()
+        self.client.get(reverse('get_user'))
+
+        User.objects.filter(pk=self.user_object.id).update(is_active=False)
+        role.name = 'TestRole010'
+        role.save()
+        res = self.client.get(reverse('get_user'))
+        self.assertEqual(res.status_code, 401)
+
+    def test_deactivated_outside_views_rejected(self):
+        self.client.get(reverse('get_user'))
+        self.user_object.is_active = False
+        self.user_object.save()
+        res = self.client.get(reverse('get_user'))
+        self.assertEqual(res.status_code, 401)
+
+    def test_login_keeps_cached_user(self):
+        self.client.get(reverse('get_put_delete_user', kwargs={'pk': self.user_object.id}))
+        self.user_object.save(update_fields=['last_login'])
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get(reverse('get_put_delete_user', kwargs={'pk': self.user_object.id}))
+        self.assertEqual(res.status_code, 200)
+        self.assertFalse([query for query in queries if 'FROM "user_app_user"' in query['sql'] and '"user_app_role"' in query['sql']])
+
+
+class TestFastSerializers(TestSetup):
+    def test_roles_and_users_match(self):
+        Role.objects.create(name='TestRole012', description='Role with description')
+        role = Role.objects.create(name='TestRole013')
+        User.objects.create(username='testuser013', email='testmail013@mail.com', role=role)
+        self.assertEqual(json.dumps(fast_serializers.serialize_roles(Role.objects.order_by('id'))),
+                         json.dumps(serializers.RoleSerializer(Role.objects.order_by('id'), many=True).data))
+
+        users = list(User.objects.order_by('id'))
+        self.assertEqual(json.dumps(fast_serializers.serialize_users_lite([user.id for user in users])),
+                         json.dumps(serializers.UserSerializerLite(users, many=True).data))
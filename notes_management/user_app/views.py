@@ -6,7 +6,7 @@ from rest_framework import status
 from drf_yasg.utils import swagger_auto_schema
 
 from .models import Role, User
-from . import serializers
+from . import fast_serializers, serializers
 from notes_management import serializers as gs
 # Create your views here.
 
@@ -20,10 +20,9 @@ class RoleView(APIView):
         """
         Get All Roles
         """
-        roles_queryset = Role.get_active()
-        if roles_queryset.exists():
-            serialized_data = serializers.RoleSerializer(roles_queryset, many=True)
-            return Response({'status': status.HTTP_200_OK, 'detail': 'Success', 'data':serialized_data.data})
+        serialized_data = fast_serializers.serialize_roles(Role.get_active())
+        if serialized_data:
+            return Response({'status': status.HTTP_200_OK, 'detail': 'Success', 'data':serialized_data})
         else:
             return Response({'status': status.HTTP_404_NOT_FOUND, 'detail': 'Roles Not Found. Please Create a Role', 'data':[]},
                             status=status.HTTP_404_NOT_FOUND)
@@ -58,7 +57,7 @@ class SingleRoleView(APIView):
         Get Role By Primary Key
         """
         try:
-            role_queryset = Role.objects.get(pk=pk, is_active=True, is_deleted=False)
+            role_queryset = Role.objects.active().get(pk=pk)
         except Role.DoesNotExist:
             return Response({'status': status.HTTP_404_NOT_FOUND, 'detail': 'Requested Role Not Found.', 'data':[]}, status=status.HTTP_404_NOT_FOUND)
         role_serializer = serializers.RoleSerializer(role_queryset)
@@ -73,7 +72,7 @@ class SingleRoleView(APIView):
         Update Role By Primary Key
         """
         try:
-            role_queryset = Role.objects.get(pk=pk, is_active=True, is_deleted=False)
+            role_queryset = Role.objects.active().get(pk=pk)
         except Role.DoesNotExist:
             return Response({'status': status.HTTP_404_NOT_FOUND, 'detail': 'Requested Role Not Found.', 'data':[]}, status=status.HTTP_404_NOT_FOUND)
         if not request.user.is_superuser:
@@ -92,7 +91,7 @@ class SingleRoleView(APIView):
         Soft Delete Role By Primary Key
         """
         try:
-            role_queryset = Role.objects.get(pk=pk, is_active=True, is_deleted=False)
+            role_queryset = Role.objects.active().get(pk=pk)
         except Role.DoesNotExist:
             return Response({'status': status.HTTP_404_NOT_FOUND, 'detail': 'Requested Role Not Found.', 'data':[]}, status=status.HTTP_404_NOT_FOUND)
         if not request.user.is_superuser:
@@ -153,7 +152,7 @@ class SingleUserView(APIView):
         Get User By Primary Key
         """
         try:
-            user_queryset = User.objects.get(pk=pk, is_active=True, is_deleted=False)
+            user_queryset = User.objects.active().get(pk=pk)
         except User.DoesNotExist:
             return Response({'status': status.HTTP_404_NOT_FOUND, 'detail': 'Requested User Not Found.', 'data':[]}, status=status.HTTP_404_NOT_FOUND)
         user_serializer = serializers.UserSerializer(user_queryset)
@@ -168,7 +167,7 @@ class SingleUserView(APIView):
         Update User By Primary Key
         """
         try:
-            user_queryset = User.objects.get(pk=pk, is_active=True, is_deleted=False)
+            user_queryset = User.objects.active().get(pk=pk)
         except User.DoesNotExist:
             return Response({'status': status.HTTP_404_NOT_FOUND, 'detail': 'Requested User Not Found.', 'data':[]}, status=status.HTTP_404_NOT_FOUND)
 
@@ -188,7 +187,7 @@ class SingleUserView(APIView):
         Soft Delete User By Primary Key
         """
         try:
-            user_queryset = User.objects.get(pk=pk, is_active=True, is_deleted=False)
+            user_queryset = User.objects.active().get(pk=pk)
         except User.DoesNotExist:
             return Response({'status': status.HTTP_404_NOT_FOUND, 'detail': 'Requested User Not Found.', 'data':[]}, status=status.HTTP_404_NOT_FOUND)
         if request.user.id != pk: